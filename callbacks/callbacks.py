@@ -0,0 +1,149 @@
+import base64
+import logging
+from datetime import date
+from enum import IntEnum
+from typing import Any, Callable, Dict, Optional
+
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+from lexicon.lexicon import LEXICON
+
+
+logger = logging.getLogger(__name__)
+
+# Меняется при несовместимом изменении формата; кнопки старых версий считаются устаревшими
+VERSION = 1
+
+# Telegram ограничивает callback_data 64 байтами
+MAX_CALLBACK_DATA = 64
+
+
+class Action(IntEnum):
+    """Типы кнопок. Значения попадают в callback_data, поэтому их нельзя переиспользовать."""
+    IGNORE = 0
+    DOCTOR = 1
+    CALENDAR_DAY = 2
+    CALENDAR_SHIFT = 3
+    TIMESLOT = 4
+    APPOINTMENT = 5
+    APPOINTMENTS_PREV = 6
+    APPOINTMENTS_NEXT = 7
+    CANCEL = 8
+    CONFIRM_CANCEL = 9
+    RESCHEDULE = 10
+    BACK_TO_APPOINTMENTS = 11
+    WAITLIST = 12
+    WAITLIST_BOOK = 13
+
+
+# Типы полей каждого действия: int или date (передается как ordinal)
+FIELDS: dict[Action, tuple[type, ...]] = {
+    Action.IGNORE: (),
+    Action.DOCTOR: (int,),
+    Action.CALENDAR_DAY: (date,),
+    Action.CALENDAR_SHIFT: (int,),
+    Action.TIMESLOT: (int,),
+    Action.APPOINTMENT: (int,),
+    Action.APPOINTMENTS_PREV: (date, int),
+    Action.APPOINTMENTS_NEXT: (date, int),
+    Action.CANCEL: (int,),
+    Action.CONFIRM_CANCEL: (),
+    Action.RESCHEDULE: (int,),
+    Action.BACK_TO_APPOINTMENTS: (),
+    Action.WAITLIST: (date,),
+    Action.WAITLIST_BOOK: (int, date),
+}
+
+
+def _write_varint(value: int, out: bytearray) -> None:
+    if value < 0:
+        raise ValueError(f"Callback values must be non-negative, got: {value}")
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode(action: Action, *values: Any) -> str:
+    """Упаковывает действие и его поля: версия, действие и поля varint'ами в base64url без паддинга."""
+    fields = FIELDS[action]
+    if len(values) != len(fields):
+        raise ValueError(f"{action.name} expects {len(fields)} values, got {len(values)}")
+
+    out = bytearray((VERSION, action))
+    for field_type, value in zip(fields, values):
+        _write_varint(value.toordinal() if field_type is date else int(value), out)
+
+    data = base64.urlsafe_b64encode(bytes(out)).rstrip(b"=").decode()
+    if len(data) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data for {action.name} is {len(data)} bytes long")
+    return data
+
+
+def decode(data: str) -> Optional[tuple[Action, tuple]]:
+    """Обратная операция к encode; None для кнопок другой версии и мусора."""
+    try:
+        raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+        if len(raw) < 2 or raw[0] != VERSION:
+            return None
+        action = Action(raw[1])
+        pos = 2
+        values = []
+        for field_type in FIELDS[action]:
+            value, pos = _read_varint(raw, pos)
+            values.append(date.fromordinal(value) if field_type is date else value)
+    except (ValueError, IndexError):
+        return None
+    return action, tuple(values)
+
+
+class CallbackDispatcher:
+    """Таблица (действие, состояние FSM) -> хендлер вместо цепочки фильтров startswith.
+
+    Хендлер получает callback, поля кнопки по порядку и те же данные, что обычные хендлеры aiogram
+    (state, user_pk, ...). Хендлер без состояний вызывается в любом состоянии.
+    """
+
+    def __init__(self):
+        self.handlers: Dict[tuple[Action, Optional[str]], CallableObject] = {}
+
+    def register(self, action: Action, *states: State) -> Callable:
+        def decorator(handler: Callable) -> Callable:
+            for state in states or (None,):
+                key = (action, state.state if state is not None else None)
+                if key in self.handlers:
+                    raise ValueError(f"Handler for {action.name} in state {key[1]} already registered")
+                self.handlers[key] = CallableObject(handler)
+            return handler
+        return decorator
+
+    async def dispatch(self, callback: CallbackQuery, data: Dict[str, Any]) -> Any:
+        decoded = decode(callback.data or "")
+        if decoded is None:
+            logger.debug("Outdated callback data %r", callback.data)
+            await callback.answer(LEXICON["callback_outdated"], show_alert=True)
+            return
+
+        action, values = decoded
+        handler = self.handlers.get((action, data.get("raw_state"))) or self.handlers.get((action, None))
+        if handler is None:
+            # Кнопка из другого шага диалога или «пустая» кнопка календаря
+            await callback.answer()
+            return
+
+        if "handler_label" in data:
+            data["handler_label"][0] = handler.callback.__name__
+        return await handler.call(callback, *values, **data)
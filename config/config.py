@@ -13,24 +13,123 @@ class DBSettings:
     DB_HOST: str
     DB_PORT: int
     DB_NAME: str
+    DB_ECHO: bool
+    DB_POOL_SIZE: int
+    DB_MAX_OVERFLOW: int
+    DB_POOL_TIMEOUT: float
+    DB_POOL_RECYCLE: int
+    DB_POOL_PRE_PING: bool
+    DB_QUERY_CACHE_SIZE: int
+    DB_STATEMENT_CACHE_SIZE: int
+    DB_STATEMENT_TIMEOUT: int
+
+    @property
+    def url(self) -> str:
+        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
 
 @dataclass
 class BotSettings:
     token: str
     admin_ids: list[int]
+    mode: str
+    page_size: int
+    startup_cache: str
+    api_url: str
+
+@dataclass
+class AccessSettings:
+    allowed_ids: frozenset[int]
+    rate_limit: float
+    rate_burst: int
+    role_cache_ttl: int
+
 
 @dataclass
 class LoggSettings:
     level: str
     format: str
+    json: bool
+
+
+@dataclass
+class StorageSettings:
+    type: str
+    redis_url: str
+
+
+@dataclass
+class DedupSettings:
+    size: int
+    ttl: int
+    shared: bool
+
+
+@dataclass
+class WorkerSettings:
+    count: int
+    queue_name: str
+    max_concurrency: int
+
+
+@dataclass
+class WebhookSettings:
+    base_url: str
+    path: str
+    host: str
+    port: int
+    secret: str
+    max_concurrency: int
+
+
+@dataclass
+class ReminderSettings:
+    enabled: bool
+    lead_hours: int
+    scan_interval: int
+    batch_size: int
+    rate_limit: float
+    max_retries: int
+
+
+@dataclass
+class WaitlistSettings:
+    hold_minutes: int
+    sweep_interval: int
+
+
+@dataclass
+class DegradedSettings:
+    enabled: bool
+    refresh_interval: int
+    horizon_days: int
+    read_timeout: float
+    failure_threshold: int
+    journal_path: str
+
+
+@dataclass
+class MetricsSettings:
+    enabled: bool
+    host: str
+    port: int
+    log_interval: int
 
 
 @dataclass
 class Config:
     bot: BotSettings
-    db: str
+    db: DBSettings
     log: LoggSettings
+    access: AccessSettings
+    storage: StorageSettings
+    dedup: DedupSettings
+    workers: WorkerSettings
+    webhook: WebhookSettings
+    reminders: ReminderSettings
+    metrics: MetricsSettings
+    waitlist: WaitlistSettings
+    degraded: DegradedSettings
 
 
 def load_config(path: str | None = None) -> Config:
@@ -56,25 +155,150 @@ def load_config(path: str | None = None) -> Config:
     except ValueError as e:
         raise ValueError(f"ADMIN_IDS must be integers, got: {raw_ids}") from e
 
+    raw_allowed_ids = env.list("ALLOWED_IDS", default=[])
+
+    try:
+        allowed_ids = frozenset(int(x) for x in raw_allowed_ids)
+    except ValueError as e:
+        raise ValueError(f"ALLOWED_IDS must be integers, got: {raw_allowed_ids}") from e
+
+    access = AccessSettings(
+        allowed_ids=allowed_ids,
+        rate_limit=env.float("RATE_LIMIT", default=1.0),
+        rate_burst=env.int("RATE_BURST", default=5),
+        role_cache_ttl=env.int("ROLE_CACHE_TTL", default=300),
+    )
+
+    mode = env("BOT_MODE", default="polling")
+
+    if mode not in ("polling", "webhook"):
+        raise ValueError(f"BOT_MODE must be 'polling' or 'webhook', got: {mode}")
+
     db = DBSettings(
         DB_USER=env("DB_USER"),
         DB_PASS=env("DB_PASS"),
         DB_HOST=env("DB_HOST"),
         DB_PORT=env.int("DB_PORT"),
         DB_NAME=env("DB_NAME"),
+        DB_ECHO=env.bool("DB_ECHO", default=False),
+        DB_POOL_SIZE=env.int("DB_POOL_SIZE", default=10),
+        DB_MAX_OVERFLOW=env.int("DB_MAX_OVERFLOW", default=10),
+        DB_POOL_TIMEOUT=env.float("DB_POOL_TIMEOUT", default=10.0),
+        DB_POOL_RECYCLE=env.int("DB_POOL_RECYCLE", default=1800),
+        DB_POOL_PRE_PING=env.bool("DB_POOL_PRE_PING", default=True),
+        DB_QUERY_CACHE_SIZE=env.int("DB_QUERY_CACHE_SIZE", default=500),
+        DB_STATEMENT_CACHE_SIZE=env.int("DB_STATEMENT_CACHE_SIZE", default=256),
+        DB_STATEMENT_TIMEOUT=env.int("DB_STATEMENT_TIMEOUT", default=5000),
     )
 
     logg_settings = LoggSettings(
         level=env("LOG_LEVEL"),
-        format=env("LOG_FORMAT")
+        format=env("LOG_FORMAT"),
+        json=env.bool("LOG_JSON", default=False),
+    )
+
+    storage = StorageSettings(
+        type=env("FSM_STORAGE", default="memory"),
+        redis_url=env("REDIS_URL", default="redis://localhost:6379/0"),
+    )
+
+    if storage.type not in ("memory", "redis"):
+        raise ValueError(f"FSM_STORAGE must be 'memory' or 'redis', got: {storage.type}")
+
+    dedup = DedupSettings(
+        size=env.int("UPDATE_DEDUP_SIZE", default=10_000),
+        ttl=env.int("UPDATE_DEDUP_TTL", default=3600),
+        shared=env.bool("UPDATE_DEDUP_SHARED", default=False),
+    )
+
+    if dedup.shared and storage.type != "redis":
+        raise ValueError("UPDATE_DEDUP_SHARED requires FSM_STORAGE=redis")
+
+    workers = WorkerSettings(
+        count=env.int("WORKERS", default=1),
+        queue_name=env("UPDATES_QUEUE", default="updates"),
+        max_concurrency=env.int("WORKER_MAX_CONCURRENCY", default=100),
+    )
+
+    if workers.count > 1 and storage.type != "redis":
+        raise ValueError("WORKERS > 1 requires FSM_STORAGE=redis")
+
+    webhook = WebhookSettings(
+        base_url=env("WEBHOOK_BASE_URL", default=""),
+        path=env("WEBHOOK_PATH", default="/webhook"),
+        host=env("WEBHOOK_HOST", default="0.0.0.0"),
+        port=env.int("WEBHOOK_PORT", default=8080),
+        secret=env("WEBHOOK_SECRET", default=""),
+        max_concurrency=env.int("WEBHOOK_MAX_CONCURRENCY", default=100),
+    )
+
+    if mode == "webhook":
+        if not webhook.base_url:
+            raise ValueError("WEBHOOK_BASE_URL must not be empty in webhook mode")
+        if workers.count > 1:
+            raise ValueError("WORKERS > 1 is supported only with BOT_MODE=polling")
+
+    reminders = ReminderSettings(
+        enabled=env.bool("REMINDERS_ENABLED", default=True),
+        lead_hours=env.int("REMINDER_LEAD_HOURS", default=24),
+        scan_interval=env.int("REMINDER_SCAN_INTERVAL", default=60),
+        batch_size=env.int("REMINDER_BATCH_SIZE", default=500),
+        rate_limit=env.float("REMINDER_RATE_LIMIT", default=25.0),
+        max_retries=env.int("REMINDER_MAX_RETRIES", default=5),
+    )
+
+    metrics = MetricsSettings(
+        enabled=env.bool("METRICS_ENABLED", default=False),
+        host=env("METRICS_HOST", default="127.0.0.1"),
+        port=env.int("METRICS_PORT", default=9100),
+        log_interval=env.int("METRICS_LOG_INTERVAL", default=300),
+    )
+
+    waitlist = WaitlistSettings(
+        hold_minutes=env.int("WAITLIST_HOLD_MINUTES", default=15),
+        sweep_interval=env.int("WAITLIST_SWEEP_INTERVAL", default=30),
     )
 
+    degraded = DegradedSettings(
+        enabled=env.bool("DEGRADED_MODE_ENABLED", default=False),
+        refresh_interval=env.int("REPLICA_REFRESH_INTERVAL", default=60),
+        horizon_days=env.int("REPLICA_HORIZON_DAYS", default=62),
+        read_timeout=env.float("REPLICA_READ_TIMEOUT", default=2.0),
+        failure_threshold=env.int("DEGRADED_FAILURE_THRESHOLD", default=3),
+        journal_path=env("BOOKING_JOURNAL_PATH", default=""),
+    )
+
+    if degraded.enabled and not degraded.journal_path:
+        raise ValueError("DEGRADED_MODE_ENABLED requires BOOKING_JOURNAL_PATH")
+
     logger.info("Configuration loaded successfully")
 
     return Config(
-        bot=BotSettings(token=token, admin_ids=admin_ids),
-        db=f"postgresql+asyncpg://{db.DB_USER}:{db.DB_PASS}@{db.DB_HOST}:{db.DB_PORT}/{db.DB_NAME}",
-        log=logg_settings
+        bot=BotSettings(token=token, admin_ids=admin_ids, mode=mode,
+                        page_size=env.int("APPOINTMENTS_PAGE_SIZE", default=10),
+                        startup_cache=env("STARTUP_CACHE_PATH", default=".startup_cache.json"),
+                        api_url=env("BOT_API_URL", default="")),
+        db=db,
+        log=logg_settings,
+        access=access,
+        storage=storage,
+        dedup=dedup,
+        workers=workers,
+        webhook=webhook,
+        reminders=reminders,
+        metrics=metrics,
+        waitlist=waitlist,
+        degraded=degraded,
     )
 
-settings = load_config()
+
+_settings: Config | None = None
+
+
+def get_settings() -> Config:
+    """Конфигурация приложения; .env читается при первом обращении, а не при импорте модуля."""
+    global _settings
+    if _settings is None:
+        _settings = load_config()
+    return _settings
+
@@ -1,74 +1,426 @@
-from datetime import datetime, date
+import asyncio
+import logging
+import re
+import time as perf_time
+from datetime import datetime, date, time, timedelta
 
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy.orm import declarative_base, joinedload
-from sqlalchemy import select, delete
-from typing import Optional, List
-from .models.models import User, Appointment, Timeslot
-from config.config import settings
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy import event, select, delete, update, exists, literal, Row, func, cast, extract, and_, or_, tuple_, Date, DateTime
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError, IntegrityError, TimeoutError as PoolTimeoutError
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, List, TypeVar
+from .models.models import User, Appointment, Timeslot, DayOff, Doctor, WaitlistEntry
+from .cache import TTLCache
+from .pool import InstrumentedPool, pool_stats
+from .replica import BookingJournal, ScheduleReplica
+from config.config import get_settings, DBSettings
+from metrics.metrics import collectors, db_query_latency
 
 
-engine = create_async_engine(settings.db, echo=True)
-async_session = async_sessionmaker(engine, expire_on_commit=False)
-Base = declarative_base()
+logger = logging.getLogger(__name__)
+
+# На сегодня нельзя записаться на слот, до начала которого осталось меньше часа
+BOOKING_LEAD = timedelta(hours=1)
+
+def create_engine(db_settings: DBSettings) -> AsyncEngine:
+    return create_async_engine(
+        db_settings.url,
+        echo=db_settings.DB_ECHO,
+        poolclass=InstrumentedPool,
+        pool_size=db_settings.DB_POOL_SIZE,
+        max_overflow=db_settings.DB_MAX_OVERFLOW,
+        pool_timeout=db_settings.DB_POOL_TIMEOUT,
+        pool_recycle=db_settings.DB_POOL_RECYCLE,
+        pool_pre_ping=db_settings.DB_POOL_PRE_PING,
+        query_cache_size=db_settings.DB_QUERY_CACHE_SIZE,
+        connect_args={
+            "prepared_statement_cache_size": db_settings.DB_STATEMENT_CACHE_SIZE,
+            "server_settings": {"statement_timeout": str(db_settings.DB_STATEMENT_TIMEOUT)},
+        },
+    )
+
+
+def get_pool_stats() -> dict[str, float]:
+    pool = get_engine().pool
+    return {
+        "size": pool.size(),
+        "in_use": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checkouts": pool_stats.checkouts,
+        "wait_avg": pool_stats.wait_total / pool_stats.checkouts if pool_stats.checkouts else 0.0,
+        "wait_max": pool_stats.wait_max,
+    }
+
+
+def _query_template(statement: str) -> str:
+    # Параметры уже вынесены в $n, поэтому текст запроса и есть шаблон
+    return re.sub(r"\s+", " ", statement).strip()[:200]
+
+
+def instrument_engine(async_engine: AsyncEngine) -> None:
+    """Замеряет время и число выполнений каждого шаблона SQL-запроса."""
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Время начала хранится в контексте выполнения: он живет один запрос, и после ошибки
+        # ничего не остается на соединении
+        context._query_start = perf_time.perf_counter()
+
+    @event.listens_for(async_engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        db_query_latency.observe(_query_template(statement), perf_time.perf_counter() - context._query_start)
+
+
+def collect_db_metrics() -> dict[str, float]:
+    metrics = {f"bot_db_pool_{name}": value for name, value in get_pool_stats().items()}
+    for name, cache in (("timeslots", timeslots_cache), ("booked", booked_cache),
+                        ("days_off", days_off_cache), ("doctors", doctors_cache)):
+        metrics[f"bot_cache_{name}_hits"] = cache.hits
+        metrics[f"bot_cache_{name}_misses"] = cache.misses
+    replica_age = replica.age()
+    if replica_age is not None:
+        metrics["bot_replica_age_seconds"] = replica_age
+    metrics["bot_replica_degraded"] = int(replica.degraded)
+    return metrics
+
+
+# Движок создается при первом запросе или явно через init_db, а не при импорте модуля
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker[AsyncSession]] = None
+
+
+def init_db(db_settings: DBSettings, instrument: bool = False) -> AsyncEngine:
+    global _engine, _session_factory
+    _engine = create_engine(db_settings)
+    if instrument:
+        instrument_engine(_engine)
+    _session_factory = async_sessionmaker(_engine, expire_on_commit=False)
+    return _engine
+
+
+def get_engine() -> AsyncEngine:
+    if _engine is None:
+        settings = get_settings()
+        init_db(settings.db, instrument=settings.metrics.enabled)
+    return _engine
+
+
+def async_session() -> AsyncSession:
+    if _session_factory is None:
+        get_engine()
+    return _session_factory()
+
+
+async def close_db() -> None:
+    if _engine is not None:
+        await _engine.dispose()
+
+# Шаблоны слотов почти не меняются, занятые слоты меняются только через функции записи ниже.
+# Ключи — (doctor_pk, weekday) и (doctor_pk, date)
+timeslots_cache = TTLCache(maxsize=7 * 100, ttl=600)
+booked_cache = TTLCache(maxsize=4096, ttl=30)
+days_off_cache = TTLCache(maxsize=1, ttl=600)
+doctors_cache = TTLCache(maxsize=1, ttl=600)
+
+collectors.append(collect_db_metrics)
+
+# Копия расписания на случай недоступности БД и журнал записей, принятых в это время (см. degraded.DegradedMode)
+replica = ScheduleReplica()
+booking_journal: Optional[BookingJournal] = None
+
+# SQLSTATE потери связи с сервером: класс 08, остановка и перезапуск сервера, исчерпан лимит соединений
+UNAVAILABLE_SQLSTATES = ("08", "57P01", "57P02", "57P03", "53300")
+
+T = TypeVar("T")
+
+# Вызываются при переходе на копию расписания: DegradedMode сразу начинает проверять восстановление БД
+degraded_hooks: List[Callable[[], None]] = []
+
+
+def is_db_unavailable(error: BaseException) -> bool:
+    """Ошибка связи с БД (нет соединения, пул исчерпан, таймаут), а не ошибка самого запроса или данных."""
+    # asyncio.TimeoutError и ошибки сокета — подклассы OSError
+    if isinstance(error, (PoolTimeoutError, OSError)):
+        return True
+    if isinstance(error, DBAPIError):
+        if error.connection_invalidated:
+            return True
+        error = error.orig
+    sqlstate = getattr(error, "sqlstate", None) or ""
+    return sqlstate.startswith(UNAVAILABLE_SQLSTATES)
+
+
+def init_booking_journal(path: str) -> BookingJournal:
+    global booking_journal
+    booking_journal = BookingJournal(path)
+    return booking_journal
+
+
+def report_db_failure(error: BaseException) -> None:
+    """Учитывает сбой связи с БД; после failure_threshold сбоев подряд включает работу по копии расписания."""
+    replica.failures += 1
+    if replica.failures >= get_settings().degraded.failure_threshold:
+        enter_degraded_mode(error)
+
+
+def enter_degraded_mode(error: BaseException) -> None:
+    if replica.degraded_since is None:
+        replica.degraded_since = perf_time.monotonic()
+        logger.warning("Database unavailable, switching to local schedule replica: %r", error)
+        for hook in degraded_hooks:
+            hook()
+
+
+async def _read_with_replica(query: Callable[[], Awaitable[T]], fallback: Callable[[], Optional[T]]) -> T:
+    """Читает из БД, а если она недоступна или не уложилась в таймаут — из копии расписания.
+
+    Одиночный сбой обслуживается копией только для этого запроса, недоступной БД считается после
+    нескольких сбоев подряд (report_db_failure). Пока БД считается недоступной, копия отвечает сразу,
+    без ожидания таймаутов. Вернуть БД в строй может только успешное обновление копии
+    (refresh_replica). fallback возвращает None, если ответа в копии нет, — тогда остается только БД.
+    """
+    if not replica.ready:
+        return await query()
+
+    if replica.degraded:
+        result = fallback()
+        if result is not None:
+            return result
+
+    try:
+        result = await asyncio.wait_for(query(), get_settings().degraded.read_timeout)
+    except Exception as e:
+        if not is_db_unavailable(e):
+            raise
+        report_db_failure(e)
+        result = fallback()
+        if result is None:
+            raise
+        return result
+    replica.failures = 0
+    return result
+
+
+# Обработчики освобождения слота (doctor_pk, appointment_date, timeslot_pk), вызываются после отмены и переноса
+slot_freed_hooks: List[Callable[[int, date, int], Awaitable[None]]] = []
+
+
+async def notify_slot_freed(doctor_pk: int, appointment_date: date, timeslot_pk: int) -> None:
+    for hook in slot_freed_hooks:
+        try:
+            await hook(doctor_pk, appointment_date, timeslot_pk)
+        except Exception:
+            logger.exception("Slot freed hook %s failed", hook)
+
+
+# Канал NOTIFY, по которому CLI расписания сообщает процессам бота, что кэши расписания устарели
+SCHEDULE_CHANNEL = "schedule_changed"
+# Раз в столько секунд слушающее соединение проверяется, после обрыва через столько же переподключается
+SCHEDULE_LISTEN_CHECK_INTERVAL = 30
+
+
+def clear_schedule_caches() -> None:
+    for cache in (timeslots_cache, booked_cache, days_off_cache, doctors_cache):
+        cache.clear()
+
+
+async def notify_schedule_changed(session: AsyncSession) -> None:
+    """Сообщает процессам бота об изменении расписания; уведомление уходит при коммите транзакции session."""
+    await session.execute(select(func.pg_notify(SCHEDULE_CHANNEL, "")))
+
+
+async def listen_schedule_changes() -> None:
+    """Сбрасывает кэши расписания по уведомлениям notify_schedule_changed.
+
+    Держит одно соединение из пула под LISTEN. После переподключения кэши тоже сбрасываются:
+    уведомления, пришедшие без соединения, потеряны.
+    """
+    while True:
+        try:
+            async with get_engine().connect() as conn:
+                driver = (await conn.get_raw_connection()).driver_connection
+
+                def on_notify(*_: Any) -> None:
+                    clear_schedule_caches()
+
+                await driver.add_listener(SCHEDULE_CHANNEL, on_notify)
+                try:
+                    clear_schedule_caches()
+                    logger.info("Listening for schedule changes")
+                    while True:
+                        await asyncio.sleep(SCHEDULE_LISTEN_CHECK_INTERVAL)
+                        await driver.execute("SELECT 1")
+                finally:
+                    # Соединение возвращается в пул и не должно продолжать слушать канал
+                    if not driver.is_closed():
+                        await driver.remove_listener(SCHEDULE_CHANNEL, on_notify)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Schedule change listener failed, reconnecting in %d s: %s", SCHEDULE_LISTEN_CHECK_INTERVAL, e)
+        await asyncio.sleep(SCHEDULE_LISTEN_CHECK_INTERVAL)
+
+
+def invalidate_booked(doctor_pk: int, *dates: date) -> None:
+    for booked_date in dates:
+        if isinstance(booked_date, datetime):
+            booked_date = booked_date.date()
+        booked_cache.invalidate((doctor_pk, booked_date))
+
 
 async def get_or_create_user(telegram_id: int) -> User:
     async with async_session() as session:
         stmt = select(User).where(User.telegram_id == telegram_id)
         result = await session.execute(stmt)
         user = result.scalar_one_or_none()
-        print(user)
 
         if user is None:
-            print("User НЕ найден в базе")
+            logger.debug("User %s not found, creating", telegram_id)
             user = User(telegram_id=telegram_id)
             session.add(user)
             try:
                 await session.commit()
                 await session.refresh(user)
-                print("User created")
-            except Exception as e:
+                logger.debug("User %s created", telegram_id)
+            except Exception:
                 await session.rollback()
-                print("Ошибка при commit:", e)
+                logger.exception("Failed to create user %s", telegram_id)
                 raise
         return user
 
-async def get_available_timeslots(selected_date: datetime) -> List[Timeslot]:
-    print("Выбрана дата: " + selected_date.strftime("%d-%m-%Y"))
+async def get_admin_telegram_ids() -> set[int]:
     async with async_session() as session:
-        weekday = selected_date.weekday()
-        result = await session.execute(
-            select(Timeslot)
-            .where(Timeslot.weekday == weekday))
-        all_timeslots = list(result.scalars().all())
-        print(all_timeslots)
+        result = await session.execute(select(User.telegram_id).where(User.is_admin.is_(True)))
+        return set(result.scalars().all())
 
-        if not all_timeslots:
-            print("Не получил таймслотов вообще")
-            return []
+async def is_admin(telegram_id: int) -> bool:
+    async with async_session() as session:
+        result = await session.execute(select(User.is_admin).where(User.telegram_id == telegram_id))
+        return bool(result.scalar_one_or_none())
 
-        booked_stmt = select(Appointment.timeslot_pk).where(Appointment.appointment_date == selected_date)
-        booked_result = await session.execute(booked_stmt)
-        booked_timeslot_ids = booked_result.scalars().all()
+async def get_days_off(doctor_pk: int) -> frozenset[date]:
+    """Предстоящие нерабочие дни врача: дни всей клиники и его собственные."""
+    days_off = days_off_cache.get("days_off")
+    if days_off is None:
+        # Все предстоящие нерабочие дни одним запросом, по врачам; None — дни всей клиники
+        days_off = {}
+        async with async_session() as session:
+            result = await session.execute(select(DayOff.doctor_pk, DayOff.day).where(DayOff.day >= date.today()))
+            for day_doctor_pk, day in result.all():
+                days_off.setdefault(day_doctor_pk, set()).add(day)
+        days_off = {key: frozenset(days) for key, days in days_off.items()}
+        days_off_cache.set("days_off", days_off)
+    return days_off.get(None, frozenset()) | days_off.get(doctor_pk, frozenset())
 
-        # Фильтруем только свободные слоты
-        available_timeslots = [slot for slot in all_timeslots if slot.id not in booked_timeslot_ids]
+async def get_doctors() -> List[Row]:
+    """Активные врачи (id, name, specialty)."""
+    return await _read_with_replica(_get_doctors, lambda: replica.doctors or None)
 
-        print("Отфильтрованные таймслоты:")
-        for slot in available_timeslots:
-            print(slot)
+async def _get_doctors() -> List[Row]:
+    doctors = doctors_cache.get("doctors")
+    if doctors is None:
+        async with async_session() as session:
+            result = await session.execute(
+                select(Doctor.id, Doctor.name, Doctor.specialty)
+                .where(Doctor.is_active.is_(True))
+                .order_by(Doctor.name)
+            )
+            doctors = result.all()
+        doctors_cache.set("doctors", doctors)
+    return doctors
 
-        return available_timeslots
+async def get_available_timeslots(doctor_pk: int, selected_date: datetime) -> List[Timeslot]:
+    return await _read_with_replica(lambda: _get_available_timeslots(doctor_pk, selected_date),
+                                    lambda: replica.available_timeslots(doctor_pk, selected_date.date()))
+
+async def _get_available_timeslots(doctor_pk: int, selected_date: datetime) -> List[Timeslot]:
+    logger.debug("Available timeslots requested for doctor %s on %s", doctor_pk, selected_date)
+    weekday = selected_date.weekday()
+
+    if selected_date.date() in await get_days_off(doctor_pk):
+        return []
+
+    all_timeslots = timeslots_cache.get((doctor_pk, weekday))
+    if all_timeslots is None:
+        async with async_session() as session:
+            result = await session.execute(
+                select(Timeslot)
+                .where(Timeslot.doctor_pk == doctor_pk, Timeslot.weekday == weekday, Timeslot.is_active.is_(True))
+                .order_by(Timeslot.start_time))
+            all_timeslots = list(result.scalars().all())
+        timeslots_cache.set((doctor_pk, weekday), all_timeslots)
+
+    if not all_timeslots:
+        logger.debug("No timeslots configured for doctor %s on weekday %s", doctor_pk, weekday)
+        return []
+
+    booked_timeslot_ids = booked_cache.get((doctor_pk, selected_date.date()))
+    if booked_timeslot_ids is None:
+        async with async_session() as session:
+            # Слоты, закрепленные за подписчиками листа ожидания, тоже считаются занятыми
+            booked_stmt = select(Appointment.timeslot_pk).where(
+                Appointment.doctor_pk == doctor_pk, Appointment.appointment_date == selected_date.date()
+            ).union(select(WaitlistEntry.offer_timeslot_pk).where(
+                WaitlistEntry.doctor_pk == doctor_pk, WaitlistEntry.wait_date == selected_date.date(),
+                WaitlistEntry.offer_expires_at > func.now()
+            ))
+            booked_result = await session.execute(booked_stmt)
+            booked_timeslot_ids = frozenset(booked_result.scalars().all())
+        booked_cache.set((doctor_pk, selected_date.date()), booked_timeslot_ids)
+
+    # Фильтруем только свободные слоты
+    available_timeslots = [slot for slot in all_timeslots if slot.id not in booked_timeslot_ids]
+
+    logger.debug("%d of %d timeslots available", len(available_timeslots), len(all_timeslots))
+
+    return available_timeslots
+
+async def get_month_availability(doctor_pk: int, first_day: date, last_day: date) -> dict[date, int]:
+    """Количество свободных слотов врача по каждой дате периода одним запросом.
+
+    Свободные считаются так же, как в get_timeslots_kb: без слотов, закрепленных за листом ожидания,
+    и без сегодняшних, до начала которых меньше BOOKING_LEAD. Полностью занятые дни попадают
+    в результат с нулем, на них можно встать в лист ожидания. Выходные и нерабочие дни в результат не попадают.
+    """
+    now = datetime.now()
+    return await _read_with_replica(lambda: _get_month_availability(doctor_pk, first_day, last_day, now),
+                                    lambda: replica.month_availability(doctor_pk, first_day, last_day, now, BOOKING_LEAD))
+
+async def _get_month_availability(doctor_pk: int, first_day: date, last_day: date, now: datetime) -> dict[date, int]:
+    days = func.generate_series(
+        cast(datetime.combine(first_day, datetime.min.time()), DateTime),
+        cast(datetime.combine(last_day, datetime.min.time()), DateTime),
+        timedelta(days=1),
+    ).table_valued("day").render_derived(name="days")
+    day = cast(days.c.day, Date)
+    held = exists().where(WaitlistEntry.offer_timeslot_pk == Timeslot.id, WaitlistEntry.wait_date == day,
+                          WaitlistEntry.offer_expires_at > func.now())
+    too_late = and_(day == now.date(), day + Timeslot.start_time <= now + BOOKING_LEAD)
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(day, func.count(Timeslot.id).filter(Appointment.id.is_(None), ~held, ~too_late))
+            .select_from(days)
+            .join(Timeslot, and_(Timeslot.doctor_pk == doctor_pk, Timeslot.is_active.is_(True),
+                                 Timeslot.weekday == extract("isodow", days.c.day) - 1))
+            .outerjoin(Appointment, and_(Appointment.timeslot_pk == Timeslot.id,
+                                         Appointment.appointment_date == day))
+            .where(~exists().where(DayOff.day == day,
+                                   or_(DayOff.doctor_pk.is_(None), DayOff.doctor_pk == doctor_pk)))
+            .group_by(day)
+        )
+        return {appointment_date: free for appointment_date, free in result.all()}
 
 async def get_timeslot_by_id(timeslot_id: int) -> Timeslot:
+    return await _read_with_replica(lambda: _get_timeslot_by_id(timeslot_id),
+                                    lambda: replica.timeslots_by_id.get(timeslot_id))
+
+async def _get_timeslot_by_id(timeslot_id: int) -> Timeslot:
     async with async_session() as session:
         timeslot = await session.execute(
             select(Timeslot)
             .where(Timeslot.id == timeslot_id))
-        if timeslot:
-            print("Получил таймслот")
-        else:
-            print("Не получил таймслот")
         return timeslot.scalar_one_or_none()
 
 async def is_timeslot_available(appointment_date: date, timeslot_pk) -> bool:
@@ -78,14 +430,14 @@ async def is_timeslot_available(appointment_date: date, timeslot_pk) -> bool:
                 Appointment.timeslot_pk == timeslot_pk
             )
         )
-        print("Функция is_timeslot_available выполнилась")
         appointment = result.scalar_one_or_none()
         return appointment is None
 
-async def get_timeslot(weekday: int, start_time: str) -> Timeslot | None:
+async def get_timeslot(doctor_pk: int, weekday: int, start_time: time) -> Timeslot | None:
     async with async_session() as session:
         result = await session.execute(
             select(Timeslot).where(
+                Timeslot.doctor_pk == doctor_pk,
                 Timeslot.weekday == weekday,
                 Timeslot.start_time == start_time
             )
@@ -97,9 +449,127 @@ async def create_appointment(appointment: Appointment) -> Appointment:
         session.add(appointment)
         await session.commit()
         await session.refresh(appointment)
-        print("Appointment создан и возвращается обратно: " + appointment.__str__())
+        invalidate_booked(appointment.doctor_pk, appointment.appointment_date)
+        logger.debug("Appointment %s created", appointment.id)
         return appointment
 
+async def upsert_user(telegram_id: int) -> int:
+    """Возвращает pk пользователя, создавая его при первом обращении, за один запрос."""
+    async with async_session() as session, session.begin():
+        result = await session.execute(
+            insert(User)
+            .values(telegram_id=telegram_id)
+            .on_conflict_do_update(index_elements=[User.telegram_id], set_={"telegram_id": telegram_id})
+            .returning(User.id)
+        )
+        return result.scalar_one()
+
+@dataclass
+class PendingBooking:
+    """Запись, принятая в журнал, пока БД недоступна. Поля — как у строки book_appointment, id еще нет."""
+    appointment_date: date
+    start_time: time
+    doctor_pk: int
+    doctor_name: str
+    id: Optional[int] = None
+
+async def book_appointment(user_pk: int, appointment_date: date, timeslot_pk: int,
+                           user_data: str) -> Optional[Row | PendingBooking]:
+    """Записывает пользователя на слот одним запросом.
+
+    Возвращает строку (id, appointment_date, start_time, doctor_pk, doctor_name) или None, если слот уже занят.
+    Гонку между параллельными записями разрешает уникальный индекс (appointment_date, timeslot_pk).
+    Повторная запись пользователя на его же слот (двойное нажатие, повторная доставка апдейта)
+    возвращает существующую запись, а не None.
+    Если БД недоступна, а журнал включен, запись проверяется по копии расписания, попадает
+    в журнал и возвращается как PendingBooking.
+    """
+    if booking_journal is not None and replica.degraded and replica.covers(appointment_date):
+        return _journal_booking(user_pk, appointment_date, timeslot_pk, user_data)
+    try:
+        return await _insert_appointment(user_pk, appointment_date, timeslot_pk, user_data)
+    except Exception as e:
+        if not is_db_unavailable(e) or booking_journal is None or not replica.covers(appointment_date):
+            raise
+        report_db_failure(e)
+        return _journal_booking(user_pk, appointment_date, timeslot_pk, user_data)
+
+def _journal_booking(user_pk: int, appointment_date: date, timeslot_pk: int, user_data: str) -> Optional[PendingBooking]:
+    timeslot = replica.timeslots_by_id.get(timeslot_pk)
+    if timeslot is None or replica.is_booked(timeslot.doctor_pk, appointment_date, timeslot_pk):
+        return None
+
+    booking_journal.append({"user_pk": user_pk, "appointment_date": appointment_date.isoformat(),
+                            "timeslot_pk": timeslot_pk, "doctor_pk": timeslot.doctor_pk, "user_data": user_data})
+    replica.mark_booked(timeslot.doctor_pk, appointment_date, timeslot_pk)
+    logger.info("Booking of slot %s on %s by user %s journaled", timeslot_pk, appointment_date, user_pk)
+    doctor_name = next((doctor.name for doctor in replica.doctors if doctor.id == timeslot.doctor_pk), "")
+    return PendingBooking(appointment_date=appointment_date, start_time=timeslot.start_time,
+                          doctor_pk=timeslot.doctor_pk, doctor_name=doctor_name)
+
+async def replay_booking(entry: dict[str, Any]) -> Optional[Row]:
+    """Создает запись из журнала; None, если слот за это время занял другой пользователь."""
+    return await _insert_appointment(entry["user_pk"], date.fromisoformat(entry["appointment_date"]),
+                                     entry["timeslot_pk"], entry["user_data"])
+
+def _slot_bookable(user_pk: int, appointment_date: date, timeslot_pk: int):
+    """Условие, что пользователь может занять слот на дату.
+
+    Слот должен быть активным, приходиться на день недели даты и не быть закрепленным за другим
+    подписчиком листа ожидания.
+    """
+    weekday_matches = exists().where(
+        Timeslot.id == timeslot_pk,
+        Timeslot.is_active.is_(True),
+        Timeslot.weekday == extract("isodow", literal(appointment_date, Date)) - 1,
+    )
+    held = exists().where(WaitlistEntry.wait_date == appointment_date, WaitlistEntry.offer_timeslot_pk == timeslot_pk,
+                          WaitlistEntry.offer_expires_at > func.now(), WaitlistEntry.user_pk != user_pk)
+    return and_(weekday_matches, ~held)
+
+async def _insert_appointment(user_pk: int, appointment_date: date, timeslot_pk: int, user_data: str) -> Optional[Row]:
+    async with async_session() as session, session.begin():
+        # Первичный прием, если у пользователя еще нет ни одной записи
+        is_primary = ~exists().where(Appointment.user_pk == user_pk)
+        stmt = insert(Appointment).from_select(
+            ["appointment_date", "user_data", "is_primary", "user_pk", "timeslot_pk", "doctor_pk"],
+            select(
+                literal(appointment_date, Date),
+                literal(user_data),
+                is_primary,
+                literal(user_pk),
+                literal(timeslot_pk),
+                select(Timeslot.doctor_pk).where(Timeslot.id == timeslot_pk).scalar_subquery(),
+            ).where(_slot_bookable(user_pk, appointment_date, timeslot_pk))
+        )
+        # Повтор записи того же пользователя возвращает его строку: DO UPDATE, в отличие от чтения в том же
+        # снимке, дожидается конкурирующей транзакции и видит закоммиченную запись. Чужая запись не возвращается
+        booked_row = (
+            stmt.on_conflict_do_update(constraint="uq_appointment_date_timeslot",
+                                       set_={"user_pk": stmt.excluded.user_pk},
+                                       where=Appointment.user_pk == stmt.excluded.user_pk)
+            .returning(Appointment.id, Appointment.appointment_date, Appointment.timeslot_pk, Appointment.doctor_pk)
+            .cte("booked")
+        )
+        result = await session.execute(
+            select(booked_row.c.id, booked_row.c.appointment_date, Timeslot.start_time,
+                   booked_row.c.doctor_pk, Doctor.name.label("doctor_name"))
+            .join(Timeslot, Timeslot.id == booked_row.c.timeslot_pk)
+            .join(Doctor, Doctor.id == booked_row.c.doctor_pk)
+        )
+        booked = result.one_or_none()
+
+        if booked is not None:
+            # Записавшемуся на эту дату лист ожидания больше не нужен
+            await session.execute(
+                delete(WaitlistEntry).where(WaitlistEntry.user_pk == user_pk, WaitlistEntry.doctor_pk == booked.doctor_pk,
+                                            WaitlistEntry.wait_date == appointment_date)
+            )
+
+    if booked is not None:
+        invalidate_booked(booked.doctor_pk, appointment_date)
+    return booked
+
 async def get_appointment(appointment_pk: int) -> Optional[Appointment]:
     async with async_session() as session:
         result = await session.execute(
@@ -112,33 +582,301 @@ async def get_user_appointments(user_pk: int) -> List[Appointment]:
     async with async_session() as session:
         result = await session.execute(
             select(Appointment)
-            .options(joinedload(Appointment.timeslot))
             .where(Appointment.user_pk == user_pk)
             .order_by(Appointment.appointment_date)
         )
         return result.scalars().all()
 
-async def update_appointment(appointment_pk: int, new_visit_date: datetime, new_timeslot_pk: int) -> Optional[Appointment]:
+@dataclass
+class AppointmentsPage:
+    rows: List[Row]
+    has_prev: bool
+    has_next: bool
+
+async def get_user_appointments_page(user_pk: int, page_size: int,
+                                     after: Optional[tuple[date, int]] = None,
+                                     before: Optional[tuple[date, int]] = None) -> AppointmentsPage:
+    """Страница записей пользователя с keyset-пагинацией по (appointment_date, id).
+
+    Без курсоров возвращает первую страницу предстоящих записей, before листает назад, в том числе в прошлое.
+    Строки содержат только (id, appointment_date, start_time, doctor_name).
+    """
+    key = tuple_(Appointment.appointment_date, Appointment.id)
+    stmt = (
+        select(Appointment.id, Appointment.appointment_date, Timeslot.start_time, Doctor.name)
+        .join(Timeslot, Timeslot.id == Appointment.timeslot_pk)
+        .join(Doctor, Doctor.id == Appointment.doctor_pk)
+        .where(Appointment.user_pk == user_pk)
+        .limit(page_size + 1)
+    )
+
+    async with async_session() as session:
+        if before is not None:
+            result = await session.execute(stmt.where(key < tuple_(*before))
+                                           .order_by(Appointment.appointment_date.desc(), Appointment.id.desc()))
+            rows = result.all()
+            return AppointmentsPage(rows=rows[:page_size][::-1], has_prev=len(rows) > page_size, has_next=True)
+
+        if after is None:
+            after = (date.today(), 0)
+            has_prev = (await session.execute(
+                select(exists().where(Appointment.user_pk == user_pk, Appointment.appointment_date < after[0]))
+            )).scalar()
+        else:
+            has_prev = True
+
+        result = await session.execute(stmt.where(key > tuple_(*after))
+                                       .order_by(Appointment.appointment_date, Appointment.id))
+        rows = result.all()
+        return AppointmentsPage(rows=rows[:page_size], has_prev=has_prev, has_next=len(rows) > page_size)
+
+async def get_user_appointment(appointment_pk: int, user_pk: int) -> Optional[Row]:
+    """Запись пользователя (id, appointment_date, start_time, doctor_name, doctor_pk) или None, если она чужая."""
     async with async_session() as session:
-        if not await is_timeslot_available(new_visit_date, new_timeslot_pk):
-            raise ValueError("Новый слот уже занят")
+        result = await session.execute(
+            select(Appointment.id, Appointment.appointment_date, Timeslot.start_time,
+                   Doctor.name.label("doctor_name"), Appointment.doctor_pk)
+            .join(Timeslot, Timeslot.id == Appointment.timeslot_pk)
+            .join(Doctor, Doctor.id == Appointment.doctor_pk)
+            .where(Appointment.id == appointment_pk, Appointment.user_pk == user_pk)
+        )
+        return result.one_or_none()
+
+
+async def update_appointment(appointment_pk: int, user_pk: int, new_visit_date: date, new_timeslot_pk: int) -> Optional[Row]:
+    """Переносит запись пользователя на другой слот одним UPDATE.
+
+    Возвращает строку (id, appointment_date, start_time, ...) или None, если записи нет или она чужая.
+    Если новый слот занят, уникальный индекс (appointment_date, timeslot_pk) не даст обновить строку;
+    слот не на тот день недели или закрепленный за подписчиком листа ожидания тоже дает ValueError.
+    """
+    old = (
+        select(Appointment.id, Appointment.appointment_date.label("old_date"), Appointment.doctor_pk.label("old_doctor_pk"),
+               Appointment.timeslot_pk.label("old_timeslot_pk"))
+        .where(Appointment.id == appointment_pk, Appointment.user_pk == user_pk)
+        .subquery("old")
+    )
+    stmt = (
+        update(Appointment)
+        .where(Appointment.id == old.c.id, _slot_bookable(user_pk, new_visit_date, new_timeslot_pk))
+        .values(
+            appointment_date=new_visit_date,
+            timeslot_pk=new_timeslot_pk,
+            doctor_pk=select(Timeslot.doctor_pk).where(Timeslot.id == new_timeslot_pk).scalar_subquery(),
+            reminder_sent_at=None,
+        )
+        .returning(Appointment.id, Appointment.appointment_date,
+                   select(Timeslot.start_time).where(Timeslot.id == new_timeslot_pk).scalar_subquery().label("start_time"),
+                   Appointment.doctor_pk, old.c.old_date, old.c.old_doctor_pk, old.c.old_timeslot_pk)
+    )
+
+    try:
+        async with async_session() as session, session.begin():
+            updated = (await session.execute(stmt)).one_or_none()
+    except IntegrityError:
+        raise ValueError("Новый слот уже занят")
+
+    if updated is None:
+        if await get_user_appointment(appointment_pk, user_pk) is not None:
+            raise ValueError("Новый слот недоступен")
+        return None
 
+    invalidate_booked(updated.old_doctor_pk, updated.old_date)
+    invalidate_booked(updated.doctor_pk, updated.appointment_date)
+    await notify_slot_freed(updated.old_doctor_pk, updated.old_date, updated.old_timeslot_pk)
+    return updated
+
+
+async def delete_appointment(appointment_pk: int, user_pk: Optional[int] = None) -> Optional[Row]:
+    """Удаляет запись одним DELETE; с user_pk — только если она принадлежит пользователю.
+
+    Возвращает строку (doctor_pk, appointment_date, timeslot_pk) удаленной записи или None.
+    """
+    stmt = delete(Appointment).where(Appointment.id == appointment_pk)
+    if user_pk is not None:
+        stmt = stmt.where(Appointment.user_pk == user_pk)
+
+    async with async_session() as session, session.begin():
         result = await session.execute(
-            select(Appointment).where(Appointment.id == appointment_pk)
+            stmt.returning(Appointment.doctor_pk, Appointment.appointment_date, Appointment.timeslot_pk)
         )
-        appointment = result.scalar_one_or_none()
-        if appointment:
-            appointment.visit_date = new_visit_date
-            appointment.timeslot = new_timeslot_pk
-            await session.commit()
-            await session.refresh(appointment)
-        return appointment
+        deleted = result.one_or_none()
+
+    if deleted is not None:
+        invalidate_booked(deleted.doctor_pk, deleted.appointment_date)
+        await notify_slot_freed(deleted.doctor_pk, deleted.appointment_date, deleted.timeslot_pk)
+    return deleted
 
 
-async def delete_appointment(appointment_pk: int) -> None:
+async def add_to_waitlist(user_pk: int, doctor_pk: int, wait_date: date) -> bool:
+    """Ставит пользователя в лист ожидания; False, если он уже в нем."""
+    async with async_session() as session, session.begin():
+        result = await session.execute(
+            insert(WaitlistEntry)
+            .values(user_pk=user_pk, doctor_pk=doctor_pk, wait_date=wait_date)
+            .on_conflict_do_nothing(constraint="uq_waitlist_user_doctor_date")
+            .returning(WaitlistEntry.id)
+        )
+        return result.scalar_one_or_none() is not None
+
+
+async def offer_waitlist_slot(doctor_pk: int, wait_date: date, timeslot_pk: int, hold: timedelta) -> Optional[Row]:
+    """Закрепляет свободный слот за первым в очереди подписчиком одним UPDATE.
+
+    Слот предлагается только подписчикам, которым еще ничего не предлагали, и только на сегодня или позже.
+    Возвращает строку (id, telegram_id, user_pk) или None, если предлагать некому или слот уже занят.
+    """
+    now = func.now()
+    candidate = (
+        select(WaitlistEntry.id)
+        .where(
+            WaitlistEntry.doctor_pk == doctor_pk,
+            WaitlistEntry.wait_date == wait_date,
+            WaitlistEntry.wait_date >= func.current_date(),
+            WaitlistEntry.offer_expires_at.is_(None),
+            ~exists().where(Appointment.appointment_date == wait_date, Appointment.timeslot_pk == timeslot_pk),
+            ~exists().where(WaitlistEntry.wait_date == wait_date, WaitlistEntry.offer_timeslot_pk == timeslot_pk,
+                            WaitlistEntry.offer_expires_at > now).correlate_except(WaitlistEntry),
+        )
+        .order_by(WaitlistEntry.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    async with async_session() as session, session.begin():
+        result = await session.execute(
+            update(WaitlistEntry)
+            .where(WaitlistEntry.id == candidate)
+            .values(offer_timeslot_pk=timeslot_pk, offer_expires_at=now + hold)
+            .returning(WaitlistEntry.id,
+                       select(User.telegram_id).where(User.id == WaitlistEntry.user_pk).scalar_subquery().label("telegram_id"),
+                       WaitlistEntry.user_pk)
+        )
+        offer = result.one_or_none()
+
+    if offer is not None:
+        invalidate_booked(doctor_pk, wait_date)
+    return offer
+
+
+async def remove_from_waitlist(waitlist_pk: int) -> None:
+    async with async_session() as session, session.begin():
+        await session.execute(delete(WaitlistEntry).where(WaitlistEntry.id == waitlist_pk))
+
+
+async def get_expired_waitlist_offers() -> list[int]:
+    """id подписок, срок предложения по которым истек."""
     async with async_session() as session:
+        result = await session.execute(
+            select(WaitlistEntry.id).where(WaitlistEntry.offer_expires_at <= func.now()).order_by(WaitlistEntry.id)
+        )
+        return list(result.scalars().all())
+
+
+async def expire_waitlist_offer(waitlist_pk: int) -> Optional[Row]:
+    """Удаляет подписку с истекшим предложением: закрепление слота снимается, повторно его не предлагают.
+
+    Возвращает строку (doctor_pk, wait_date, offer_timeslot_pk) освободившегося слота или None, если подписчик
+    успел записаться или подписку уже снял другой процесс.
+    """
+    async with async_session() as session, session.begin():
+        result = await session.execute(
+            delete(WaitlistEntry)
+            .where(WaitlistEntry.id == waitlist_pk, WaitlistEntry.offer_expires_at <= func.now())
+            .returning(WaitlistEntry.doctor_pk, WaitlistEntry.wait_date, WaitlistEntry.offer_timeslot_pk)
+        )
+        expired = result.one_or_none()
+
+    if expired is not None:
+        invalidate_booked(expired.doctor_pk, expired.wait_date)
+    return expired
+
+
+async def get_user_telegram_id(user_pk: int) -> Optional[int]:
+    async with async_session() as session:
+        result = await session.execute(select(User.telegram_id).where(User.id == user_pk))
+        return result.scalar_one_or_none()
+
+
+async def refresh_replica(horizon_days: int) -> None:
+    """Перезагружает копию расписания на horizon_days вперед.
+
+    Успешная загрузка означает, что БД снова доступна: чтение возвращается к ней.
+    """
+    first_day = date.today()
+    last_day = first_day + timedelta(days=horizon_days)
+    async with async_session() as session:
+        timeslots = (await session.execute(select(Timeslot).where(Timeslot.is_active.is_(True)))).scalars().all()
+        booked = (await session.execute(
+            select(Appointment.doctor_pk, Appointment.appointment_date, Appointment.timeslot_pk)
+            .where(Appointment.appointment_date.between(first_day, last_day))
+        )).all()
+        days_off = (await session.execute(
+            select(DayOff.day, DayOff.doctor_pk).where(DayOff.day >= first_day)
+        )).all()
+        doctors = (await session.execute(
+            select(Doctor.id, Doctor.name, Doctor.specialty)
+            .where(Doctor.is_active.is_(True))
+            .order_by(Doctor.name)
+        )).all()
+
+    replica.load(timeslots, booked, days_off, doctors, first_day, last_day)
+    # Записи журнала, еще не перенесенные в БД, продолжают занимать свои слоты
+    if booking_journal is not None:
+        for entry in booking_journal.read():
+            replica.mark_booked(entry["doctor_pk"], date.fromisoformat(entry["appointment_date"]), entry["timeslot_pk"])
+
+    replica.failures = 0
+    if replica.degraded_since is not None:
+        logger.warning("Database available again after %.0f s", perf_time.monotonic() - replica.degraded_since)
+        replica.degraded_since = None
+
+
+async def get_pending_reminders(starts_from: datetime, starts_to: datetime, after_id: int, limit: int) -> List[Row]:
+    """Пачка записей без отправленного напоминания, начинающихся в промежутке, по возрастанию id.
+
+    Записи, время которых уже прошло, не выбираются, поэтому не просматриваются при каждом обходе до конца дня.
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            select(Appointment.id, Appointment.appointment_date, Timeslot.start_time, User.telegram_id)
+            .join(Timeslot, Timeslot.id == Appointment.timeslot_pk)
+            .join(User, User.id == Appointment.user_pk)
+            .where(Appointment.reminder_sent_at.is_(None),
+                   # Диапазон дат — для частичного индекса, точное время — по слоту
+                   Appointment.appointment_date.between(starts_from.date(), starts_to.date()),
+                   tuple_(Appointment.appointment_date, Timeslot.start_time).between(
+                       tuple_(starts_from.date(), starts_from.time()), tuple_(starts_to.date(), starts_to.time())),
+                   Appointment.id > after_id)
+            .order_by(Appointment.id)
+            .limit(limit)
+        )
+        return result.all()
+
+
+async def mark_reminders_sent(appointment_pks: List[int]) -> None:
+    if not appointment_pks:
+        return
+    async with async_session() as session, session.begin():
         await session.execute(
-            delete(Appointment).where(Appointment.id == appointment_pk)
+            update(Appointment)
+            .where(Appointment.id.in_(appointment_pks))
+            .values(reminder_sent_at=func.now())
         )
-        await session.commit()
 
+
+async def stream_schedule(first_day: date, last_day: date, partition_size: int = 1000) -> AsyncIterator[List[Row]]:
+    """Записи периода порциями через серверный курсор, без загрузки всего результата в память."""
+    async with async_session() as session:
+        result = await session.stream(
+            select(Appointment.appointment_date, Timeslot.start_time, Doctor.name.label("doctor_name"),
+                   Appointment.user_data, User.telegram_id, Appointment.is_primary, Appointment.created_at)
+            .join(Timeslot, Timeslot.id == Appointment.timeslot_pk)
+            .join(Doctor, Doctor.id == Appointment.doctor_pk)
+            .join(User, User.id == Appointment.user_pk)
+            .where(Appointment.appointment_date.between(first_day, last_day))
+            .order_by(Appointment.appointment_date, Timeslot.start_time, Doctor.name)
+            .execution_options(yield_per=partition_size)
+        )
+        async for partition in result.partitions():
+            yield partition
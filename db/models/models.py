@@ -1,8 +1,8 @@
-from typing import List
+from typing import List, Optional
 
-from sqlalchemy import ForeignKey, func
+from sqlalchemy import BigInteger, ForeignKey, Index, UniqueConstraint, func, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from datetime import datetime, date
+from datetime import datetime, date, time
 
 
 class Base(DeclarativeBase):
@@ -13,40 +13,113 @@ class User(Base):
     __tablename__ = "user"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    telegram_id: Mapped[int] = mapped_column(unique=True)
+    # id пользователей Telegram уже не помещаются в int4
+    telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True)
     is_admin: Mapped[bool] = mapped_column(default=False)
     appointments: Mapped[List["Appointment"]] = relationship(back_populates="user", cascade="all, delete-orphan")
 
 
 class Appointment(Base):
     __tablename__ = "appointment"
+    __table_args__ = (
+        # Один слот на дату может быть занят только одной записью
+        UniqueConstraint("appointment_date", "timeslot_pk", name="uq_appointment_date_timeslot"),
+        # Записи пользователя по дате
+        Index("ix_appointment_user_pk_date", "user_pk", "appointment_date"),
+        # Занятость врача по дате
+        Index("ix_appointment_doctor_pk_date", "doctor_pk", "appointment_date"),
+        # Записи, по которым еще не отправлено напоминание
+        Index("ix_appointment_reminder_pending", "appointment_date", "id",
+              postgresql_where=text("reminder_sent_at IS NULL")),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
     appointment_date: Mapped[date] = mapped_column()
     user_data: Mapped[str]
     is_primary: Mapped[bool] = mapped_column(default=True)
+    reminder_sent_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
 
     user_pk: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"))
     timeslot_pk: Mapped[int] = mapped_column(ForeignKey("timeslot.id", ondelete="CASCADE"))
+    # Дублирует timeslot.doctor_pk, чтобы выборки по врачу шли по индексу без join'а
+    doctor_pk: Mapped[int] = mapped_column(ForeignKey("doctor.id", ondelete="CASCADE"))
 
     user: Mapped["User"] = relationship(back_populates="appointments", lazy="selectin")
     timeslot: Mapped["Timeslot"] = relationship(back_populates="appointments", lazy="selectin")
 
     def __str__(self):
-        return f"{self.appointment_date.strftime("%d-%m-%Y")} в {self.timeslot.start_time}"
+        return f"{self.appointment_date.strftime('%d-%m-%Y')} в {self.timeslot}"
 
 
 class Timeslot(Base):
     __tablename__ = "timeslot"
+    __table_args__ = (
+        # Слоты врача на день недели; индекс также обслуживает выборку по (doctor_pk, weekday)
+        UniqueConstraint("doctor_pk", "weekday", "start_time", name="uq_timeslot_doctor_weekday_start"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     weekday: Mapped[int] = mapped_column(nullable=False)
-    start_time: Mapped[str]
-    end_time: Mapped[str]
+    start_time: Mapped[time]
+    end_time: Mapped[time]
+    # Слот, убранный из шаблона, но с прошлыми записями: не показывается и не бронируется
+    is_active: Mapped[bool] = mapped_column(default=True, server_default=text("true"))
+    doctor_pk: Mapped[int] = mapped_column(ForeignKey("doctor.id", ondelete="CASCADE"))
     appointments: Mapped[List["Appointment"]] = relationship(back_populates="timeslot", cascade="all, delete-orphan")
 
     def __str__(self):
-        return self.start_time
+        return self.start_time.strftime("%H:%M")
 
 
+class Doctor(Base):
+    __tablename__ = "doctor"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str]
+    specialty: Mapped[Optional[str]]
+    is_active: Mapped[bool] = mapped_column(default=True)
+
+    def __str__(self):
+        return self.name
+
+
+class DayOff(Base):
+    """Нерабочий день: слоты на эту дату не показываются.
+
+    Без doctor_pk день нерабочий для всей клиники (праздник), с doctor_pk — только для врача (отпуск).
+    """
+    __tablename__ = "day_off"
+    __table_args__ = (
+        # На дату один нерабочий день клиники и по одному на каждого врача
+        Index("uq_day_off_clinic_day", "day", unique=True, postgresql_where=text("doctor_pk IS NULL")),
+        Index("uq_day_off_doctor_day", "doctor_pk", "day", unique=True, postgresql_where=text("doctor_pk IS NOT NULL")),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    day: Mapped[date]
+    reason: Mapped[Optional[str]]
+    doctor_pk: Mapped[Optional[int]] = mapped_column(ForeignKey("doctor.id", ondelete="CASCADE"), nullable=True)
+
+
+class WaitlistEntry(Base):
+    """Подписка пользователя на освободившийся слот врача на дату.
+
+    Освободившийся слот предлагается подписчикам по очереди (по id) и на время hold закрепляется
+    за одним из них: offer_timeslot_pk и offer_expires_at.
+    """
+    __tablename__ = "waitlist"
+    __table_args__ = (
+        UniqueConstraint("user_pk", "doctor_pk", "wait_date", name="uq_waitlist_user_doctor_date"),
+        # Очередь подписчиков на дату врача в порядке подписки
+        Index("ix_waitlist_doctor_date_id", "doctor_pk", "wait_date", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    wait_date: Mapped[date]
+    offer_expires_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+
+    user_pk: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"))
+    doctor_pk: Mapped[int] = mapped_column(ForeignKey("doctor.id", ondelete="CASCADE"))
+    offer_timeslot_pk: Mapped[Optional[int]] = mapped_column(ForeignKey("timeslot.id", ondelete="SET NULL"), nullable=True)
@@ -0,0 +1,136 @@
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import Row
+
+from .models.models import Timeslot
+
+
+class ScheduleReplica:
+    """Локальная копия расписания для работы, пока БД недоступна или отвечает слишком медленно.
+
+    Хранит шаблоны слотов, врачей, выходные и занятые пары (дата, слот) на horizon дней вперед.
+    Периодически перезагружается целиком (db.refresh_replica), между загрузками дополняется
+    записями, принятыми в журнал.
+    """
+
+    def __init__(self):
+        self.timeslots: dict[tuple[int, int], list[Timeslot]] = {}
+        self.timeslots_by_id: dict[int, Timeslot] = {}
+        self.booked: dict[tuple[int, date], set[int]] = {}
+        # Нерабочие дни по врачам; под ключом None — дни всей клиники
+        self.days_off: dict[Optional[int], frozenset[date]] = {}
+        self.doctors: list[Row] = []
+        self.first_day: Optional[date] = None
+        self.last_day: Optional[date] = None
+        self.loaded_at: Optional[float] = None
+        # Момент перехода на копию; None, пока БД работает
+        self.degraded_since: Optional[float] = None
+        # Сбоев связи с БД подряд (db.report_db_failure)
+        self.failures = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    @property
+    def degraded(self) -> bool:
+        return self.degraded_since is not None
+
+    def age(self) -> Optional[float]:
+        return time.monotonic() - self.loaded_at if self.loaded_at is not None else None
+
+    def load(self, timeslots: Iterable[Timeslot], booked: Iterable[tuple[int, date, int]],
+             days_off: Iterable[tuple[date, Optional[int]]], doctors: list[Row], first_day: date, last_day: date) -> None:
+        by_weekday: dict[tuple[int, int], list[Timeslot]] = {}
+        for timeslot in sorted(timeslots, key=lambda slot: slot.start_time):
+            by_weekday.setdefault((timeslot.doctor_pk, timeslot.weekday), []).append(timeslot)
+        booked_by_day: dict[tuple[int, date], set[int]] = {}
+        for doctor_pk, appointment_date, timeslot_pk in booked:
+            booked_by_day.setdefault((doctor_pk, appointment_date), set()).add(timeslot_pk)
+
+        self.timeslots = by_weekday
+        self.timeslots_by_id = {slot.id: slot for slots in by_weekday.values() for slot in slots}
+        self.booked = booked_by_day
+        days_off_by_doctor: dict[Optional[int], set[date]] = {}
+        for day, doctor_pk in days_off:
+            days_off_by_doctor.setdefault(doctor_pk, set()).add(day)
+        self.days_off = {doctor_pk: frozenset(days) for doctor_pk, days in days_off_by_doctor.items()}
+        self.doctors = doctors
+        self.first_day, self.last_day = first_day, last_day
+        self.loaded_at = time.monotonic()
+
+    def is_day_off(self, doctor_pk: int, day: date) -> bool:
+        return day in self.days_off.get(None, ()) or day in self.days_off.get(doctor_pk, ())
+
+    def covers(self, day: date) -> bool:
+        return self.ready and self.first_day <= day <= self.last_day
+
+    def available_timeslots(self, doctor_pk: int, day: date) -> Optional[list[Timeslot]]:
+        """Свободные слоты на дату или None, если дата вне копии."""
+        if not self.covers(day):
+            return None
+        if self.is_day_off(doctor_pk, day):
+            return []
+        booked = self.booked.get((doctor_pk, day), ())
+        return [slot for slot in self.timeslots.get((doctor_pk, day.weekday()), []) if slot.id not in booked]
+
+    def month_availability(self, doctor_pk: int, first_day: date, last_day: date, now: datetime,
+                           lead: timedelta) -> Optional[dict[date, int]]:
+        """То же, что db.get_month_availability, по дням периода, попавшим в копию."""
+        if not self.ready or last_day < self.first_day or first_day > self.last_day:
+            return None
+        day = max(first_day, self.first_day)
+        availability = {}
+        while day <= min(last_day, self.last_day):
+            timeslots = self.timeslots.get((doctor_pk, day.weekday()))
+            if timeslots and not self.is_day_off(doctor_pk, day):
+                booked = self.booked.get((doctor_pk, day), ())
+                availability[day] = sum(slot.id not in booked for slot in timeslots
+                                        if day != now.date() or datetime.combine(day, slot.start_time) > now + lead)
+            day += timedelta(days=1)
+        return availability
+
+    def is_booked(self, doctor_pk: int, day: date, timeslot_pk: int) -> bool:
+        return timeslot_pk in self.booked.get((doctor_pk, day), ())
+
+    def mark_booked(self, doctor_pk: int, day: date, timeslot_pk: int) -> None:
+        self.booked.setdefault((doctor_pk, day), set()).add(timeslot_pk)
+
+
+class BookingJournal:
+    """Записи, принятые, пока БД недоступна. По строке JSON на запись, каждая сбрасывается на диск (fsync).
+
+    После восстановления БД журнал проигрывается и укорачивается на обработанные записи. Проигрывание
+    одной и той же записи повторно безопасно: book_appointment вернет уже созданную запись.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def append(self, entry: dict[str, Any]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self) -> list[dict[str, Any]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                # Оборванная при сбое последняя строка не разбирается и отбрасывается
+                return [json.loads(line) for line in f if line.endswith("\n")]
+        except FileNotFoundError:
+            return []
+
+    def drop(self, count: int) -> None:
+        """Атомарно убирает из журнала первые count записей; дописанные за время проигрывания сохраняются."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.read()[count:]:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
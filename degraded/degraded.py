@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from datetime import date
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from sqlalchemy.engine import Row
+
+from config.config import DegradedSettings
+from db.db import (degraded_hooks, get_user_telegram_id, init_booking_journal, is_db_unavailable, refresh_replica,
+                   replay_booking, replica, report_db_failure)
+from lexicon.lexicon import LEXICON
+
+
+logger = logging.getLogger(__name__)
+
+# Пока БД недоступна, ее восстановление проверяется не реже раза в столько секунд
+RECOVERY_CHECK_INTERVAL = 5
+
+
+class DegradedMode:
+    """Работа при недоступной БД.
+
+    Раз в refresh_interval секунд обновляет локальную копию расписания, по которой календарь и выбор
+    времени работают, пока БД недоступна. Записи, принятые в это время в журнал, после восстановления
+    БД переносятся в нее, а пользователи получают подтверждение или отказ. При переходе на копию
+    ожидание прерывается, и восстановление БД проверяется каждые RECOVERY_CHECK_INTERVAL секунд.
+    """
+
+    def __init__(self, bot: Bot, degraded_settings: DegradedSettings, journal_path: Optional[str] = None):
+        self.bot = bot
+        self.settings = degraded_settings
+        self.journal = init_booking_journal(journal_path or degraded_settings.journal_path)
+        self.wakeup = asyncio.Event()
+        degraded_hooks.append(self.wakeup.set)
+
+    async def run(self) -> None:
+        logger.info("Schedule replica refresher started")
+        while True:
+            try:
+                # Сначала журнал: после обновления копии его слоты должны быть уже заняты в БД
+                await self.replay()
+                await refresh_replica(self.settings.horizon_days)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if is_db_unavailable(e):
+                    report_db_failure(e)
+                else:
+                    logger.exception("Schedule replica refresh failed")
+
+            interval = self.settings.refresh_interval
+            try:
+                await asyncio.wait_for(self.wakeup.wait(),
+                                       min(interval, RECOVERY_CHECK_INTERVAL) if replica.degraded else interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    async def replay(self) -> None:
+        entries = self.journal.read()
+        if not entries:
+            return
+
+        replayed = 0
+        try:
+            for entry in entries:
+                booked = await replay_booking(entry)
+                await self._notify(entry, booked)
+                replayed += 1
+        finally:
+            if replayed:
+                self.journal.drop(replayed)
+                logger.info("Replayed %d of %d journaled bookings", replayed, len(entries))
+
+    async def _notify(self, entry: dict[str, Any], booked: Optional[Row]) -> None:
+        appointment_date = date.fromisoformat(entry["appointment_date"]).strftime("%d-%m-%Y")
+        if booked is not None:
+            text = LEXICON["journal_confirmed"].format(doctor_name=booked.doctor_name, appointment_date=appointment_date,
+                                                       timeslot=booked.start_time.strftime("%H:%M"))
+        else:
+            timeslot = replica.timeslots_by_id.get(entry["timeslot_pk"])
+            text = LEXICON["journal_rejected"].format(appointment_date=appointment_date,
+                                                      timeslot=str(timeslot) if timeslot is not None else "")
+
+        telegram_id = await get_user_telegram_id(entry["user_pk"])
+        if telegram_id is None:
+            return
+        try:
+            await self.bot.send_message(chat_id=telegram_id, text=text)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            logger.info("Journaled booking notification to %s dropped: %s", telegram_id, e)
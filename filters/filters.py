@@ -0,0 +1,11 @@
+from aiogram.filters import BaseFilter
+from aiogram.types import TelegramObject, User
+
+from config.config import get_settings
+
+
+class IsAdmin(BaseFilter):
+    """Пропускает только администраторов из ADMIN_IDS."""
+
+    async def __call__(self, event: TelegramObject, event_from_user: User | None = None) -> bool:
+        return event_from_user is not None and event_from_user.id in get_settings().bot.admin_ids
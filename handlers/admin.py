@@ -0,0 +1,87 @@
+import os
+from datetime import date, datetime, timedelta
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, FSInputFile
+
+from filters.filters import IsAdmin
+from services.export import export_schedule_csv, schedule_lines
+
+
+router = Router()
+router.message.filter(IsAdmin())
+
+# Лимит Telegram на длину сообщения
+MESSAGE_LIMIT = 4096
+
+
+def _parse_period(args: str | None, default_days: int) -> tuple[date, date]:
+    """Период из аргументов команды: "ДД-ММ-ГГГГ" или "ДД-ММ-ГГГГ ДД-ММ-ГГГГ"."""
+    if not args:
+        first_day = date.today()
+        return first_day, first_day + timedelta(days=default_days - 1)
+
+    days = [datetime.strptime(arg, "%d-%m-%Y").date() for arg in args.split()]
+    return days[0], days[-1]
+
+
+def _split_line(line: str, limit: int) -> list[str]:
+    """Части строки не длиннее limit; разрез не попадает внутрь HTML-сущности вроде &amp;."""
+    parts = []
+    while len(line) > limit:
+        cut = limit
+        entity = line.rfind("&", 0, cut)
+        if entity > 0 and line.find(";", entity, cut) == -1:
+            cut = entity
+        parts.append(line[:cut])
+        line = line[cut:]
+    parts.append(line)
+    return parts
+
+
+async def _send_schedule(message: Message, first_day: date, last_day: date) -> None:
+    chunk = f"Записи с {first_day.strftime('%d-%m-%Y')} по {last_day.strftime('%d-%m-%Y')}:"
+    has_rows = False
+    async for line in schedule_lines(first_day, last_day):
+        has_rows = True
+        # Строка длиннее лимита (например, очень длинные имя и телефон) уходит несколькими сообщениями
+        for part in _split_line(line, MESSAGE_LIMIT - 1):
+            if len(chunk) + len(part) + 1 > MESSAGE_LIMIT:
+                await message.answer(chunk)
+                chunk = ""
+            chunk += "\n" + part
+
+    await message.answer(chunk if has_rows else "Записей на этот период нет.")
+
+
+@router.message(Command("raspisanie"))
+async def day_schedule(message: Message, command: CommandObject):
+    try:
+        first_day, last_day = _parse_period(command.args, default_days=1)
+    except ValueError:
+        await message.answer("Формат: /raspisanie ДД-ММ-ГГГГ")
+        return
+    await _send_schedule(message, first_day, last_day)
+
+
+@router.message(Command("raspisanie_nedelya"))
+async def week_schedule(message: Message):
+    first_day, last_day = _parse_period(None, default_days=7)
+    await _send_schedule(message, first_day, last_day)
+
+
+@router.message(Command("export"))
+async def export_schedule(message: Message, command: CommandObject):
+    try:
+        first_day, last_day = _parse_period(command.args, default_days=30)
+    except ValueError:
+        await message.answer("Формат: /export ДД-ММ-ГГГГ ДД-ММ-ГГГГ")
+        return
+
+    path = await export_schedule_csv(first_day, last_day)
+    try:
+        filename = f"schedule_{first_day.strftime('%Y%m%d')}_{last_day.strftime('%Y%m%d')}.csv"
+        await message.answer_document(FSInputFile(path, filename=filename))
+    finally:
+        os.remove(path)
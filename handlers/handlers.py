@@ -1,19 +1,23 @@
-from datetime import datetime
+from datetime import datetime, date
 
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from db.db import get_or_create_user
+from callbacks.callbacks import Action, CallbackDispatcher
+from db.db import get_doctors, get_user_appointment
 from db.models.models import Appointment
-from services.services import get_calendar_markup, get_timeslots_kb, get_user_appointments, save_appointment, cancel_appointment
+from keyboard.keyboards import appointment_actions_kb, confirm_cancel_kb, waitlist_kb
+from services.services import get_doctors_kb, get_calendar_markup, get_timeslots_kb, get_user_appointments, save_appointment, cancel_appointment, reschedule_appointment, subscribe_to_waitlist
 from lexicon.lexicon import MAIN_MENU_COMMANDS, LEXICON
 
 
 router = Router()
+callbacks = CallbackDispatcher()
 
 class BookingState(StatesGroup):
+    choosing_doctor = State()
     choosing_date = State()
     choosing_time = State()
     entering_name_and_phone = State()
@@ -22,59 +26,103 @@ class CancelState(StatesGroup):
     choosing_appointment = State()
     confirming_cancel = State()
 
+class RescheduleState(StatesGroup):
+    choosing_date = State()
+    choosing_time = State()
+
 @router.message(F.text == "/start")
 async def start(message: Message, state: FSMContext):
+    # Пользователь уже создан в UserMiddleware
     await state.clear()
-    await get_or_create_user(message.from_user.id)
     await message.answer(LEXICON["start_message"])
 
 @router.message(F.text == "/zapis")
 async def make_appointment(message: Message, state: FSMContext):
-    await message.answer(LEXICON["select_date"], reply_markup=get_calendar_markup())
-    await state.set_state(BookingState.choosing_date)
+    await state.clear()
+    doctors = await get_doctors()
 
-@router.callback_query(F.data.startswith("calendar:"), BookingState.choosing_date)
-async def select_date(callback: CallbackQuery, state: FSMContext):
-    action, payload = callback.data.split(":", 1)
+    if not doctors:
+        await message.answer(LEXICON["no_doctors"])
+        return
 
-    if payload.startswith("shift:"):
-        # Навигация по календарю
-        month_shift = int(payload.split(":")[1])
-        markup = get_calendar_markup(month_shift)
-        await callback.message.edit_reply_markup(reply_markup=markup)
-        await callback.answer()
+    # Если врач один, выбирать не из кого — сразу показываем календарь
+    if len(doctors) == 1:
+        doctor_pk = doctors[0].id
+        await state.update_data(doctor_pk=doctor_pk)
+        await message.answer(LEXICON["select_date"], reply_markup=await get_calendar_markup(doctor_pk))
+        await state.set_state(BookingState.choosing_date)
+        return
 
-    else:
-        await state.update_data(selected_date=payload)
+    await message.answer(LEXICON["select_doctor"], reply_markup=get_doctors_kb(doctors))
+    await state.set_state(BookingState.choosing_doctor)
+
+@callbacks.register(Action.DOCTOR, BookingState.choosing_doctor)
+async def select_doctor(callback: CallbackQuery, doctor_pk: int, state: FSMContext):
+    await state.update_data(doctor_pk=doctor_pk)
+    await callback.message.edit_text(LEXICON["select_date"], reply_markup=await get_calendar_markup(doctor_pk))
+    await state.set_state(BookingState.choosing_date)
+    await callback.answer()
+
+@callbacks.register(Action.CALENDAR_SHIFT, BookingState.choosing_date, RescheduleState.choosing_date)
+async def shift_calendar(callback: CallbackQuery, month_shift: int, state: FSMContext):
+    doctor_pk = (await state.get_data())["doctor_pk"]
+    markup = await get_calendar_markup(doctor_pk, month_shift)
+    await callback.message.edit_reply_markup(reply_markup=markup)
+    await callback.answer()
+
+@callbacks.register(Action.CALENDAR_DAY, BookingState.choosing_date, RescheduleState.choosing_date)
+async def select_date(callback: CallbackQuery, selected_date: date, state: FSMContext, raw_state: str):
+    doctor_pk = (await state.get_data())["doctor_pk"]
+    payload = selected_date.strftime("%d-%m-%Y")
+    # weekday: 0 = Пн, 6 = Вс
+    await state.update_data(selected_date=payload, weekday=selected_date.weekday())
 
-        # Получаем день недели выбранной даты (0 = Пн, 6 = Вс)
-        weekday = datetime.strptime(payload, "%d-%m-%Y").weekday()
-        await state.update_data(weekday=weekday)
-        # Получаем клавиатуру временных слотов
-        timeslots_kb = await get_timeslots_kb(datetime.strptime(payload, "%d-%m-%Y"))
+    timeslots_kb = await get_timeslots_kb(doctor_pk, datetime.combine(selected_date, datetime.min.time()))
 
-        if not timeslots_kb:
-            await callback.message.edit_text(LEXICON["no_timeslots"])
-        else:
-            text = f"Вы выбрали дату: {payload}\nТеперь выберите время"
-            await callback.message.edit_text(text=text, reply_markup=timeslots_kb)
+    if not timeslots_kb.inline_keyboard:
+        await callback.message.edit_text(LEXICON["no_timeslots"], reply_markup=waitlist_kb(selected_date))
+    else:
+        text = f"Вы выбрали дату: {payload}\nТеперь выберите время"
+        await callback.message.edit_text(text=text, reply_markup=timeslots_kb)
 
+    # Тот же календарь используется при переносе записи
+    if raw_state == RescheduleState.choosing_date.state:
+        await state.set_state(RescheduleState.choosing_time)
+    else:
         await state.set_state(BookingState.choosing_time)
+    await callback.answer()
 
-@router.callback_query(F.data.startswith("timeslot_id:"), BookingState.choosing_time)
-async def select_time(callback: CallbackQuery, state: FSMContext):
-    timeslot_id = int(callback.data.split(":")[1])
+@callbacks.register(Action.TIMESLOT, BookingState.choosing_time)
+async def select_time(callback: CallbackQuery, timeslot_id: int, state: FSMContext):
     await state.update_data(selected_timeslot_id=timeslot_id)
     await callback.message.edit_text(LEXICON["input_fio_tel"])
     await state.set_state(BookingState.entering_name_and_phone)
     await callback.answer()
 
+@callbacks.register(Action.WAITLIST, BookingState.choosing_time, RescheduleState.choosing_time)
+async def join_waitlist(callback: CallbackQuery, selected_date: date, state: FSMContext, user_pk: int):
+    doctor_pk = (await state.get_data())["doctor_pk"]
+    response = await subscribe_to_waitlist(user_pk, doctor_pk, selected_date.strftime("%d-%m-%Y"))
+    await callback.message.edit_text(response)
+    await state.clear()
+    await callback.answer()
+
+@callbacks.register(Action.WAITLIST_BOOK)
+async def book_from_waitlist(callback: CallbackQuery, timeslot_id: int, selected_date: date, state: FSMContext):
+    # Дальше обычная запись: слот закреплен за пользователем до окончания hold
+    await state.clear()
+    await state.update_data(selected_date=selected_date.strftime("%d-%m-%Y"), selected_timeslot_id=timeslot_id,
+                            weekday=selected_date.weekday())
+    await callback.message.edit_text(LEXICON["input_fio_tel"])
+    await state.set_state(BookingState.entering_name_and_phone)
+    await callback.answer()
+
 @router.message(BookingState.entering_name_and_phone)
-async def process_name_and_phone(message: Message, state: FSMContext):
+async def process_name_and_phone(message: Message, state: FSMContext, user_pk: int):
     await state.update_data(user_data=message.text)
     data = await state.get_data()
     appointment = {
-        "user_id": message.from_user.id,
+        "user_pk": user_pk,
         "selected_date": data["selected_date"],
         "selected_timeslot_id": data["selected_timeslot_id"],
         "weekday": data["weekday"],
@@ -82,37 +130,101 @@ async def process_name_and_phone(message: Message, state: FSMContext):
     }
     response = await save_appointment(appointment)
 
-    await message.answer(text=LEXICON["appointment_success"] + "\n" + response)
+    await message.answer(text=response)
     await state.clear()
 
-@router.message(F.text == "/moi_zapisi")
-async def show_appointments(callback: CallbackQuery, state: FSMContext):
+@router.message(F.text.in_({"/moi_zapisi", "/otmena", "/perenos"}))
+async def show_appointments(message: Message, state: FSMContext, user_pk: int):
     await state.clear()
-    kb = await get_user_appointments(callback.from_user.id)
+    kb = await get_user_appointments(user_pk)
     if not kb.inline_keyboard:
-        await callback.answer("Вы еще не записаны к доктору")
+        await message.answer("Вы еще не записаны к доктору")
+    elif message.text == "/moi_zapisi":
+        await message.answer(text="Ваши записи\nНажмите на запись чтобы отменить или перенести", reply_markup=kb)
     else:
-        await callback.answer(text="Ваши записи\nНажмите на запись чтобы отменить или перенести", reply_markup=kb)
+        await message.answer(text=LEXICON["select_appointment"], reply_markup=kb)
 
-@router.message(F.text == "/otmena")
-async def cancel_menu(message: Message):
-    records = get_user_appointments(message.from_user.id)
-    if not records:
-        await message.answer("У вас нет записей.")
+@callbacks.register(Action.APPOINTMENTS_NEXT)
+async def next_appointments_page(callback: CallbackQuery, appointment_date: date, appointment_id: int, user_pk: int):
+    kb = await get_user_appointments(user_pk, after=(appointment_date, appointment_id))
+    await callback.message.edit_reply_markup(reply_markup=kb)
+    await callback.answer()
+
+@callbacks.register(Action.APPOINTMENTS_PREV)
+async def prev_appointments_page(callback: CallbackQuery, appointment_date: date, appointment_id: int, user_pk: int):
+    kb = await get_user_appointments(user_pk, before=(appointment_date, appointment_id))
+    await callback.message.edit_reply_markup(reply_markup=kb)
+    await callback.answer()
+
+@callbacks.register(Action.BACK_TO_APPOINTMENTS)
+async def back_to_appointments(callback: CallbackQuery, state: FSMContext, user_pk: int):
+    await state.clear()
+    kb = await get_user_appointments(user_pk)
+    if not kb.inline_keyboard:
+        await callback.message.edit_text("Вы еще не записаны к доктору")
+    else:
+        await callback.message.edit_text(text="Ваши записи\nНажмите на запись чтобы отменить или перенести", reply_markup=kb)
+    await callback.answer()
+
+@callbacks.register(Action.APPOINTMENT)
+async def select_appointment(callback: CallbackQuery, appointment_id: int, user_pk: int):
+    appointment = await get_user_appointment(appointment_id, user_pk)
+    if appointment is None:
+        await callback.message.edit_text(LEXICON["appointment_not_found"])
+    else:
+        text = LEXICON["appointment_info"].format(doctor_name=appointment.doctor_name,
+                                                  appointment_date=appointment.appointment_date.strftime("%d-%m-%Y"),
+                                                  timeslot=appointment.start_time.strftime("%H:%M"))
+        await callback.message.edit_text(text=text, reply_markup=appointment_actions_kb(appointment_id))
+    await callback.answer()
+
+@callbacks.register(Action.CANCEL)
+async def process_cancel(callback: CallbackQuery, appointment_id: int, state: FSMContext, user_pk: int):
+    appointment = await get_user_appointment(appointment_id, user_pk)
+    if appointment is None:
+        await callback.message.edit_text(LEXICON["appointment_not_found"])
+        await callback.answer()
         return
 
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"{r['date']} {r['time']}", callback_data=f"cancel:{r['id']}")] for r in records
-    ])
-    await message.answer("Выберите запись для отмены:", reply_markup=kb)
+    await state.update_data(appointment_id=appointment_id)
+    text = LEXICON["confirm_cancel"].format(appointment_date=appointment.appointment_date.strftime("%d-%m-%Y"),
+                                            timeslot=appointment.start_time.strftime("%H:%M"))
+    await callback.message.edit_text(text=text, reply_markup=confirm_cancel_kb())
+    await state.set_state(CancelState.confirming_cancel)
+    await callback.answer()
+
+@callbacks.register(Action.CONFIRM_CANCEL, CancelState.confirming_cancel)
+async def confirm_cancel(callback: CallbackQuery, state: FSMContext, user_pk: int):
+    appointment_id = (await state.get_data())["appointment_id"]
+    response = await cancel_appointment(appointment_id, user_pk)
+    await callback.message.edit_text(response)
+    await state.clear()
+    await callback.answer()
+
+@callbacks.register(Action.RESCHEDULE)
+async def start_reschedule(callback: CallbackQuery, appointment_id: int, state: FSMContext, user_pk: int):
+    appointment = await get_user_appointment(appointment_id, user_pk)
+    if appointment is None:
+        await callback.message.edit_text(LEXICON["appointment_not_found"])
+        await callback.answer()
+        return
+
+    # Переносим к тому же врачу
+    await state.clear()
+    await state.update_data(appointment_id=appointment_id, doctor_pk=appointment.doctor_pk)
+    await callback.message.edit_text(LEXICON["select_date"], reply_markup=await get_calendar_markup(appointment.doctor_pk))
+    await state.set_state(RescheduleState.choosing_date)
+    await callback.answer()
 
-@router.callback_query(F.data.startswith("cancel:"))
-async def process_cancel(callback: CallbackQuery):
-    appointment_id = callback.data.split(":")[1]
-    cancel_appointment(appointment_id)
-    await callback.message.edit_text("Запись отменена.")
+@callbacks.register(Action.TIMESLOT, RescheduleState.choosing_time)
+async def select_reschedule_time(callback: CallbackQuery, timeslot_id: int, state: FSMContext, user_pk: int):
+    data = await state.get_data()
+    response = await reschedule_appointment(data["appointment_id"], user_pk, data["selected_date"], timeslot_id)
+    await callback.message.edit_text(response)
+    await state.clear()
     await callback.answer()
 
 @router.callback_query()
-async def other(message: Message):
-    pass
+async def route_callback(callback: CallbackQuery, **data):
+    # Все inline-кнопки разбираются одним декодированием и поиском в таблице callbacks
+    return await callbacks.dispatch(callback, data)
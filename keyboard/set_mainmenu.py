@@ -1,9 +1,15 @@
+import hashlib
+import json
 
 from aiogram import Bot
 from aiogram.types import BotCommand
 from lexicon.lexicon import MAIN_MENU_COMMANDS
 
 
+def main_menu_hash() -> str:
+    return hashlib.sha256(json.dumps(MAIN_MENU_COMMANDS, ensure_ascii=False).encode()).hexdigest()
+
+
 async def set_main_menu(bot: Bot) -> None:
     mainmenu_commands = [BotCommand(command=command, description=description)
                          for command, description in MAIN_MENU_COMMANDS.items()]
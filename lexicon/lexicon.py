@@ -10,20 +10,36 @@ MAIN_MENU_COMMANDS: dict[str, str] = {
 
 LEXICON: dict[str, str] = {
     "start_message": "Добро пожаловать!\nЭто бот для записи на прием\n"
-                     "к врачу-реабилитологу Иванову И.И.\n\n"
-                     "📆 Часы приема:\n"
-                     "Понедельник - Пятница\n"
-                     "с 10 до 18\n\n"
+                     "к специалистам нашей клиники.\n\n"
                      "Чтобы записаться отправьте /zapis",
+    "select_doctor": "Пожалуйста, выберите специалиста",
+    "no_doctors": "Сейчас запись к специалистам недоступна. Попробуйте позже",
     "select_date": "Пожалуйста, выберите желаемую дату",
     "select_time": "Пожалуйста, выберите желаемое время",
     "input_fio_tel": "Введите ваше имя и номер телефона для связи",
     "date_selected": "Вы выбрали дату {appointment_date}",
     "appointment_success": "Вы записаны к доктору на {appointment_date} в {timeslot} часов",
     "no_timeslots": "К сожалению на эту дату нет свободных слотов для записи",
+    "reminder": "Напоминаем, что вы записаны к доктору {appointment_date} в {timeslot}",
+    "appointment_info": "Запись к доктору {doctor_name}\n{appointment_date} в {timeslot} часов",
+    "select_appointment": "Выберите запись",
+    "confirm_cancel": "Отменить запись {appointment_date} в {timeslot}?",
+    "appointment_cancelled": "Запись на {appointment_date} отменена",
+    "appointment_rescheduled": "Запись перенесена на {appointment_date} в {timeslot} часов",
+    "appointment_not_found": "Запись не найдена или уже отменена",
+    "waitlist_added": "Вы в листе ожидания на {appointment_date}.\nЕсли время освободится, бот предложит его вам",
+    "waitlist_exists": "Вы уже в листе ожидания на {appointment_date}",
+    "waitlist_offer": "Освободилось время {appointment_date} в {timeslot}.\n"
+                      "Оно закреплено за вами на {hold_minutes} минут",
+    "callback_outdated": "Кнопка устарела, начните заново",
+    "booking_journaled": "Заявка на {appointment_date} в {timeslot} принята.\n"
+                         "Сейчас запись работает с задержкой, бот пришлет подтверждение",
+    "journal_confirmed": "Ваша заявка подтверждена: запись к доктору {doctor_name}\n{appointment_date} в {timeslot} часов",
+    "journal_rejected": "К сожалению, время {appointment_date} в {timeslot} уже занято.\n"
+                        "Чтобы выбрать другое, отправьте /zapis",
     "help_text": "Для записи на прием отправьте /zapis\n"
                  "Чтобы посмотреть ваши записи отправьте /moi_zapisi\n"
-                 "Для переноса приема отправьте /perenesti"
+                 "Для переноса приема отправьте /perenos\n"
                  "Для отмены приема отправьте /otmena\n\n"
                  "Если что-то пошло не так, вы всегда можете перезапустить бота командой /start"
 }
\ No newline at end of file
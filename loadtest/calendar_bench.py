@@ -0,0 +1,77 @@
+"""Микробенчмарк клавиатуры календаря: время сборки и выделения памяти без кэша и с кэшем.
+
+«Без кэша» — сборка клавиатуры при каждом запросе, как до мемоизации (_build_calendar_markup.__wrapped__),
+«с кэшем» — вызов через lru_cache, как в get_calendar_markup при неизменной занятости. Занятость
+синтетическая, БД не нужна.
+
+Пример:
+    python -m loadtest.calendar_bench --calls 20000
+"""
+import argparse
+import calendar
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import Callable
+
+from dateutil.relativedelta import relativedelta
+
+from services.services import _build_calendar_markup
+
+Availability = tuple[tuple[date, int], ...]
+
+
+def month_availability(today: date, month_shift: int) -> Availability:
+    """Свободные слоты по будним дням месяца, как их возвращает get_month_availability."""
+    first_day = today.replace(day=1) + relativedelta(months=month_shift)
+    days = calendar.monthrange(first_day.year, first_day.month)[1]
+    return tuple((day, (day.day * 7) % 19) for day in (first_day + timedelta(days=n) for n in range(days))
+                 if day.weekday() < 5)
+
+
+def measure(build: Callable[[date, int, Availability], object], calls: int,
+            requests: list[tuple[date, int, Availability]]) -> tuple[float, float, float]:
+    """Микросекунд на вызов, байт и блоков памяти, выделенных за вызов."""
+    started = time.perf_counter()
+    for n in range(calls):
+        build(*requests[n % len(requests)])
+    per_call = (time.perf_counter() - started) / calls * 1e6
+
+    # Выделения считаются отдельным проходом: tracemalloc сильно замедляет код. Результаты
+    # удерживаются до снимка, иначе освобожденная клавиатура не попадет в разницу снимков
+    sample = min(calls, 1000)
+    built = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for n in range(sample):
+        built.append(build(*requests[n % len(requests)]))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    size = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    return per_call, size / sample, blocks / sample
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Время сборки и выделения памяти клавиатуры календаря")
+    parser.add_argument("--calls", type=int, default=20_000, help="Вызовов на замер")
+    parser.add_argument("--months", type=int, default=3, help="Сколько месяцев листают пользователи")
+    args = parser.parse_args()
+
+    today = date.today()
+    requests = [(today, shift, month_availability(today, shift)) for shift in range(args.months)]
+    _build_calendar_markup.cache_clear()
+
+    print(f"Вызовов: {args.calls}, месяцев: {args.months}")
+    print(f"{'сборка':<12}{'мкс/вызов':>12}{'байт/вызов':>12}{'блоков/вызов':>14}")
+    results = {}
+    for label, build in (("без кэша", _build_calendar_markup.__wrapped__), ("с кэшем", _build_calendar_markup)):
+        results[label] = measure(build, args.calls, requests)
+        per_call, size, blocks = results[label]
+        print(f"{label:<12}{per_call:>12.2f}{size:>12.0f}{blocks:>14.1f}")
+    print(f"Ускорение: {results['без кэша'][0] / results['с кэшем'][0]:.0f}x, {_build_calendar_markup.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""Нагрузочный прогон воронки записи: /zapis -> врач -> календарь -> время -> имя и телефон.
+
+Диспетчер из main.py работает как в проде (middleware, FSM, БД), а запросы к Bot API уходят
+на локальный фейковый сервер. Нужна локальная БД с миграциями и расписанием (timetable).
+
+Пример:
+    alembic upgrade head
+    python -m timetable.timetable slots --doctor 1 --weekdays 0-4 --start 09:00 --end 18:00 --slot 30
+    python -m loadtest.loadtest --users 2000 --concurrency 500 --days 3 --cleanup
+
+Замер времени старта: каждый запуск — новый процесс, который собирает приложение через
+main.create_app, синхронизирует настройки бота и обрабатывает первый апдейт (/start):
+    python -m loadtest.loadtest --startup 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+# Настройки, без которых прогон упрется в лимиты, задаются до импорта config
+FIRST_USER_ID = 7_000_000_000
+os.environ.setdefault("METRICS_ENABLED", "true")
+os.environ.setdefault("RATE_LIMIT", "1000")
+os.environ.setdefault("RATE_BURST", "1000")
+os.environ.setdefault("FSM_STORAGE", "memory")
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.dispatcher.dispatcher import Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from sqlalchemy import delete, select
+
+from callbacks.callbacks import Action, decode
+from config.config import get_settings
+from db.db import async_session, close_db
+from db.models.models import Appointment, User
+from main import create_app, create_dispatcher, sync_bot_settings
+from metrics.metrics import db_query_latency
+from middleware.middleware import PermissionMiddleware
+
+
+@dataclass
+class Chat:
+    """Последнее сообщение бота в чате пользователя."""
+    message_id: int = 0
+    text: str = ""
+    reply_markup: Optional[dict] = None
+    # time.perf_counter() последнего сообщения
+    updated_at: float = 0.0
+
+
+class FakeBotAPI:
+    """Минимальный Bot API: отвечает на методы, которые вызывает бот, и запоминает сообщения по чатам."""
+
+    def __init__(self):
+        self.chats: dict[int, Chat] = {}
+        self.calls = 0
+        self._message_id = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        method = request.match_info["method"].lower()
+        form = await request.post()
+        result: Any = True
+
+        if method in ("sendmessage", "editmessagetext", "editmessagereplymarkup"):
+            chat_id = int(form["chat_id"])
+            chat = self.chats.setdefault(chat_id, Chat())
+            if method == "sendmessage":
+                self._message_id += 1
+                chat.message_id = self._message_id
+            if "text" in form:
+                chat.text = form["text"]
+            chat.reply_markup = json.loads(form["reply_markup"]) if "reply_markup" in form else None
+            chat.updated_at = time.perf_counter()
+            result = {"message_id": chat.message_id, "date": int(time.time()), "text": chat.text,
+                      "chat": {"id": chat_id, "type": "private"}}
+        elif method == "getme":
+            result = {"id": int(request.match_info["token"].split(":")[0]), "is_bot": True,
+                      "first_name": "loadtest", "username": "loadtest_bot"}
+
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str, port: int) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host=host, port=port).start()
+        return runner
+
+
+@dataclass
+class StepStats:
+    latencies: list[float] = field(default_factory=list)
+    queries: int = 0
+    wall: float = 0.0
+
+
+class LoadTest:
+    def __init__(self, users: int, concurrency: int, days: int, seed: int, api_url: str):
+        self.users = users
+        self.days = days
+        self.random = random.Random(seed)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.dp = create_dispatcher()
+        allow_users(self.dp, users)
+        self.bot = Bot(token="123456:LOADTEST", parse_mode="HTML",
+                       session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+        self.api = FakeBotAPI()
+        self.steps: dict[str, StepStats] = {}
+        self.update_id = 0
+        self.booked = 0
+        self.conflicts = 0
+        self.no_slots = 0
+        self.errors: dict[str, int] = {}
+
+    def _next_update_id(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    async def send_text(self, user_id: int, text: str) -> None:
+        await self.dp.feed_update(self.bot, message_update(self.bot, self._next_update_id(), user_id, text))
+
+    async def press(self, user_id: int, data: str) -> None:
+        chat = self.api.chats[user_id]
+        raw = {"update_id": self._next_update_id(),
+               "callback_query": {"id": str(self.update_id), "chat_instance": str(user_id), "data": data,
+                                  "from": _user(user_id),
+                                  "message": {"message_id": chat.message_id, "date": int(time.time()),
+                                              "text": chat.text, "chat": {"id": user_id, "type": "private"}}}}
+        await self.dp.feed_update(self.bot, Update.model_validate(raw, context={"bot": self.bot}))
+
+    def buttons(self, user_id: int, action: Action) -> list[str]:
+        markup = self.api.chats[user_id].reply_markup or {}
+        # Полностью занятые дни календаря («·d·») пропускаем
+        return [button["callback_data"] for row in markup.get("inline_keyboard", []) for button in row
+                if "callback_data" in button and decode(button["callback_data"])[0] == action
+                and not button["text"].startswith("·")]
+
+    async def user_step(self, step: str, user_id: int) -> bool:
+        """Один шаг воронки для пользователя; False — пользователь выбыл."""
+        async with self.semaphore:
+            started = time.perf_counter()
+            try:
+                if step == "zapis":
+                    await self.send_text(user_id, "/zapis")
+                elif step == "doctor":
+                    doctors = self.buttons(user_id, Action.DOCTOR)
+                    if doctors:
+                        await self.press(user_id, self.random.choice(doctors))
+                elif step == "date":
+                    dates = self.buttons(user_id, Action.CALENDAR_DAY)
+                    if not dates:
+                        self.no_slots += 1
+                        return False
+                    # Пользователи выбирают из нескольких ближайших дат, чтобы была конкуренция за слоты
+                    await self.press(user_id, self.random.choice(dates[:self.days]))
+                elif step == "time":
+                    timeslots = self.buttons(user_id, Action.TIMESLOT)
+                    if not timeslots:
+                        self.no_slots += 1
+                        return False
+                    await self.press(user_id, self.random.choice(timeslots))
+                else:
+                    await self.send_text(user_id, f"Пользователь {user_id} +7900{user_id % 10_000_000:07d}")
+                    if "уже занято" in self.api.chats[user_id].text:
+                        self.conflicts += 1
+                    else:
+                        self.booked += 1
+                return True
+            except Exception as e:
+                # Перегрузка (например, таймаут пула соединений) — результат прогона, а не его сбой
+                name = type(e).__name__
+                self.errors[name] = self.errors.get(name, 0) + 1
+                return False
+            finally:
+                self.steps[step].latencies.append(time.perf_counter() - started)
+
+    async def run(self) -> float:
+        started = time.perf_counter()
+        active = list(range(FIRST_USER_ID, FIRST_USER_ID + self.users))
+        # Шаги идут волнами: все пользователи делают шаг одновременно, так запросы к БД
+        # однозначно относятся к шагу воронки
+        for step in ("zapis", "doctor", "date", "time", "contacts"):
+            stats = self.steps[step] = StepStats()
+            queries_before = _query_count()
+            step_started = time.perf_counter()
+            results = await asyncio.gather(*(self.user_step(step, user_id) for user_id in active))
+            stats.wall = time.perf_counter() - step_started
+            stats.queries = _query_count() - queries_before
+            active = [user_id for user_id, ok in zip(active, results) if ok]
+        return time.perf_counter() - started
+
+    def report(self, total_wall: float) -> None:
+        print(f"Пользователей: {self.users}, время прогона: {total_wall:.2f} с, вызовов Bot API: {self.api.calls}")
+        print(f"{'шаг':<10}{'апдейтов':>10}{'апд/с':>10}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}"
+              f"{'запросов':>10}{'на апдейт':>11}")
+        total_updates = 0
+        for step, stats in self.steps.items():
+            count = len(stats.latencies)
+            total_updates += count
+            if not count:
+                continue
+            print(f"{step:<10}{count:>10}{count / stats.wall:>10.1f}"
+                  f"{_percentile(stats.latencies, 0.5) * 1000:>10.1f}{_percentile(stats.latencies, 0.95) * 1000:>10.1f}"
+                  f"{_percentile(stats.latencies, 0.99) * 1000:>10.1f}{stats.queries:>10}{stats.queries / count:>11.2f}")
+        attempts = self.booked + self.conflicts
+        print(f"Всего апдейтов: {total_updates}, {total_updates / total_wall:.1f} апд/с")
+        print(f"Записано: {self.booked}, конфликтов: {self.conflicts} "
+              f"({self.conflicts / attempts * 100 if attempts else 0:.1f}%), без свободных слотов: {self.no_slots}")
+        if self.errors:
+            print("Ошибок: " + ", ".join(f"{name} {count}" for name, count in sorted(self.errors.items())))
+
+
+def allow_users(dp: Dispatcher, users: int) -> None:
+    """Пускает пользователей прогона мимо ALLOWED_IDS."""
+    user_ids = frozenset(range(FIRST_USER_ID, FIRST_USER_ID + users))
+    for middleware in dp.update.outer_middleware:
+        if isinstance(middleware, PermissionMiddleware):
+            middleware.static_ids |= user_ids
+            middleware.allowed_ids |= user_ids
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def message_raw(update_id: int, user_id: int, text: str) -> dict:
+    """Апдейт с текстовым сообщением в том виде, в каком его присылает Telegram."""
+    return {"update_id": update_id,
+            "message": {"message_id": 1, "date": int(time.time()), "text": text, "from": _user(user_id),
+                        "chat": {"id": user_id, "type": "private"}}}
+
+
+def message_update(bot: Bot, update_id: int, user_id: int, text: str) -> Update:
+    return Update.model_validate(message_raw(update_id, user_id, text), context={"bot": bot})
+
+
+def _query_count() -> int:
+    return sum(series[2] for series in db_query_latency.series.values())
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def cleanup(users: int) -> None:
+    """Удаляет записи и пользователей, созданных прогоном."""
+    user_ids = select(User.id).where(User.telegram_id.between(FIRST_USER_ID, FIRST_USER_ID + users - 1))
+    async with async_session() as session, session.begin():
+        await session.execute(delete(Appointment).where(Appointment.user_pk.in_(user_ids)))
+        await session.execute(delete(User).where(User.telegram_id.between(FIRST_USER_ID, FIRST_USER_ID + users - 1)))
+
+
+async def run(args: argparse.Namespace) -> None:
+    load_test = LoadTest(args.users, args.concurrency, args.days, args.seed, f"http://{args.host}:{args.port}")
+    runner = await load_test.api.start(args.host, args.port)
+    try:
+        total_wall = await load_test.run()
+        load_test.report(total_wall)
+    finally:
+        if args.cleanup:
+            await cleanup(args.users)
+        await load_test.bot.session.close()
+        await runner.cleanup()
+
+
+async def startup_child(api_url: str) -> None:
+    """Один запуск бота: время от старта процесса (LOADTEST_T0 от родителя) до обработки первого апдейта."""
+    imported_at = time.time()
+    config = get_settings()
+    bot, dp = create_app(config, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+    allow_users(dp, 1)
+    await sync_bot_settings(bot, dp, config)
+    ready_at = time.time()
+    await dp.feed_update(bot, message_update(bot, 1, FIRST_USER_ID, "/start"))
+    done_at = time.time()
+    await bot.session.close()
+    await close_db()
+
+    started_at = float(os.environ["LOADTEST_T0"])
+    print(json.dumps({"imports": imported_at - started_at, "startup": ready_at - imported_at,
+                      "first_update": done_at - ready_at, "total": done_at - started_at}))
+
+
+async def startup_benchmark(runs: int, host: str, port: int) -> None:
+    api = FakeBotAPI()
+    runner = await api.start(host, port)
+    phases = ("imports", "startup", "first_update", "total")
+    results = {phase: [] for phase in phases}
+    # Общий кэш настроек бота: первый запуск отправляет меню команд, остальные его пропускают
+    cache_path = os.path.join(tempfile.mkdtemp(), "startup_cache.json")
+    try:
+        for run_number in range(runs):
+            calls_before = api.calls
+            env = dict(os.environ, LOADTEST_T0=str(time.time()), STARTUP_CACHE_PATH=cache_path)
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "loadtest.loadtest", "--startup-child", "--host", host, "--port", str(port),
+                env=env, stdout=asyncio.subprocess.PIPE,
+            )
+            stdout, _ = await process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(f"Startup run {run_number + 1} failed with code {process.returncode}")
+            timings = json.loads(stdout.decode().strip().splitlines()[-1])
+            for phase in phases:
+                results[phase].append(timings[phase])
+            print(f"Запуск {run_number + 1}: " + ", ".join(f"{phase} {timings[phase] * 1000:.0f} мс" for phase in phases)
+                  + f", вызовов Bot API: {api.calls - calls_before}")
+    finally:
+        await runner.cleanup()
+
+    for label, q in (("p50", 0.5), ("max", 1.0)):
+        print(f"{label}: " + ", ".join(f"{phase} {_percentile(results[phase], q) * 1000:.0f} мс" for phase in phases))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон воронки записи")
+    parser.add_argument("--users", type=int, default=1000, help="Число пользователей")
+    parser.add_argument("--concurrency", type=int, default=200, help="Одновременно обрабатываемых апдейтов")
+    parser.add_argument("--days", type=int, default=3, help="Из скольких ближайших дат выбирают пользователи")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1", help="Адрес фейкового Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--cleanup", action="store_true", help="Удалить созданные записи и пользователей после прогона")
+    parser.add_argument("--startup", type=int, metavar="RUNS", help="Замерить время старта до первого апдейта")
+    parser.add_argument("--startup-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_child:
+        asyncio.run(startup_child(f"http://{args.host}:{args.port}"))
+    elif args.startup:
+        asyncio.run(startup_benchmark(args.startup, args.host, args.port))
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
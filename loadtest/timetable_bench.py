@@ -0,0 +1,101 @@
+"""Замер генерации расписания на год для нескольких врачей.
+
+Создает --doctors врачей, применяет к каждому шаблон (Пн-Пт, --start..--end, слот --slot минут,
+перерыв 13:00-14:00) и замеряет:
+- генерацию слотов шаблона в памяти (generate_timeslots);
+- первое применение шаблона (INSERT слотов) и повторное (upsert без изменений);
+- расписание на год: свободные слоты каждого врача по всем датам года (get_month_availability),
+  с учетом нерабочих дней.
+
+Врачи и нерабочие дни замера удаляются после прогона. Нужна локальная БД с миграциями.
+
+Пример:
+    python -m loadtest.timetable_bench --doctors 50 --slot 15
+"""
+import argparse
+import asyncio
+import time as perf_time
+from datetime import date, time
+from typing import Awaitable, Callable
+
+from sqlalchemy import delete
+
+from db.db import async_session, close_db, get_month_availability
+from db.models.models import DayOff, Doctor
+from timetable.timetable import ScheduleTemplate, add_days_off, add_doctor, apply_template, generate_timeslots
+
+# Врачи замера, чтобы не пересекаться с настоящими
+DOCTOR_PREFIX = "Замер расписания"
+# Год расписания: далеко впереди, чтобы нерабочие дни замера не задели настоящие
+BENCH_YEAR = 2090
+HOLIDAYS = [(date(BENCH_YEAR, 1, 1), date(BENCH_YEAR, 1, 8)), (date(BENCH_YEAR, 5, 1), date(BENCH_YEAR, 5, 3))]
+
+
+def templates(doctor_pks: list[int], args: argparse.Namespace) -> list[ScheduleTemplate]:
+    return [ScheduleTemplate(doctor_pk=doctor_pk, weekdays=[0, 1, 2, 3, 4], work_start=args.start, work_end=args.end,
+                             slot_minutes=args.slot, breaks=[(time(13), time(14))])
+            for doctor_pk in doctor_pks]
+
+
+async def timed(stage: Callable[[], Awaitable[int]]) -> tuple[int, float]:
+    started = perf_time.perf_counter()
+    count = await stage()
+    return count, perf_time.perf_counter() - started
+
+
+async def cleanup() -> None:
+    async with async_session() as session, session.begin():
+        await session.execute(delete(Doctor).where(Doctor.name.startswith(DOCTOR_PREFIX)))
+        await session.execute(delete(DayOff).where(DayOff.day.between(date(BENCH_YEAR, 1, 1), date(BENCH_YEAR, 12, 31))))
+
+
+async def run(args: argparse.Namespace) -> None:
+    await cleanup()
+    doctor_pks = [await add_doctor(f"{DOCTOR_PREFIX} {n}") for n in range(args.doctors)]
+    for first_day, last_day in HOLIDAYS:
+        await add_days_off(first_day, last_day, "Замер расписания")
+    doctor_templates = templates(doctor_pks, args)
+
+    async def generate() -> int:
+        return sum(len(generate_timeslots(template)) for template in doctor_templates)
+
+    async def apply() -> int:
+        return sum([(await apply_template(template)).written for template in doctor_templates])
+
+    async def year() -> int:
+        first_day, last_day = date(BENCH_YEAR, 1, 1), date(BENCH_YEAR, 12, 31)
+        return sum([sum((await get_month_availability(doctor_pk, first_day, last_day)).values())
+                    for doctor_pk in doctor_pks])
+
+    try:
+        results = [
+            ("слоты шаблона в памяти", *await timed(generate)),
+            ("первое применение", *await timed(apply)),
+            ("повторное применение", *await timed(apply)),
+            (f"расписание на {BENCH_YEAR} год", *await timed(year)),
+        ]
+    finally:
+        await cleanup()
+        await close_db()
+
+    print(f"Врачей: {args.doctors}, шаблон Пн-Пт {args.start:%H:%M}-{args.end:%H:%M}, слот {args.slot} мин")
+    print(f"{'этап':<28}{'слотов':>10}{'мс':>10}{'слотов/с':>12}")
+    for label, count, elapsed in results:
+        print(f"{label:<28}{count:>10}{elapsed * 1000:>10.1f}{count / elapsed:>12.0f}")
+
+
+def _parse_time(value: str) -> time:
+    return time.fromisoformat(value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Генерация расписания на год для нескольких врачей")
+    parser.add_argument("--doctors", type=int, default=50, help="Число врачей")
+    parser.add_argument("--start", type=_parse_time, default=time(8), help="Начало приема, ЧЧ:ММ")
+    parser.add_argument("--end", type=_parse_time, default=time(20), help="Конец приема, ЧЧ:ММ")
+    parser.add_argument("--slot", type=int, default=15, help="Длительность слота в минутах")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
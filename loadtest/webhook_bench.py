@@ -0,0 +1,174 @@
+"""Сравнение приема апдейтов вебхуком и long polling'ом: задержка обработки и предельная пропускная способность.
+
+Бот собирается через main.create_app и отвечает фейковому Bot API из loadtest.loadtest. Каждый
+апдейт — /zapis от нового пользователя, задержка — время от отправки апдейта (POST на вебхук или
+появления в getUpdates) до ответа бота этому пользователю.
+
+Для каждого режима два прогона:
+- с постоянным темпом --rate апдейтов в секунду — p50/p99 задержки;
+- все апдейты сразу — предельное число апдейтов в секунду.
+
+Клиент, бот и фейковый Bot API работают в одном процессе, поэтому абсолютные числа ниже, чем
+у отдельно запущенного бота; сравнивать стоит режимы между собой. Нужна локальная БД
+с миграциями и расписанием (см. loadtest.loadtest).
+
+Пример:
+    python -m loadtest.webhook_bench --updates 2000 --rate 50 --cleanup
+"""
+import argparse
+import asyncio
+import time
+from contextlib import suppress
+from dataclasses import replace
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import ClientSession, web
+
+from config.config import get_settings
+from db.db import close_db
+from loadtest.loadtest import FIRST_USER_ID, FakeBotAPI, _percentile, allow_users, cleanup, message_raw
+from main import create_app
+from webhook.webhook import create_webhook_app
+
+# Прогон завершается, если столько секунд не приходит новых ответов: оставшиеся апдейты считаются
+# потерянными (например, обработка упала по таймауту пула соединений)
+STALL_TIMEOUT = 30
+
+
+class PollingBotAPI(FakeBotAPI):
+    """Фейковый Bot API, который отдает апдейты через getUpdates."""
+
+    def __init__(self):
+        super().__init__()
+        self.pending: list[dict] = []
+        self.has_updates = asyncio.Event()
+
+    def enqueue(self, raw: dict) -> None:
+        self.pending.append(raw)
+        self.has_updates.set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if request.match_info["method"].lower() != "getupdates":
+            return await super().handle(request)
+
+        form = await request.post()
+        offset = int(form.get("offset") or 0)
+        self.pending = [raw for raw in self.pending if raw["update_id"] >= offset]
+        if not self.pending:
+            self.has_updates.clear()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.has_updates.wait(), float(form.get("timeout") or 0))
+        return web.json_response({"ok": True, "result": self.pending[:100]})
+
+
+class Bench:
+    """Один бот на оба режима: роутеры хендлеров подключаются только к одному диспетчеру за процесс."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.update_id = 0
+        self.api = PollingBotAPI()
+        api_url = f"http://{args.host}:{args.api_port}"
+        self.bot, self.dp = create_app(get_settings(), session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+        allow_users(self.dp, args.updates)
+
+    def next_update(self, user_id: int) -> dict:
+        self.update_id += 1
+        return message_raw(self.update_id, user_id, "/zapis")
+
+    async def send_all(self, send, rate: float) -> dict[int, float]:
+        """Отправляет по апдейту от каждого пользователя с темпом rate (0 — все сразу); время отправки по пользователям."""
+        sent_at: dict[int, float] = {}
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        started = time.perf_counter()
+
+        async def send_one(n: int, user_id: int) -> None:
+            if rate:
+                await asyncio.sleep(max(0.0, started + n / rate - time.perf_counter()))
+            async with semaphore:
+                sent_at[user_id] = time.perf_counter()
+                await send(self.next_update(user_id))
+
+        await asyncio.gather(*(send_one(n, FIRST_USER_ID + n) for n in range(self.args.updates)))
+        return sent_at
+
+    async def measure(self, send, rate: float) -> tuple[float, list[float], int]:
+        """Апдейтов в секунду, задержки обработки (с) и число апдейтов без ответа за один прогон."""
+        api = self.api
+        api.chats.clear()
+        sent_at = await self.send_all(send, rate)
+        answered, progress_at = 0, time.perf_counter()
+        while len(api.chats) < len(sent_at) and time.perf_counter() - progress_at < STALL_TIMEOUT:
+            if len(api.chats) != answered:
+                answered, progress_at = len(api.chats), time.perf_counter()
+            await asyncio.sleep(0.01)
+        latencies = [api.chats[user_id].updated_at - sent for user_id, sent in sent_at.items() if user_id in api.chats]
+        wall = max(chat.updated_at for chat in api.chats.values()) - min(sent_at.values())
+        return len(latencies) / wall, latencies, len(sent_at) - len(latencies)
+
+    async def run_webhook(self) -> list[tuple[str, float, list[float], int]]:
+        webhook_settings = replace(get_settings().webhook, secret="")
+        runner = web.AppRunner(create_webhook_app(self.bot, self.dp, webhook_settings), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host=self.args.host, port=self.args.webhook_port).start()
+        url = f"http://{self.args.host}:{self.args.webhook_port}{webhook_settings.path}"
+        try:
+            async with ClientSession() as client:
+                async def send(raw: dict) -> None:
+                    async with client.post(url, json=raw) as response:
+                        response.raise_for_status()
+
+                return [(f"webhook, {self.args.rate:g}/с", *await self.measure(send, self.args.rate)),
+                        ("webhook, все сразу", *await self.measure(send, 0))]
+        finally:
+            await runner.cleanup()
+
+    async def run_polling(self) -> list[tuple[str, float, list[float], int]]:
+        polling = asyncio.create_task(self.dp.start_polling(self.bot, polling_timeout=10, handle_signals=False,
+                                                            close_bot_session=False))
+
+        async def send(raw: dict) -> None:
+            self.api.enqueue(raw)
+
+        try:
+            return [(f"polling, {self.args.rate:g}/с", *await self.measure(send, self.args.rate)),
+                    ("polling, все сразу", *await self.measure(send, 0))]
+        finally:
+            await self.dp.stop_polling()
+            await polling
+
+
+async def run(args: argparse.Namespace) -> None:
+    bench = Bench(args)
+    api_runner = await bench.api.start(args.host, args.api_port)
+    try:
+        results = await bench.run_webhook() + await bench.run_polling()
+    finally:
+        await bench.bot.session.close()
+        await api_runner.cleanup()
+        if args.cleanup:
+            await cleanup(args.updates)
+        await close_db()
+
+    print(f"Апдейтов /zapis в прогоне: {args.updates}")
+    print(f"{'режим':<22}{'апд/с':>10}{'p50, мс':>10}{'p99, мс':>10}{'без ответа':>12}")
+    for label, rate, latencies, lost in results:
+        print(f"{label:<22}{rate:>10.1f}{_percentile(latencies, 0.5) * 1000:>10.1f}"
+              f"{_percentile(latencies, 0.99) * 1000:>10.1f}{lost:>12}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Вебхук против long polling: задержка и пропускная способность")
+    parser.add_argument("--updates", type=int, default=2000, help="Апдейтов в одном прогоне")
+    parser.add_argument("--rate", type=float, default=50, help="Темп прогона для замера задержки, апдейтов в секунду")
+    parser.add_argument("--concurrency", type=int, default=100, help="Одновременных POST на вебхук")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--api-port", type=int, default=8081, help="Порт фейкового Bot API")
+    parser.add_argument("--webhook-port", type=int, default=8083, help="Порт вебхука бота")
+    parser.add_argument("--cleanup", action="store_true", help="Удалить созданных пользователей после прогона")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
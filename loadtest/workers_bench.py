@@ -0,0 +1,137 @@
+"""Замер пропускной способности воркеров (WORKERS > 1) в зависимости от их числа.
+
+Для каждого числа воркеров очереди в Redis заполняются апдейтами /zapis от разных пользователей,
+воркеры запускаются так же, как в main (worker.start_worker), и замеряется время до ответа на
+все апдейты. Ответы уходят на фейковый Bot API (BOT_API_URL). Нужны Redis, локальная БД
+с миграциями и расписанием (см. loadtest.loadtest).
+
+Пользователи замера создаются администраторами: к боту их пускает load_db_admins, который
+выполняется при старте каждого воркера.
+
+Пример:
+    python -m loadtest.workers_bench --workers 1 2 4 --updates 4000
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+# Настройки, без которых прогон упрется в лимиты, задаются до импорта config
+os.environ.setdefault("METRICS_ENABLED", "false")
+os.environ.setdefault("RATE_LIMIT", "1000")
+os.environ.setdefault("RATE_BURST", "1000")
+os.environ["FSM_STORAGE"] = "redis"
+
+from aiogram.types import Update
+from redis.asyncio import Redis
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+
+from config.config import get_settings
+from db.db import async_session, close_db
+from db.models.models import User
+from loadtest.loadtest import FakeBotAPI, message_raw
+from main import create_dispatcher
+from worker.worker import queue_key, shard_for, start_worker
+
+# Синтетические пользователи замера, чтобы не пересекаться с настоящими
+FIRST_USER_ID = 7_100_000_000
+# Сколько ждать ответа на все апдейты одного прогона, секунд
+RUN_TIMEOUT = 600
+
+
+async def create_users(users: int) -> None:
+    async with async_session() as session, session.begin():
+        await session.execute(
+            insert(User).on_conflict_do_update(index_elements=[User.telegram_id], set_={"is_admin": True}),
+            [{"telegram_id": FIRST_USER_ID + n, "is_admin": True} for n in range(users)],
+        )
+
+
+async def cleanup(users: int) -> None:
+    async with async_session() as session, session.begin():
+        await session.execute(delete(User).where(User.telegram_id.between(FIRST_USER_ID, FIRST_USER_ID + users - 1)))
+
+
+async def wait_replies(api: FakeBotAPI, user_ids: list[int], timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while not all(user_id in api.chats for user_id in user_ids):
+        if time.perf_counter() > deadline:
+            missing = sum(user_id not in api.chats for user_id in user_ids)
+            raise TimeoutError(f"{missing} of {len(user_ids)} updates unanswered after {timeout:.0f} s")
+        await asyncio.sleep(0.02)
+
+
+async def push(redis: Redis, updates: list[dict], workers: int) -> None:
+    pipe = redis.pipeline(transaction=False)
+    for raw in updates:
+        pipe.lpush(queue_key(shard_for(Update.model_validate(raw), workers)), json.dumps(raw))
+    await pipe.execute()
+
+
+async def bench_workers(workers: int, user_ids: list[int], api: FakeBotAPI, redis: Redis, update_id: int) -> float:
+    """Апдейтов в секунду при заданном числе воркеров."""
+    await redis.delete(*(queue_key(shard) for shard in range(workers)))
+    api.chats.clear()
+    processes = [start_worker(shard, create_dispatcher) for shard in range(workers)]
+    try:
+        # Прогрев: по апдейту на каждый воркер (id подряд попадают во все очереди), чтобы в замер
+        # не попали запуск процессов и первые соединения
+        warmup_ids = [FIRST_USER_ID + n for n in range(workers)]
+        await push(redis, [message_raw(update_id + n, user_id, "/zapis") for n, user_id in enumerate(warmup_ids)], workers)
+        await wait_replies(api, warmup_ids, RUN_TIMEOUT)
+        update_id += workers
+
+        api.chats.clear()
+        started = time.perf_counter()
+        await push(redis, [message_raw(update_id + n, user_id, "/zapis") for n, user_id in enumerate(user_ids)], workers)
+        await wait_replies(api, user_ids, RUN_TIMEOUT)
+        return len(user_ids) / (time.perf_counter() - started)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+async def run(args: argparse.Namespace) -> None:
+    settings = get_settings()
+    # Первые max(workers) пользователей — для прогрева, остальные — по одному апдейту в замере
+    users = max(args.workers) + args.updates
+    user_ids = [FIRST_USER_ID + n for n in range(max(args.workers), users)]
+    api = FakeBotAPI()
+    runner = await api.start(args.host, args.port)
+    redis = Redis.from_url(settings.storage.redis_url)
+    await create_users(users)
+    try:
+        print(f"Апдейтов /zapis в прогоне: {args.updates}, WORKER_MAX_CONCURRENCY={settings.workers.max_concurrency}")
+        print(f"{'воркеров':<10}{'апд/с':>10}{'ускорение':>11}")
+        baseline = None
+        update_id = 1
+        for workers in args.workers:
+            rate = await bench_workers(workers, user_ids, api, redis, update_id)
+            update_id += args.updates + workers
+            baseline = baseline or rate
+            print(f"{workers:<10}{rate:>10.1f}{rate / baseline:>10.2f}x")
+    finally:
+        await cleanup(users)
+        await redis.aclose()
+        await runner.cleanup()
+        await close_db()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пропускная способность воркеров в зависимости от их числа")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Числа воркеров для замера")
+    parser.add_argument("--updates", type=int, default=2000, help="Апдейтов в одном прогоне")
+    parser.add_argument("--host", default="127.0.0.1", help="Адрес фейкового Bot API")
+    parser.add_argument("--port", type=int, default=8082)
+    args = parser.parse_args()
+    # Воркеры — отдельные процессы: адрес фейкового Bot API они получают через окружение
+    os.environ["BOT_API_URL"] = f"http://{args.host}:{args.port}"
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
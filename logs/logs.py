@@ -0,0 +1,60 @@
+import json
+import logging
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from config.config import LoggSettings
+
+
+# Идентификатор апдейта, в рамках которого пишется лог; выставляет CorrelationIdMiddleware
+correlation_id: ContextVar[str] = ContextVar("correlation_id", default="-")
+
+# Стандартные атрибуты LogRecord, все остальные попадают в JSON как extra-поля
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class CorrelationIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(log_settings: LoggSettings) -> QueueListener:
+    """Настраивает логирование через очередь.
+
+    Хендлеры event loop'а только кладут запись в очередь, форматирование и запись
+    в stdout выполняет отдельный поток QueueListener.
+    """
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if log_settings.json else logging.Formatter(log_settings.format))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    # correlation_id читается здесь, в потоке event loop'а, а не в потоке listener'а
+    queue_handler.addFilter(CorrelationIdFilter())
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(queue_handler)
+    root.setLevel(logging.getLevelName(log_settings.level))
+
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -1,42 +1,179 @@
 import sys
 import asyncio
+import json
 import logging
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.base import BaseSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
-from config.config import settings
-from handlers import handlers
-from keyboard.set_mainmenu import set_main_menu
-from middleware.middleware import PermissionMiddleware
+from aiogram.fsm.storage.redis import RedisStorage
+from redis.asyncio import Redis
+from config.config import Config, get_settings
+from db.db import close_db, init_db, listen_schedule_changes, slot_freed_hooks
+from degraded.degraded import DegradedMode
+from handlers import admin, handlers
+from keyboard.set_mainmenu import main_menu_hash, set_main_menu
+from logs.logs import setup_logging
+from metrics.metrics import TimedStorage, run_metrics
+from middleware.middleware import (CorrelationIdMiddleware, DedupMiddleware, MetricsMiddleware, PermissionMiddleware,
+                                   UserLockMiddleware, UserMiddleware)
+from reminder.reminder import ReminderScheduler
+from waitlist.waitlist import WaitlistNotifier
+from webhook.webhook import run_webhook, set_webhook
+from worker.worker import produce_updates, start_workers, supervise_workers
 
 
+logger = logging.getLogger(__name__)
+
 if sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-async def main() -> None:
-    logging.basicConfig(
-        level=logging.getLevelName(level=settings.log.level),
-        format=settings.log.format,
-    )
+def create_storage(config: Config) -> BaseStorage:
+    if config.storage.type == "redis":
+        storage = RedisStorage.from_url(config.storage.redis_url)
+    else:
+        storage = MemoryStorage()
+    return TimedStorage(storage) if config.metrics.enabled else storage
 
-    bot: Bot = Bot(token=settings.bot.token, parse_mode="HTML")
-    storage: MemoryStorage = MemoryStorage()
-    dp: Dispatcher = Dispatcher(storage=storage)
+async def start_schedule_listener(dispatcher: Dispatcher) -> None:
+    # Кэши расписания есть у каждого процесса, обрабатывающего апдейты, и сбрасываются по NOTIFY из timetable
+    dispatcher["schedule_listener"] = asyncio.create_task(listen_schedule_changes())
 
+async def stop_schedule_listener(dispatcher: Dispatcher) -> None:
+    task = dispatcher.workflow_data.pop("schedule_listener", None)
+    if task is not None:
+        task.cancel()
 
-    await set_main_menu(bot)
+def create_dispatcher(config: Config | None = None) -> Dispatcher:
+    config = config or get_settings()
+    dp: Dispatcher = Dispatcher(storage=create_storage(config))
+    dp.include_router(admin.router)
     dp.include_router(handlers.router)
-    dp.update.outer_middleware(PermissionMiddleware())
+    permission_middleware = PermissionMiddleware(config.access, config.bot.admin_ids)
+    dp.startup.register(permission_middleware.load_db_admins)
+    dp.startup.register(start_schedule_listener)
+    dp.shutdown.register(stop_schedule_listener)
+    dedup_redis = Redis.from_url(config.storage.redis_url) if config.dedup.shared else None
+    if dedup_redis is not None:
+        dp.shutdown.register(dedup_redis.aclose)
+    dp.update.outer_middleware(CorrelationIdMiddleware())
+    # Дубли отбрасываются до rate limiter'а, чтобы не расходовать лимит пользователя
+    dp.update.outer_middleware(DedupMiddleware(config.dedup, dedup_redis))
+    dp.update.outer_middleware(permission_middleware)
+    dp.update.outer_middleware(UserLockMiddleware())
+    dp.update.outer_middleware(UserMiddleware())
+    if config.metrics.enabled:
+        # Inner middleware наследуется вложенными роутерами, поэтому видит все хендлеры
+        dp.message.middleware(MetricsMiddleware())
+        dp.callback_query.middleware(MetricsMiddleware())
     #dp.callback_query.middleware(RegistrationCheck)
     #dp.message.middleware(PermissionCheck)
     #dp.callback_query.middleware(PermissionCheck)
+    return dp
 
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+def create_app(config: Config, session: BaseSession | None = None) -> tuple[Bot, Dispatcher]:
+    """Собирает бота явно из конфигурации: движок БД, хранилище FSM и роутеры.
 
+    Хуки БД (slot_freed_hooks) регистрирует процесс, который обрабатывает апдейты.
+    """
+    init_db(config.db, instrument=config.metrics.enabled)
+    if session is None and config.bot.api_url:
+        # Локальный Bot API сервер или его заглушка в нагрузочных прогонах
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.bot.api_url))
+    bot: Bot = Bot(token=config.bot.token, parse_mode="HTML", session=session)
+    dp: Dispatcher = create_dispatcher(config)
+    return bot, dp
 
-if __name__ == "__main__":
-    asyncio.run(main())
+def load_startup_cache(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_startup_cache(path: str, cache: dict) -> None:
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        logger.warning("Failed to save startup cache to %s: %s", path, e)
+
+async def sync_bot_settings(bot: Bot, dp: Dispatcher, config: Config) -> None:
+    """Меню команд и вебхук меняются редко, поэтому запросы к Bot API делаются только при изменениях.
+
+    Что уже отправлено, хранится в STARTUP_CACHE_PATH; чтобы отправить заново, файл достаточно удалить.
+    """
+    cache = load_startup_cache(config.bot.startup_cache)
+    # Кэш привязан к боту: при смене токена все отправляется заново
+    if cache.get("bot_id") != bot.id:
+        cache = {"bot_id": bot.id}
+
+    requests = []
+    menu_hash = main_menu_hash()
+    if cache.get("menu_hash") != menu_hash:
+        requests.append(set_main_menu(bot))
+        cache["menu_hash"] = menu_hash
 
+    if config.bot.mode == "webhook":
+        webhook = [config.webhook.base_url + config.webhook.path, config.webhook.secret, dp.resolve_used_update_types()]
+        if cache.get("webhook") != webhook:
+            requests.append(set_webhook(bot, dp, config.webhook))
+            cache["webhook"] = webhook
+    elif cache.get("webhook", []) is not None:
+        # Вебхук мог остаться от запуска в режиме webhook — без его удаления long polling не работает
+        requests.append(bot.delete_webhook(drop_pending_updates=True))
+        cache["webhook"] = None
 
+    if requests:
+        await asyncio.gather(*requests)
+        save_startup_cache(config.bot.startup_cache, cache)
 
+async def main() -> None:
+    config = get_settings()
+    workers = []
+    if config.workers.count > 1:
+        # Апдейты читает этот процесс, обрабатывают воркеры через общую очередь в Redis.
+        # Воркеры запускаются раньше потоков логирования и движка БД этого процесса
+        workers = start_workers(create_dispatcher)
+    log_listener = setup_logging(config.log)
+    bot, dp = create_app(config)
+
+    waitlist_notifier = WaitlistNotifier(bot, config.waitlist)
+    # Истекшие предложения снимает этот процесс и при воркерах: они ищутся в БД, а не в памяти того, кто предложил
+    background_tasks = [asyncio.create_task(waitlist_notifier.run())]
+    if workers:
+        background_tasks.append(asyncio.create_task(supervise_workers(workers, create_dispatcher)))
+    else:
+        # Отмены обрабатывает этот процесс, и освободившиеся слоты предлагает он же
+        slot_freed_hooks.append(waitlist_notifier.on_slot_freed)
+    if config.reminders.enabled:
+        background_tasks.append(asyncio.create_task(ReminderScheduler(bot, config.reminders).run()))
+    if config.degraded.enabled and not workers:
+        # С несколькими воркерами апдейты обрабатывают они, и копия расписания нужна им
+        background_tasks.append(asyncio.create_task(DegradedMode(bot, config.degraded).run()))
+    if config.metrics.enabled:
+        background_tasks.append(asyncio.create_task(
+            run_metrics(config.metrics.host, config.metrics.port, config.metrics.log_interval)))
+
+    try:
+        await sync_bot_settings(bot, dp, config)
+
+        if config.bot.mode == "webhook":
+            await run_webhook(bot, dp, config.webhook)
+            return
 
+        if workers:
+            await produce_updates(bot, dp)
+        else:
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await close_db()
+        log_listener.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
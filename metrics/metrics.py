@@ -0,0 +1,148 @@
+import asyncio
+import bisect
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов в секундах: от 1 мс до 10 с
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus с одной меткой."""
+
+    def __init__(self, name: str, documentation: str, label: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        # значение метки -> [счетчики бакетов (+Inf последним), сумма, количество]
+        self.series: dict[str, list] = {}
+
+    def observe(self, label_value: str, seconds: float) -> None:
+        series = self.series.get(label_value)
+        if series is None:
+            series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, seconds)] += 1
+        series[1] += seconds
+        series[2] += 1
+
+    def quantile(self, label_value: str, q: float) -> float:
+        """Оценка квантиля по бакетам (верхняя граница бакета, как в histogram_quantile без интерполяции)."""
+        counts, _, total = self.series[label_value]
+        rank = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for label_value, (counts, total_sum, total_count) in self.series.items():
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}'
+            yield f'{self.name}_bucket{{{label},le="+Inf"}} {total_count}'
+            yield f"{self.name}_sum{{{label}}} {total_sum}"
+            yield f"{self.name}_count{{{label}}} {total_count}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+handler_latency = Histogram("bot_handler_duration_seconds", "Время выполнения хендлеров", "handler")
+db_query_latency = Histogram("bot_db_query_duration_seconds", "Время выполнения SQL-запросов", "query")
+fsm_storage_latency = Histogram("bot_fsm_storage_duration_seconds", "Время операций FSM-хранилища", "operation")
+
+histograms = [handler_latency, db_query_latency, fsm_storage_latency]
+
+# Функции, возвращающие текущие значения gauge-метрик: {имя: значение}
+collectors: list[Callable[[], Dict[str, float]]] = []
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in histograms:
+        lines.extend(histogram.render())
+    for collector in collectors:
+        try:
+            for name, value in collector().items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        except Exception:
+            logger.exception("Metrics collector %s failed", collector)
+    return "\n".join(lines) + "\n"
+
+
+def log_metrics() -> None:
+    for histogram in histograms:
+        for label_value, (_, total_sum, total_count) in histogram.series.items():
+            logger.info("%s{%s=%s} count=%d avg=%.4f p50<=%s p99<=%s", histogram.name, histogram.label, label_value,
+                        total_count, total_sum / total_count, histogram.quantile(label_value, 0.5),
+                        histogram.quantile(label_value, 0.99))
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Prometheus-Format": "0.0.4"})
+
+
+async def run_metrics(host: str, port: int, log_interval: int) -> None:
+    """Отдает /metrics на локальном порту и раз в log_interval секунд пишет сводку в лог."""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info("Metrics server started on %s:%s", host, port)
+
+    try:
+        while True:
+            await asyncio.sleep(log_interval)
+            log_metrics()
+    finally:
+        await runner.cleanup()
+
+
+class TimedStorage(BaseStorage):
+    """Обертка над FSM-хранилищем, замеряющая время каждой операции."""
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    async def _timed(self, operation: str, coro: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            fsm_storage_latency.observe(operation, time.perf_counter() - started)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._timed("set_state", self.storage.set_state(key, state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._timed("get_state", self.storage.get_state(key))
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._timed("set_data", self.storage.set_data(key, data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return await self._timed("get_data", self.storage.get_data(key))
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._timed("update_data", self.storage.update_data(key, data))
+
+    async def close(self) -> None:
+        await self.storage.close()
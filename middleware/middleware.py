@@ -1,13 +1,193 @@
+import asyncio
+import logging
+import time
+
 from aiogram import BaseMiddleware
 from aiogram.types import Update
-from typing import Callable, Dict, Any
+from redis.asyncio import Redis
+from typing import Callable, Dict, Any, Optional
+
+from config.config import AccessSettings, DedupSettings
+from db.cache import TTLCache
+from db.db import get_admin_telegram_ids, is_admin, upsert_user
+from logs.logs import correlation_id
+from metrics.metrics import handler_latency
+from services.ratelimit import TokenBucketLimiter
+
+
+logger = logging.getLogger(__name__)
 
-ALLOWED_USERS = [544312899,361046129]  # Telegram ID пользователей с доступом
 
 class PermissionMiddleware(BaseMiddleware):
+    """Пускает к боту только пользователей из ALLOWED_IDS/ADMIN_IDS и администраторов из БД.
+
+    Флуд от одного пользователя отбрасывается token bucket'ом еще до обращения к БД.
+    """
+
+    def __init__(self, access: AccessSettings, admin_ids: list[int]):
+        self.static_ids = access.allowed_ids | frozenset(admin_ids)
+        self.allowed_ids = self.static_ids
+        self.roles = TTLCache(maxsize=10_000, ttl=access.role_cache_ttl)
+        self.rate_limiter = TokenBucketLimiter(rate=access.rate_limit, burst=access.rate_burst)
+
+    async def load_db_admins(self) -> None:
+        self.allowed_ids = self.static_ids | frozenset(await get_admin_telegram_ids())
+        logger.info("Access list loaded: %d users", len(self.allowed_ids))
+
+    async def is_allowed(self, telegram_id: int) -> bool:
+        if telegram_id in self.allowed_ids:
+            return True
+
+        allowed: Optional[bool] = self.roles.get(telegram_id)
+        if allowed is None:
+            allowed = await is_admin(telegram_id)
+            self.roles.set(telegram_id, allowed)
+        return allowed
+
+    async def __call__(self, handler: Callable, event: Update, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            # Апдейты без пользователя (посты в каналах и т.п.) боту не нужны
+            return
+
+        if not self.rate_limiter.consume(user.id):
+            logger.debug("Update from %s dropped by rate limiter", user.id)
+            return
+
+        if not await self.is_allowed(user.id):
+            if event.message:
+                await event.message.answer("У вас нет доступа к этому боту.")
+            elif event.callback_query:
+                await event.callback_query.answer("У вас нет доступа к этому боту.", show_alert=True)
+            return
+        return await handler(event, data)
+
+
+class UserMiddleware(BaseMiddleware):
+    """Один раз на апдейт определяет pk пользователя в БД и передает его хендлерам как user_pk."""
+
+    def __init__(self, maxsize: int = 10_000, ttl: int = 3600):
+        self.user_pks = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def __call__(self, handler: Callable, event: Update, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is not None:
+            user_pk = self.user_pks.get(user.id)
+            if user_pk is None:
+                user_pk = await upsert_user(user.id)
+                self.user_pks.set(user.id, user_pk)
+            data["user_pk"] = user_pk
+        return await handler(event, data)
+
+
+class DedupMiddleware(BaseMiddleware):
+    """Отбрасывает апдейты, которые уже обрабатывались: Telegram доставляет их повторно после перезапуска
+    или ошибки вебхука.
+
+    update_id недавних апдейтов хранятся в LRU. С redis они дополнительно отмечаются общим ключом
+    с TTL, чтобы дубль не прошел через другой процесс или после перезапуска бота.
+    """
+
+    def __init__(self, dedup_settings: DedupSettings, redis: Optional[Redis] = None):
+        self.seen = TTLCache(maxsize=dedup_settings.size, ttl=dedup_settings.ttl)
+        self.ttl = dedup_settings.ttl
+        self.redis = redis
+
+    def _key(self, update_id: int) -> str:
+        return f"update:{update_id}"
+
+    async def _is_new(self, update_id: int) -> bool:
+        if self.seen.get(update_id) is not None:
+            return False
+        self.seen.set(update_id, True)
+        if self.redis is None:
+            return True
+        try:
+            return bool(await self.redis.set(self._key(update_id), 1, nx=True, ex=self.ttl))
+        except Exception as e:
+            # Недоступный redis не должен останавливать бота: остается локальная проверка
+            logger.warning("Shared update dedup failed: %s", e)
+            return True
+
+    async def _forget(self, update_id: int) -> None:
+        self.seen.invalidate(update_id)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(self._key(update_id))
+            except Exception as e:
+                logger.warning("Failed to release update %s in shared dedup: %s", update_id, e)
+
     async def __call__(self, handler: Callable, event: Update, data: Dict[str, Any]) -> Any:
-        user = event.message.from_user if event.message else event.callback_query.from_user
-        if user.id not in ALLOWED_USERS:
-            await event.answer("У вас нет доступа к этому боту.") if hasattr(event, 'answer') else await event.message.answer("У вас нет доступа.")
+        if not await self._is_new(event.update_id):
+            logger.info("Duplicate update %s dropped", event.update_id)
             return
-        return await handler(event, data)
\ No newline at end of file
+        try:
+            return await handler(event, data)
+        except Exception:
+            # Апдейт, упавший с ошибкой, можно обработать повторно
+            await self._forget(event.update_id)
+            raise
+
+
+class UserLockMiddleware(BaseMiddleware):
+    """Обрабатывает апдейты одного пользователя по очереди, чтобы переходы FSM не перемешивались.
+
+    Повторное нажатие той же кнопки, пока предыдущее еще в очереди или обрабатывается, отбрасывается.
+    """
+
+    def __init__(self):
+        # telegram_id -> [блокировка, число ожидающих апдейтов]
+        self.locks: dict[int, list] = {}
+        self.pressed: set[tuple[int, str]] = set()
+
+    async def __call__(self, handler: Callable, event: Update, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        pressed = None
+        if event.callback_query is not None:
+            pressed = (user.id, event.callback_query.data or "")
+            if pressed in self.pressed:
+                logger.debug("Repeated callback from %s dropped", user.id)
+                await event.callback_query.answer()
+                return
+            self.pressed.add(pressed)
+
+        entry = self.locks.setdefault(user.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await handler(event, data)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self.locks.pop(user.id, None)
+            if pressed is not None:
+                self.pressed.discard(pressed)
+
+
+class CorrelationIdMiddleware(BaseMiddleware):
+    """Помечает все логи, записанные при обработке апдейта, его update_id."""
+
+    async def __call__(self, handler: Callable, event: Update, data: Dict[str, Any]) -> Any:
+        token = correlation_id.set(str(event.update_id))
+        try:
+            return await handler(event, data)
+        finally:
+            correlation_id.reset(token)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Замеряет время выполнения каждого хендлера по его имени. Регистрируется как inner middleware."""
+
+    async def __call__(self, handler: Callable, event: Any, data: Dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        # Список, а не строка: CallbackDispatcher подменяет имя на хендлер из своей таблицы
+        label = [handler_object.callback.__name__ if handler_object is not None else "unknown"]
+        data["handler_label"] = label
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_latency.observe(label[0], time.perf_counter() - started)
@@ -0,0 +1,32 @@
+"""slot uniqueness and indexes for hot queries
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Ведущий столбец appointment_date обслуживает и выборки занятых слотов по дате, и диапазоны дат
+    op.create_unique_constraint('uq_appointment_date_timeslot', 'appointment', ['appointment_date', 'timeslot_pk'])
+    op.create_index('ix_appointment_user_pk_date', 'appointment', ['user_pk', 'appointment_date'])
+    op.create_index('ix_timeslot_weekday', 'timeslot', ['weekday'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_timeslot_weekday', table_name='timeslot')
+    op.drop_index('ix_appointment_user_pk_date', table_name='appointment')
+    op.drop_constraint('uq_appointment_date_timeslot', 'appointment', type_='unique')
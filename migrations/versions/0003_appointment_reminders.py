@@ -0,0 +1,31 @@
+"""reminder sent state
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('appointment', sa.Column('reminder_sent_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_appointment_reminder_pending', 'appointment', ['appointment_date', 'id'],
+                    postgresql_where=sa.text('reminder_sent_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_appointment_reminder_pending', table_name='appointment')
+    op.drop_column('appointment', 'reminder_sent_at')
@@ -0,0 +1,39 @@
+"""native time columns for timeslots and days off
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('timeslot', 'start_time', type_=sa.Time(), postgresql_using='start_time::time')
+    op.alter_column('timeslot', 'end_time', type_=sa.Time(), postgresql_using='end_time::time')
+    op.create_unique_constraint('uq_timeslot_weekday_start', 'timeslot', ['weekday', 'start_time'])
+    op.create_table(
+        'day_off',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('reason', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('day'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('day_off')
+    op.drop_constraint('uq_timeslot_weekday_start', 'timeslot', type_='unique')
+    op.alter_column('timeslot', 'end_time', type_=sa.String(), postgresql_using="to_char(end_time, 'HH24:MI')")
+    op.alter_column('timeslot', 'start_time', type_=sa.String(), postgresql_using="to_char(start_time, 'HH24:MI')")
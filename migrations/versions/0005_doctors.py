@@ -0,0 +1,62 @@
+"""doctors and per-doctor timeslots and appointments
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, Sequence[str], None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'doctor',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('specialty', sa.String(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    # Существующие слоты и записи принадлежат единственному врачу, который был у бота до этого
+    op.execute("INSERT INTO doctor (id, name, specialty, is_active) VALUES (1, 'Иванов И.И.', 'Врач-реабилитолог', true)")
+    op.execute("SELECT setval(pg_get_serial_sequence('doctor', 'id'), 1)")
+
+    op.add_column('timeslot', sa.Column('doctor_pk', sa.Integer(), nullable=True))
+    op.execute("UPDATE timeslot SET doctor_pk = 1")
+    op.alter_column('timeslot', 'doctor_pk', nullable=False)
+    op.create_foreign_key('timeslot_doctor_pk_fkey', 'timeslot', 'doctor', ['doctor_pk'], ['id'], ondelete='CASCADE')
+    op.drop_constraint('uq_timeslot_weekday_start', 'timeslot', type_='unique')
+    op.drop_index('ix_timeslot_weekday', table_name='timeslot')
+    op.create_unique_constraint('uq_timeslot_doctor_weekday_start', 'timeslot', ['doctor_pk', 'weekday', 'start_time'])
+
+    op.add_column('appointment', sa.Column('doctor_pk', sa.Integer(), nullable=True))
+    op.execute("UPDATE appointment SET doctor_pk = timeslot.doctor_pk FROM timeslot WHERE timeslot.id = appointment.timeslot_pk")
+    op.alter_column('appointment', 'doctor_pk', nullable=False)
+    op.create_foreign_key('appointment_doctor_pk_fkey', 'appointment', 'doctor', ['doctor_pk'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_appointment_doctor_pk_date', 'appointment', ['doctor_pk', 'appointment_date'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_appointment_doctor_pk_date', table_name='appointment')
+    op.drop_constraint('appointment_doctor_pk_fkey', 'appointment', type_='foreignkey')
+    op.drop_column('appointment', 'doctor_pk')
+
+    op.drop_constraint('uq_timeslot_doctor_weekday_start', 'timeslot', type_='unique')
+    op.create_index('ix_timeslot_weekday', 'timeslot', ['weekday'])
+    op.create_unique_constraint('uq_timeslot_weekday_start', 'timeslot', ['weekday', 'start_time'])
+    op.drop_constraint('timeslot_doctor_pk_fkey', 'timeslot', type_='foreignkey')
+    op.drop_column('timeslot', 'doctor_pk')
+
+    op.drop_table('doctor')
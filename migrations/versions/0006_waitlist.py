@@ -0,0 +1,44 @@
+"""waitlist
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 12:50:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, Sequence[str], None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'waitlist',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('wait_date', sa.Date(), nullable=False),
+        sa.Column('offer_expires_at', sa.DateTime(), nullable=True),
+        sa.Column('user_pk', sa.Integer(), nullable=False),
+        sa.Column('doctor_pk', sa.Integer(), nullable=False),
+        sa.Column('offer_timeslot_pk', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_pk'], ['user.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['doctor_pk'], ['doctor.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['offer_timeslot_pk'], ['timeslot.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_pk', 'doctor_pk', 'wait_date', name='uq_waitlist_user_doctor_date'),
+    )
+    op.create_index('ix_waitlist_doctor_date_id', 'waitlist', ['doctor_pk', 'wait_date', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_waitlist_doctor_date_id', table_name='waitlist')
+    op.drop_table('waitlist')
@@ -0,0 +1,43 @@
+"""per-doctor days off
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, Sequence[str], None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Дата больше не уникальна: на нее может приходиться отпуск нескольких врачей
+    op.drop_constraint('day_off_pkey', 'day_off', type_='primary')
+    op.execute("ALTER TABLE day_off ADD COLUMN id SERIAL PRIMARY KEY")
+    # Существующие нерабочие дни остаются днями всей клиники
+    op.add_column('day_off', sa.Column('doctor_pk', sa.Integer(), nullable=True))
+    op.create_foreign_key('day_off_doctor_pk_fkey', 'day_off', 'doctor', ['doctor_pk'], ['id'], ondelete='CASCADE')
+    op.create_index('uq_day_off_clinic_day', 'day_off', ['day'], unique=True,
+                    postgresql_where=sa.text('doctor_pk IS NULL'))
+    op.create_index('uq_day_off_doctor_day', 'day_off', ['doctor_pk', 'day'], unique=True,
+                    postgresql_where=sa.text('doctor_pk IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM day_off WHERE doctor_pk IS NOT NULL")
+    op.drop_index('uq_day_off_doctor_day', table_name='day_off')
+    op.drop_index('uq_day_off_clinic_day', table_name='day_off')
+    op.drop_constraint('day_off_doctor_pk_fkey', 'day_off', type_='foreignkey')
+    op.drop_column('day_off', 'doctor_pk')
+    op.drop_column('day_off', 'id')
+    op.create_primary_key('day_off_pkey', 'day_off', ['day'])
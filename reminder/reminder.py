@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter
+from sqlalchemy.engine import Row
+
+from config.config import ReminderSettings
+from db.db import get_pending_reminders, mark_reminders_sent
+from lexicon.lexicon import LEXICON
+from services.ratelimit import AsyncRateLimiter
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderScheduler:
+    """Фоновая рассылка напоминаний о приеме.
+
+    Раз в scan_interval секунд выбирает пачками записи без напоминания на ближайшие lead_hours
+    и отправляет их не быстрее rate_limit сообщений в секунду. Отправленные помечаются в БД,
+    поэтому после перезапуска напоминания не дублируются.
+    """
+
+    def __init__(self, bot: Bot, reminder_settings: ReminderSettings):
+        self.bot = bot
+        self.settings = reminder_settings
+        self.limiter = AsyncRateLimiter(rate=reminder_settings.rate_limit, burst=int(reminder_settings.rate_limit))
+
+    async def run(self) -> None:
+        logger.info("Reminder scheduler started")
+        while True:
+            try:
+                sent = await self.scan_once()
+                if sent:
+                    logger.info("Sent %d reminders", sent)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Reminder scan failed")
+            await asyncio.sleep(self.settings.scan_interval)
+
+    async def scan_once(self, now: datetime | None = None) -> int:
+        now = now or datetime.now()
+        horizon = now + timedelta(hours=self.settings.lead_hours)
+        sent = 0
+        after_id = 0
+
+        while True:
+            batch = await get_pending_reminders(now, horizon, after_id, self.settings.batch_size)
+            if not batch:
+                return sent
+            after_id = batch[-1].id
+
+            results = await asyncio.gather(*(self._deliver(row) for row in batch))
+            delivered = [row.id for row, ok in zip(batch, results) if ok]
+            await mark_reminders_sent(delivered)
+            sent += len(delivered)
+
+    async def _deliver(self, row: Row) -> bool:
+        """Отправляет напоминание; True, если повторять больше не нужно."""
+        text = LEXICON["reminder"].format(appointment_date=row.appointment_date.strftime("%d-%m-%Y"),
+                                          timeslot=row.start_time.strftime("%H:%M"))
+        for attempt in range(self.settings.max_retries):
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id=row.telegram_id, text=text)
+                return True
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Пользователь заблокировал бота или чат недоступен — повтор не поможет
+                logger.info("Reminder for appointment %s dropped: %s", row.id, e)
+                return True
+            except Exception as e:
+                logger.warning("Reminder for appointment %s failed (attempt %d): %s", row.id, attempt + 1, e)
+                await asyncio.sleep(2 ** attempt)
+        return False
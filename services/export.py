@@ -0,0 +1,70 @@
+import csv
+import html
+import io
+import os
+import tempfile
+from datetime import date
+from typing import AsyncIterator, List
+
+import aiofiles
+from sqlalchemy import Row
+
+from db.db import stream_schedule
+
+
+CSV_HEADER = ["Дата", "Время", "Врач", "Пациент", "Telegram ID", "Первичный прием", "Создана"]
+# С этих символов Excel и LibreOffice начинают формулу
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _csv_header() -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(CSV_HEADER)
+    return buffer.getvalue()
+
+
+def _csv_safe(value: str) -> str:
+    """Текст, введенный пользователем, с апострофом перед формулой, чтобы таблица показала его как текст."""
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def _csv_rows(partition: List[Row]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        (row.appointment_date.strftime("%d-%m-%Y"), row.start_time.strftime("%H:%M"), _csv_safe(row.doctor_name),
+         _csv_safe(row.user_data), row.telegram_id, "да" if row.is_primary else "нет",
+         row.created_at.strftime("%d-%m-%Y %H:%M"))
+        for row in partition
+    )
+    return buffer.getvalue()
+
+
+async def export_schedule_csv(first_day: date, last_day: date) -> str:
+    """Выгружает записи периода во временный CSV-файл и возвращает путь к нему.
+
+    Данные идут порциями из серверного курсора прямо в файл, поэтому память не зависит от объема выгрузки.
+    """
+    fd, path = tempfile.mkstemp(prefix="schedule_", suffix=".csv")
+    os.close(fd)
+    try:
+        # utf-8-sig, чтобы Excel правильно открыл кириллицу
+        async with aiofiles.open(path, "w", encoding="utf-8-sig", newline="") as file:
+            await file.write(_csv_header())
+            async for partition in stream_schedule(first_day, last_day):
+                await file.write(_csv_rows(partition))
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+async def schedule_lines(first_day: date, last_day: date) -> AsyncIterator[str]:
+    """Строки расписания для отправки сообщением, с заголовком на каждый день."""
+    current_day = None
+    async for partition in stream_schedule(first_day, last_day):
+        for row in partition:
+            if row.appointment_date != current_day:
+                current_day = row.appointment_date
+                yield f"\n<b>{current_day.strftime('%d-%m-%Y')}</b>"
+            yield f"{row.start_time.strftime('%H:%M')} {html.escape(row.doctor_name)} — {html.escape(row.user_data)}"
@@ -0,0 +1,55 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+
+class TokenBucketLimiter:
+    """Token bucket на каждый ключ (например, telegram id пользователя).
+
+    Каждый ключ может потратить до burst запросов подряд, дальше — rate запросов в секунду.
+    Хранится не больше maxsize ключей, давно не активные вытесняются.
+    """
+
+    def __init__(self, rate: float, burst: int, maxsize: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()
+
+    def consume(self, key: Hashable, tokens: float = 1.0) -> bool:
+        now = time.monotonic()
+        available, updated_at = self._buckets.get(key, (float(self.burst), now))
+        available = min(self.burst, available + (now - updated_at) * self.rate)
+
+        allowed = available >= tokens
+        if allowed:
+            available -= tokens
+
+        self._buckets[key] = (available, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return allowed
+
+
+class AsyncRateLimiter:
+    """Общий token bucket, который ждет освобождения токена вместо отказа."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._available = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._available = min(self.burst, self._available + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._available >= 1:
+                    self._available -= 1
+                    return
+                await asyncio.sleep((1 - self._available) / self.rate)
@@ -1,132 +1,178 @@
-from calendar import weekday
-from typing import List
+import logging
+from typing import Optional
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import calendar
-from datetime import datetime, timedelta
+from datetime import datetime, date
+from functools import lru_cache
 from dateutil.relativedelta import relativedelta
+from sqlalchemy import Row
 
-import db.db
-from db.models.models import Appointment
-from db.db import *
+from config.config import get_settings
+from db.db import (BOOKING_LEAD, add_to_waitlist, book_appointment, delete_appointment, get_available_timeslots,
+                   get_month_availability, get_user_appointments_page, update_appointment)
+from callbacks.callbacks import Action, encode
 from lexicon.lexicon import LEXICON
 from keyboard.keyboards import user_appointments_list_kb
 
 
-def get_calendar_markup(month_shift: int = 0) -> InlineKeyboardMarkup:
-    now = datetime.now()
-    first_day_of_current_month = now.replace(day=1)
+logger = logging.getLogger(__name__)
+
+
+def get_doctors_kb(doctors: list[Row]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"{name}, {specialty}" if specialty else name, callback_data=encode(Action.DOCTOR, doctor_id))]
+        for doctor_id, name, specialty in doctors
+    ])
+
+async def get_calendar_markup(doctor_pk: int, month_shift: int = 0) -> InlineKeyboardMarkup:
+    today = date.today()
+    first_day_of_current_month = today.replace(day=1)
+
+    # Запрещаем листать раньше текущего месяца
+    month_shift = max(month_shift, 0)
 
     # Смещаем на нужный месяц
     target_month = first_day_of_current_month + relativedelta(months=month_shift)
 
-    # Запрещаем листать раньше текущего месяца
-    if target_month < first_day_of_current_month:
-        target_month = first_day_of_current_month
-        month_shift = 0
+    # Свободные слоты по всем дням месяца одним запросом
+    days_in_month = calendar.monthrange(target_month.year, target_month.month)[1]
+    availability = await get_month_availability(doctor_pk, target_month, target_month.replace(day=days_in_month))
+
+    # Клавиатура зависит только от сегодняшней даты, смещения и занятости,
+    # поэтому при смене дня кэш сбрасывается целиком
+    if _calendar_cache_day[0] != today:
+        _build_calendar_markup.cache_clear()
+        _calendar_cache_day[0] = today
+
+    return _build_calendar_markup(today, month_shift, tuple(sorted(availability.items())))
+
+
+_calendar_cache_day: list[date | None] = [None]
+
+
+@lru_cache(maxsize=256)
+def _build_calendar_markup(today: date, month_shift: int, availability: tuple[tuple[date, int], ...]) -> InlineKeyboardMarkup:
+    first_day_of_current_month = today.replace(day=1)
+    target_month = first_day_of_current_month + relativedelta(months=month_shift)
+    free_slots_by_day = {available_date.day: free for available_date, free in availability
+                         if available_date.month == target_month.month and available_date.year == target_month.year}
+    # Для текущего месяца скрываем прошедшие даты
+    first_visible_day = today.day if month_shift == 0 else 1
 
     month_days = calendar.monthcalendar(target_month.year, target_month.month)
+    empty_button = InlineKeyboardButton(text=" ", callback_data=encode(Action.IGNORE))
 
     kb = []
 
     # Заголовок с месяцем и годом
     month_name = calendar.month_name[target_month.month]
-    header_button = InlineKeyboardButton(text=f"{month_name} {target_month.year}", callback_data="ignore")
+    header_button = InlineKeyboardButton(text=f"{month_name} {target_month.year}", callback_data=encode(Action.IGNORE))
     kb.append([header_button])
 
     # Клавиши дней месяца
     for week in month_days:
         row = []
         for day in week:
-            if day == 0:
-                row.append(InlineKeyboardButton(text=" ", callback_data="ignore"))
+            if day == 0 or day < first_visible_day:
+                row.append(empty_button)
+                continue
+
+            free_slots = free_slots_by_day.get(day)
+            day_data = encode(Action.CALENDAR_DAY, target_month.replace(day=day))
+            # Неприемные дни неактивны, на полностью занятые можно встать в лист ожидания
+            if free_slots is None:
+                row.append(InlineKeyboardButton(text=f"·{day}·", callback_data=encode(Action.IGNORE)))
+            elif free_slots == 0:
+                row.append(InlineKeyboardButton(text=f"·{day}·", callback_data=day_data))
             else:
-                date_obj = datetime(target_month.year, target_month.month, day)
-                # Для текущего месяца скрываем прошедшие даты
-                if (target_month.year == now.year and target_month.month == now.month and date_obj.date() < now.date()):
-                    row.append(InlineKeyboardButton(text=" ", callback_data="ignore"))
-                else:
-                    date_str = date_obj.strftime("%d-%m-%Y")
-                    row.append(InlineKeyboardButton(text=str(day), callback_data=f"calendar:{date_str}"))
+                row.append(InlineKeyboardButton(text=f"{day} ({free_slots})", callback_data=day_data))
         kb.append(row)
 
     # Кнопки навигации
     nav_buttons = []
-    if target_month > first_day_of_current_month:
-        nav_buttons.append(InlineKeyboardButton(text="<<", callback_data=f"calendar:shift:{month_shift - 1}"))
-    nav_buttons.append(InlineKeyboardButton(text=">>", callback_data=f"calendar:shift:{month_shift + 1}"))
+    if month_shift > 0:
+        nav_buttons.append(InlineKeyboardButton(text="<<", callback_data=encode(Action.CALENDAR_SHIFT, month_shift - 1)))
+    nav_buttons.append(InlineKeyboardButton(text=">>", callback_data=encode(Action.CALENDAR_SHIFT, month_shift + 1)))
     kb.append(nav_buttons)
 
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
-async def get_timeslots_kb(selected_date: datetime) -> InlineKeyboardMarkup:
-    timeslots = await get_available_timeslots(selected_date)
+async def get_timeslots_kb(doctor_pk: int, selected_date: datetime) -> InlineKeyboardMarkup:
+    timeslots = await get_available_timeslots(doctor_pk, selected_date)
     kb = InlineKeyboardMarkup(inline_keyboard=[])
     if not timeslots:
-        print("Таймслоты вернулись пустыми")
+        logger.debug("No timeslots available for %s", selected_date)
         return kb
 
 
     for timeslot in timeslots:
         # Проверяем только если выбран текущий день недели
-        slot_time = datetime.strptime(timeslot.start_time, "%H:%M").replace(
-            year=selected_date.year, month=selected_date.month, day=selected_date.day
-        )
+        slot_time = datetime.combine(selected_date.date(), timeslot.start_time)
 
         if selected_date.date() == datetime.now().date():
-            if slot_time <= datetime.now() + timedelta(hours=1):
+            if slot_time <= datetime.now() + BOOKING_LEAD:
                 continue
 
         button = InlineKeyboardButton(
-            text=timeslot.start_time,
-            callback_data=f"timeslot_id:{timeslot.id}"
+            text=str(timeslot),
+            callback_data=encode(Action.TIMESLOT, timeslot.id)
         )
         kb.inline_keyboard.append([button])
 
     return kb
 
-async def save_appointment(appointment: dict) -> str:
-    current_user = await get_or_create_user(appointment["user_id"])
+async def subscribe_to_waitlist(user_pk: int, doctor_pk: int, selected_date: str) -> str:
+    wait_date = datetime.strptime(selected_date, "%d-%m-%Y").date()
+    if await add_to_waitlist(user_pk, doctor_pk, wait_date):
+        return LEXICON["waitlist_added"].format(appointment_date=selected_date)
+    return LEXICON["waitlist_exists"].format(appointment_date=selected_date)
 
-    appointments_list = await db.db.get_user_appointments(current_user.id)
+async def save_appointment(appointment: dict) -> str:
+    booked = await book_appointment(
+        user_pk=appointment["user_pk"],
+        appointment_date=datetime.strptime(appointment["selected_date"], "%d-%m-%Y").date(),
+        timeslot_pk=appointment["selected_timeslot_id"],
+        user_data=appointment["user_data"],
+    )
+    if booked is None:
+        return "К сожалению выбранное время уже занято.\nВыберите другое"
+    if booked.id is None:
+        # БД недоступна: запись в журнале, подтверждение придет после ее восстановления
+        return LEXICON["booking_journaled"].format(appointment_date=booked.appointment_date.strftime('%d-%m-%Y'),
+                                                   timeslot=booked.start_time.strftime('%H:%M'))
 
-    timeslot = await get_timeslot_by_id(appointment["selected_timeslot_id"])
+    return f"Вы записаны к доктору {booked.doctor_name}\n{booked.appointment_date.strftime('%d-%m-%Y')} в {booked.start_time.strftime('%H:%M')} часов"
 
-    is_primary_appointment = False if len(appointments_list) > 0 else True
-    print(is_primary_appointment)
+async def get_user_appointments(user_pk: int,
+                                after: Optional[tuple[date, int]] = None,
+                                before: Optional[tuple[date, int]] = None) -> InlineKeyboardMarkup:
+    page = await get_user_appointments_page(user_pk, get_settings().bot.page_size, after=after, before=before)
 
-    if await is_timeslot_available(appointment_date=datetime.strptime(appointment["selected_date"], "%d-%m-%Y").date(),
-                                   timeslot_pk=appointment["selected_timeslot_id"]):
-        print("проверка на доступный таймслот  прошла")
-        new_appointment = Appointment(
-            appointment_date=datetime.strptime(appointment["selected_date"], "%d-%m-%Y"),
-            user_data=appointment["user_data"],
-            is_primary=is_primary_appointment,
-            user_pk=current_user.id,
-            timeslot_pk=appointment["selected_timeslot_id"]
-        )
-        created_appointment = await create_appointment(new_appointment)
-        print("Appointment вернулся: " + created_appointment.__str__())
-        return f"Вы записаны к доктору\n{created_appointment.__str__()} часов"
-    else:
-        return "К сожалению выбранное время уже занято.\nВыберите другое"
+    if page.rows or page.has_prev:
+        return user_appointments_list_kb(page)
 
-async def get_user_appointments(user_telegram_id: int) -> InlineKeyboardMarkup:
-    user = await get_or_create_user(user_telegram_id)
-    if user:
-        appointments_list = await db.db.get_user_appointments(user_pk=user.id)
-    else:
-        raise ValueError("User is not found")
+    return InlineKeyboardMarkup(inline_keyboard=[])
 
-    if appointments_list is not None:
-        if len(appointments_list) > 0:
-           return user_appointments_list_kb(appointments_list)
 
-    return InlineKeyboardMarkup(inline_keyboard=[])
+async def cancel_appointment(appointment_id: int, user_pk: int) -> str:
+    deleted = await delete_appointment(appointment_id, user_pk=user_pk)
+    if deleted is None:
+        return LEXICON["appointment_not_found"]
 
+    logger.info("Cancelled appointment with id %s", appointment_id)
+    return LEXICON["appointment_cancelled"].format(appointment_date=deleted.appointment_date.strftime("%d-%m-%Y"))
 
-def cancel_appointment(appointment_id: int):
-    # Заглушка отмены записи
-    print(f"Cancelled appointment with id {appointment_id}")
+async def reschedule_appointment(appointment_id: int, user_pk: int, selected_date: str, timeslot_id: int) -> str:
+    try:
+        updated = await update_appointment(appointment_id, user_pk,
+                                           datetime.strptime(selected_date, "%d-%m-%Y").date(), timeslot_id)
+    except ValueError:
+        return "К сожалению выбранное время уже занято.\nВыберите другое"
 
+    if updated is None:
+        return LEXICON["appointment_not_found"]
 
+    logger.info("Rescheduled appointment with id %s", appointment_id)
+    return LEXICON["appointment_rescheduled"].format(appointment_date=updated.appointment_date.strftime("%d-%m-%Y"),
+                                                     timeslot=updated.start_time.strftime("%H:%M"))
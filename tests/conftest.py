@@ -0,0 +1,80 @@
+"""Тесты работают с настоящим PostgreSQL (и Redis, где он нужен).
+
+Параметры подключения берутся из тех же переменных, что у бота (DB_HOST, DB_USER, ...), но база —
+TEST_DB_NAME, по умолчанию <DB_NAME>_test. Она создается и мигрируется при первом запуске,
+таблицы очищаются перед каждым тестом. Без доступного сервера тесты пропускаются.
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable
+
+import asyncpg
+import pytest
+from alembic import command
+from alembic.config import Config as AlembicConfig
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    # До первого get_settings(): вся конфигурация читается лениво
+    os.environ["DB_NAME"] = os.environ.get("TEST_DB_NAME") or os.environ.get("DB_NAME", "database") + "_test"
+
+
+@pytest.fixture(scope="session")
+def database():
+    from config.config import get_settings
+
+    settings = get_settings()
+    db = settings.db
+
+    async def create_database() -> None:
+        try:
+            connection = await asyncpg.connect(user=db.DB_USER, password=db.DB_PASS, host=db.DB_HOST,
+                                               port=db.DB_PORT, database="postgres")
+        except (OSError, asyncpg.PostgresError) as e:
+            pytest.skip(f"PostgreSQL недоступен: {e}")
+        try:
+            if not await connection.fetchval("SELECT 1 FROM pg_database WHERE datname = $1", db.DB_NAME):
+                await connection.execute(f'CREATE DATABASE "{db.DB_NAME}"')
+        finally:
+            await connection.close()
+
+    asyncio.run(create_database())
+    command.upgrade(AlembicConfig(os.path.join(ROOT, "alembic.ini")), "head")
+    return settings
+
+
+async def _with_db(coro: Awaitable[Any]) -> Any:
+    from config.config import get_settings
+    from db.db import close_db, init_db
+
+    init_db(get_settings().db)
+    try:
+        return await coro
+    finally:
+        await close_db()
+
+
+@pytest.fixture
+def run(database) -> Callable[[Awaitable[Any]], Any]:
+    """Выполняет корутину в новом цикле событий со своим движком БД."""
+    return lambda coro: asyncio.run(_with_db(coro))
+
+
+@pytest.fixture
+def clean_db(run):
+    from sqlalchemy import text
+
+    from db import db
+    from db.models.models import Base
+
+    async def truncate() -> None:
+        tables = ", ".join(f'"{table.name}"' for table in Base.metadata.sorted_tables)
+        async with db.async_session() as session, session.begin():
+            await session.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+    run(truncate())
+    for cache in (db.timeslots_cache, db.booked_cache, db.days_off_cache, db.doctors_cache):
+        cache.clear()
+    return run
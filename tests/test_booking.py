@@ -0,0 +1,118 @@
+import asyncio
+from datetime import date, time, timedelta
+
+from sqlalchemy import func, select
+
+from db import db
+from db.models.models import Appointment, Doctor, Timeslot
+
+BOOKINGS = 300
+MONDAY = date(2030, 1, 7)
+
+
+async def _seed_slot() -> int:
+    async with db.async_session() as session, session.begin():
+        doctor = Doctor(name="Врач")
+        session.add(doctor)
+        await session.flush()
+        timeslot = Timeslot(weekday=MONDAY.weekday(), start_time=time(9), end_time=time(9, 30), doctor_pk=doctor.id)
+        session.add(timeslot)
+        await session.flush()
+        return timeslot.id
+
+
+async def _count_appointments() -> int:
+    async with db.async_session() as session:
+        return (await session.execute(select(func.count()).select_from(Appointment))).scalar_one()
+
+
+def test_concurrent_bookings_of_one_slot(clean_db):
+    async def scenario():
+        timeslot_pk = await _seed_slot()
+        user_pks = [await db.upsert_user(1000 + n) for n in range(BOOKINGS)]
+        results = await asyncio.gather(*(db.book_appointment(user_pk, MONDAY, timeslot_pk, f"user{user_pk}")
+                                         for user_pk in user_pks))
+        return results, await _count_appointments()
+
+    results, appointments = clean_db(scenario())
+
+    winners = [booked for booked in results if booked is not None]
+    assert len(winners) == 1
+    assert appointments == 1
+
+
+def test_repeated_booking_returns_existing(clean_db):
+    async def scenario():
+        timeslot_pk = await _seed_slot()
+        user_pk = await db.upsert_user(1000)
+        results = await asyncio.gather(*(db.book_appointment(user_pk, MONDAY, timeslot_pk, "user")
+                                         for _ in range(20)))
+        return results, await _count_appointments()
+
+    results, appointments = clean_db(scenario())
+
+    assert appointments == 1
+    assert {booked.id for booked in results} == {results[0].id}
+
+
+async def _doctor_pk(timeslot_pk: int) -> int:
+    async with db.async_session() as session:
+        return (await session.execute(select(Timeslot.doctor_pk).where(Timeslot.id == timeslot_pk))).scalar_one()
+
+
+def test_booking_on_wrong_weekday_is_rejected(clean_db):
+    async def scenario():
+        timeslot_pk = await _seed_slot()
+        user_pk = await db.upsert_user(1000)
+        booked = await db.book_appointment(user_pk, MONDAY + timedelta(days=1), timeslot_pk, "user")
+        return booked, await _count_appointments()
+
+    assert clean_db(scenario()) == (None, 0)
+
+
+def test_reschedule_respects_weekday_and_waitlist_hold(clean_db):
+    async def scenario():
+        timeslot_pk = await _seed_slot()
+        doctor_pk = await _doctor_pk(timeslot_pk)
+        user_pk, subscriber_pk = await db.upsert_user(1000), await db.upsert_user(1001)
+        booked = await db.book_appointment(user_pk, MONDAY, timeslot_pk, "user")
+
+        errors = []
+        try:
+            await db.update_appointment(booked.id, user_pk, MONDAY + timedelta(days=8), timeslot_pk)
+        except ValueError:
+            errors.append("weekday")
+
+        next_monday = MONDAY + timedelta(days=7)
+        await db.add_to_waitlist(subscriber_pk, doctor_pk, next_monday)
+        assert await db.offer_waitlist_slot(doctor_pk, next_monday, timeslot_pk, timedelta(minutes=15)) is not None
+        try:
+            await db.update_appointment(booked.id, user_pk, next_monday, timeslot_pk)
+        except ValueError:
+            errors.append("hold")
+
+        assert await db.update_appointment(booked.id, user_pk + 100, next_monday, timeslot_pk) is None
+        return errors
+
+    assert clean_db(scenario()) == ["weekday", "hold"]
+
+
+def test_retry_waits_for_concurrent_booking_of_same_user(clean_db):
+    async def scenario():
+        timeslot_pk = await _seed_slot()
+        doctor_pk = await _doctor_pk(timeslot_pk)
+        user_pk = await db.upsert_user(1000)
+        async with db.async_session() as session, session.begin():
+            # Первый запрос еще не закоммичен, когда приходит повтор
+            first = Appointment(appointment_date=MONDAY, user_data="user", is_primary=True, user_pk=user_pk,
+                                timeslot_pk=timeslot_pk, doctor_pk=doctor_pk)
+            session.add(first)
+            await session.flush()
+            retry = asyncio.create_task(db.book_appointment(user_pk, MONDAY, timeslot_pk, "user"))
+            await asyncio.sleep(0.5)
+            assert not retry.done()
+        return first.id, await retry
+
+    first_id, retried = clean_db(scenario())
+
+    assert retried is not None and retried.id == first_id
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import date
+
+import pytest
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+from db import db
+from db.replica import ScheduleReplica
+
+
+class DriverError(Exception):
+    def __init__(self, sqlstate: str):
+        super().__init__(sqlstate)
+        self.sqlstate = sqlstate
+
+
+def dbapi_error(sqlstate: str, connection_invalidated: bool = False) -> DBAPIError:
+    return DBAPIError("SELECT 1", {}, DriverError(sqlstate), connection_invalidated=connection_invalidated)
+
+
+@pytest.mark.parametrize("error", [
+    OSError("connection refused"),
+    asyncio.TimeoutError(),
+    PoolTimeoutError("pool exhausted"),
+    dbapi_error("08006"),
+    dbapi_error("57P01"),
+    dbapi_error("XX000", connection_invalidated=True),
+    DriverError("53300"),
+])
+def test_connection_errors_mean_unavailable(error):
+    assert db.is_db_unavailable(error)
+
+
+@pytest.mark.parametrize("error", [
+    dbapi_error("42P01"),
+    dbapi_error("22007"),
+    dbapi_error("23505"),
+    ValueError("bad date"),
+])
+def test_query_and_data_errors_do_not(error):
+    assert not db.is_db_unavailable(error)
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    replica = ScheduleReplica()
+    replica.load([], [], [], [], date.today(), date.today())
+    monkeypatch.setattr(db, "replica", replica)
+    woken = []
+    # Список подменяется по месту: degraded.degraded импортирует его по имени
+    saved_hooks = db.degraded_hooks[:]
+    db.degraded_hooks[:] = [lambda: woken.append(True)]
+    yield replica, woken
+    db.degraded_hooks[:] = saved_hooks
+
+
+def read(error: Exception):
+    async def query():
+        raise error
+
+    return asyncio.run(db._read_with_replica(query, lambda: "replica"))
+
+
+def test_degraded_after_consecutive_failures(replica):
+    replica, woken = replica
+    threshold = db.get_settings().degraded.failure_threshold
+
+    for _ in range(threshold - 1):
+        assert read(OSError("connection refused")) == "replica"
+    assert not replica.degraded and not woken
+
+    assert read(OSError("connection refused")) == "replica"
+    assert replica.degraded and woken == [True]
+
+
+def test_success_resets_failures(replica):
+    replica, _ = replica
+
+    async def ok():
+        return "db"
+
+    for _ in range(5):
+        read(OSError("connection refused"))
+        assert asyncio.run(db._read_with_replica(ok, lambda: "replica")) == "db"
+    assert not replica.degraded
+
+
+def test_query_error_is_not_served_from_replica(replica):
+    replica, _ = replica
+    with pytest.raises(DBAPIError):
+        read(dbapi_error("42P01"))
+    assert replica.failures == 0 and not replica.degraded
+
+
+def test_refresher_wakes_up_when_degraded(replica, monkeypatch, tmp_path):
+    from degraded import degraded
+
+    replica, _ = replica
+    refreshes = []
+
+    async def refresh_replica(horizon_days: int) -> None:
+        refreshes.append(asyncio.get_running_loop().time())
+
+    monkeypatch.setattr(degraded, "refresh_replica", refresh_replica)
+    settings = db.get_settings().degraded
+    settings = type(settings)(**{**vars(settings), "refresh_interval": 60})
+
+    async def scenario() -> None:
+        refresher = degraded.DegradedMode(None, settings, str(tmp_path / "journal.jsonl"))
+        task = asyncio.create_task(refresher.run())
+        await asyncio.sleep(0.1)
+        db.enter_degraded_mode(OSError("connection refused"))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(scenario())
+    # Первое обновление при старте, второе — сразу после перехода на копию, а не через 60 с
+    assert len(refreshes) == 2
@@ -0,0 +1,102 @@
+"""Выгрузка расписания: память при большом объеме, экранирование формул и разбиение сообщений."""
+import asyncio
+import csv
+import os
+import subprocess
+import sys
+from datetime import date, datetime, time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+from db import db
+from handlers.admin import MESSAGE_LIMIT, _split_line
+from services.export import _csv_rows
+
+APPOINTMENTS = 500_000
+USERS = 50_000
+# Порции серверного курсора занимают сотни килобайт; объем выгрузки не должен влиять на память
+PEAK_MEMORY_GROWTH_LIMIT = 32 * 1024 * 1024
+FIRST_DAY, LAST_DAY = date(2000, 1, 1), date(2099, 12, 31)
+
+# Выгрузка в отдельном процессе: пик RSS (ru_maxrss, КБ) считается от уровня после импортов и первого
+# соединения с БД, и на него не влияют остальные тесты. В отличие от tracemalloc, учитываются и буферы драйвера
+EXPORT_SCRIPT = f"""
+import asyncio, os, resource
+from datetime import date
+from db.db import close_db
+from services.export import export_schedule_csv
+
+async def main():
+    os.remove(await export_schedule_csv(date(1999, 1, 1), date(1999, 1, 1)))
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    path = await export_schedule_csv(date({FIRST_DAY.year}, 1, 1), date({LAST_DAY.year}, 12, 31))
+    print(path, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) * 1024)
+    await close_db()
+
+asyncio.run(main())
+"""
+
+SEED = [
+    "SET LOCAL statement_timeout = 0",
+    f"INSERT INTO \"user\" (telegram_id, is_admin) SELECT 2000000 + n, false FROM generate_series(1, {USERS}) n",
+    "INSERT INTO doctor (name, is_active) SELECT 'Врач ' || n, true FROM generate_series(1, 10) n",
+    """INSERT INTO timeslot (weekday, start_time, end_time, doctor_pk)
+       SELECT w, make_time(h, 0, 0), make_time(h, 30, 0), d.id
+       FROM doctor d, generate_series(0, 4) w, generate_series(8, 17) h""",
+    f"""INSERT INTO appointment (appointment_date, user_data, is_primary, user_pk, timeslot_pk, doctor_pk)
+       SELECT d::date, 'Пациент ' || t.id || ' +7 900 000-00-00', false, 1 + abs(hashtext(d::text || t.id)) % {USERS},
+              t.id, t.doctor_pk
+       FROM generate_series(date '2030-01-01', date '2030-01-01' + 7500, interval '1 day') d
+       JOIN timeslot t ON t.weekday = extract(isodow FROM d) - 1
+       LIMIT {APPOINTMENTS}""",
+]
+
+
+@pytest.fixture(scope="module")
+def seeded(database):
+    from tests.conftest import _with_db
+
+    async def seed() -> None:
+        async with db.get_engine().begin() as connection:
+            tables = ", ".join(f'"{table}"' for table in ("waitlist", "appointment", "timeslot", "doctor", "day_off", "user"))
+            await connection.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+            for statement in SEED:
+                await connection.execute(text(statement))
+
+    asyncio.run(_with_db(seed()))
+
+
+def test_export_memory_does_not_grow_with_rows(seeded):
+    pytest.importorskip("resource")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", EXPORT_SCRIPT], cwd=root, capture_output=True, text=True, check=True)
+    path, growth = output.stdout.split()
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as file:
+            rows = sum(1 for _ in csv.reader(file)) - 1
+    finally:
+        os.remove(path)
+
+    assert rows == APPOINTMENTS
+    assert int(growth) < PEAK_MEMORY_GROWTH_LIMIT, f"RSS grew by {int(growth) / 1024 / 1024:.1f} MiB"
+
+
+def test_csv_escapes_formulas():
+    row = SimpleNamespace(appointment_date=date(2030, 1, 7), start_time=time(9), doctor_name="@Врач",
+                          user_data='=HYPERLINK("http://example.com")', telegram_id=1, is_primary=True,
+                          created_at=datetime(2030, 1, 1))
+    (fields,) = csv.reader(_csv_rows([row]).splitlines())
+
+    assert fields[2] == "'@Врач"
+    assert fields[3] == '\'=HYPERLINK("http://example.com")'
+
+
+def test_long_line_is_split_without_breaking_entities():
+    line = "a" * (MESSAGE_LIMIT - 3) + "&amp;" + "b" * MESSAGE_LIMIT
+    parts = _split_line(line, MESSAGE_LIMIT - 1)
+
+    assert "".join(parts) == line
+    assert all(len(part) <= MESSAGE_LIMIT - 1 for part in parts)
+    assert parts[1].startswith("&amp;")
@@ -0,0 +1,58 @@
+import csv
+from datetime import date, time
+
+import pytest
+from sqlalchemy import select
+
+from db import db
+from db.models.models import Appointment, Doctor, Timeslot, User
+from importer.importer import AppointmentImporter
+
+MONDAY = date(2024, 1, 1)
+
+
+async def _seed_schedule() -> None:
+    async with db.async_session() as session, session.begin():
+        session.add(Doctor(name="Врач"))
+        await session.flush()
+        session.add_all(Timeslot(weekday=0, start_time=time(hour), end_time=time(hour, 30), doctor_pk=1)
+                        for hour in (9, 10))
+        # Слот 9:00 первого понедельника уже занят другим пользователем
+        session.add(User(telegram_id=1))
+        await session.flush()
+        session.add(Appointment(appointment_date=MONDAY, user_data="", user_pk=1, timeslot_pk=1, doctor_pk=1))
+
+
+async def _import(path: str, method: str, chunk: int) -> list[tuple[int, date, str, bool]]:
+    await _seed_schedule()
+    stats = await AppointmentImporter(chunk, method).import_file(path)
+    assert (stats.inserted, stats.duplicates) == (3, 1)
+    async with db.async_session() as session:
+        result = await session.execute(
+            select(User.telegram_id, Appointment.appointment_date, Timeslot.start_time, Appointment.is_primary)
+            .join(User, User.id == Appointment.user_pk)
+            .join(Timeslot, Timeslot.id == Appointment.timeslot_pk)
+            .where(User.telegram_id != 1)
+            .order_by(Appointment.appointment_date, Timeslot.start_time)
+        )
+        return [tuple(row) for row in result.all()]
+
+
+@pytest.mark.parametrize("method", ["copy", "values"])
+@pytest.mark.parametrize("chunk", [1, 10])
+def test_primary_is_first_inserted_appointment(clean_db, tmp_path, method, chunk):
+    path = tmp_path / "appointments.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["telegram_id", "doctor_id", "date", "time", "user_data"])
+        # Первая строка пользователя 2 — дубль, первичным должен стать следующий прием
+        writer.writerow([2, 1, "2024-01-01", "09:00", "Петров"])
+        writer.writerow([2, 1, "2024-01-08", "09:00", "Петров"])
+        writer.writerow([2, 1, "2024-01-15", "09:00", "Петров"])
+        writer.writerow([3, 1, "2024-01-01", "10:00", "Сидоров"])
+
+    assert clean_db(_import(str(path), method, chunk)) == [
+        (3, date(2024, 1, 1), time(10), True),
+        (2, date(2024, 1, 8), time(9), True),
+        (2, date(2024, 1, 15), time(9), False),
+    ]
@@ -0,0 +1,121 @@
+"""Планы горячих запросов на БД с миллионом записей: ни один не должен читать appointment или user целиком."""
+import asyncio
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event, text
+
+from db import db
+
+APPOINTMENTS = 1_000_000
+USERS = 100_000
+DOCTORS = 20
+
+# Таблицы, полное чтение которых на горячем пути недопустимо
+LARGE_TABLES = {"appointment", "user"}
+
+SEED = [
+    # Засев дольше statement_timeout бота
+    "SET LOCAL statement_timeout = 0",
+    f"INSERT INTO \"user\" (telegram_id, is_admin) SELECT 1000000 + n, false FROM generate_series(1, {USERS}) n",
+    f"INSERT INTO doctor (name, is_active) SELECT 'Врач ' || n, true FROM generate_series(1, {DOCTORS}) n",
+    """INSERT INTO timeslot (weekday, start_time, end_time, doctor_pk)
+       SELECT w, make_time(h, 0, 0), make_time(h, 30, 0), d.id
+       FROM doctor d, generate_series(0, 4) w, generate_series(8, 17) h""",
+    # Около 5000 рабочих дней по 200 слотов: прошлые записи с отправленными напоминаниями и будущие без них
+    f"""INSERT INTO appointment (appointment_date, user_data, is_primary, user_pk, timeslot_pk, doctor_pk, reminder_sent_at)
+       SELECT d::date, 'seed', false, 1 + abs(hashtext(d::text || t.id)) % {USERS}, t.id, t.doctor_pk,
+              CASE WHEN d < current_date THEN now() END
+       FROM generate_series(current_date - 5600, current_date + 1400, interval '1 day') d
+       JOIN timeslot t ON t.weekday = extract(isodow FROM d) - 1
+       LIMIT {APPOINTMENTS}""",
+    "ANALYZE",
+]
+
+
+def _next_weekday(day: date, weekday: int) -> date:
+    return day + timedelta(days=(weekday - day.weekday()) % 7)
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    scans = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in LARGE_TABLES:
+        scans.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scans.extend(_seq_scans(child))
+    return scans
+
+
+async def _hot_queries() -> None:
+    today = date.today()
+    monday = _next_weekday(today, 0)
+    # За пределами засеянного периода: слоты свободны, запись и перенос проходят
+    free_day = _next_weekday(today + timedelta(days=1500), 1)
+
+    for cache in (db.timeslots_cache, db.booked_cache, db.days_off_cache, db.doctors_cache):
+        cache.clear()
+
+    user_pk = await db.upsert_user(1000001)
+    await db.is_admin(1000001)
+    await db.get_doctors()
+    timeslots = await db.get_available_timeslots(1, datetime.combine(monday, datetime.min.time()))
+    await db.get_month_availability(1, monday.replace(day=1), monday.replace(day=1) + timedelta(days=30))
+    await db.get_user_appointments_page(user_pk, 5)
+    await db.get_user_appointments_page(user_pk, 5, before=(today, 0))
+    await db.get_pending_reminders(datetime.now(), datetime.now() + timedelta(days=1), 0, 100)
+
+    timeslot = (await db.get_available_timeslots(1, datetime.combine(free_day, datetime.min.time())))[0]
+    booked = await db.book_appointment(user_pk, free_day, timeslot.id, "Плановый пациент")
+    await db.get_user_appointment(booked.id, user_pk)
+    await db.update_appointment(booked.id, user_pk, free_day + timedelta(days=7), timeslot.id)
+    await db.add_to_waitlist(user_pk, 1, monday)
+    await db.delete_appointment(booked.id, user_pk)
+    await db.offer_waitlist_slot(1, free_day, timeslot.id, timedelta(minutes=15))
+    assert timeslots == []
+
+
+@pytest.fixture(scope="module")
+def seeded(database):
+    from tests.conftest import _with_db
+
+    async def seed() -> None:
+        async with db.get_engine().begin() as connection:
+            tables = ", ".join(f'"{table}"' for table in ("waitlist", "appointment", "timeslot", "doctor", "day_off", "user"))
+            await connection.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+            for statement in SEED:
+                await connection.execute(text(statement))
+
+    asyncio.run(_with_db(seed()))
+
+
+def test_hot_queries_use_indexes(seeded, run):
+    async def collect_plans() -> list[tuple[str, list[str]]]:
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        engine = db.get_engine()
+        event.listen(engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            await _hot_queries()
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+        plans = []
+        async with engine.connect() as connection:
+            driver_connection = (await connection.get_raw_connection()).driver_connection
+            for statement, parameters in statements:
+                explained = await driver_connection.fetchval(f"EXPLAIN (FORMAT JSON) {statement}", *parameters)
+                # Движок регистрирует для json свой кодек, но на голом соединении придет строка
+                if isinstance(explained, str):
+                    explained = json.loads(explained)
+                plans.append((statement, _seq_scans(explained[0]["Plan"])))
+        return plans
+
+    plans = run(collect_plans())
+
+    assert len(plans) >= 15
+    full_scans = [f"{tables}: {statement}" for statement, tables in plans if tables]
+    assert not full_scans, "\n\n".join(full_scans)
@@ -0,0 +1,115 @@
+import asyncio
+from datetime import date, datetime, time, timedelta
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+from sqlalchemy import select
+
+from config.config import ReminderSettings
+from db import db
+from db.models.models import Appointment, Doctor, Timeslot, User
+from reminder import reminder
+from reminder.reminder import ReminderScheduler
+
+MONDAY = date(2030, 1, 7)
+NOW = datetime.combine(MONDAY, time(12))
+
+
+def test_pending_reminders_skip_past_and_far_appointments(clean_db):
+    async def scenario():
+        async with db.async_session() as session, session.begin():
+            doctor = Doctor(name="Врач")
+            session.add(doctor)
+            await session.flush()
+            slots = {(weekday, hour): Timeslot(weekday=weekday, start_time=time(hour), end_time=time(hour, 30),
+                                               doctor_pk=doctor.id)
+                     for weekday in (0, 1) for hour in (9, 15)}
+            session.add_all(slots.values())
+            await session.flush()
+
+        user_pk = await db.upsert_user(1000)
+        booked = {}
+        # Понедельник 9:00 уже прошел, 15:00 и вторник 9:00 — в ближайшие сутки, вторник 15:00 — позже
+        for (weekday, hour), slot in slots.items():
+            booked[(weekday, hour)] = (await db.book_appointment(user_pk, MONDAY + timedelta(days=weekday), slot.id, "user")).id
+
+        rows = await db.get_pending_reminders(NOW, NOW + timedelta(days=1), 0, 100)
+        return [row.id for row in rows], booked
+
+    pending, booked = clean_db(scenario())
+
+    assert pending == [booked[(0, 15)], booked[(1, 9)]]
+
+
+DELIVERED, RETRY_AFTER, BLOCKED, UNREACHABLE = 1000, 1001, 1002, 1003
+
+
+class StubBot:
+    """Записывает отправки; RETRY_AFTER один раз просит подождать, BLOCKED заблокировал бота, UNREACHABLE недоступен."""
+
+    def __init__(self):
+        self.calls: list[int] = []
+        self.unsent_at_send: list[bool] = []
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        self.calls.append(chat_id)
+        method = SendMessage(chat_id=chat_id, text=text)
+        if chat_id == RETRY_AFTER and self.calls.count(chat_id) == 1:
+            raise TelegramRetryAfter(method, "Too Many Requests", retry_after=7)
+        if chat_id == BLOCKED:
+            raise TelegramForbiddenError(method, "bot was blocked by the user")
+        if chat_id == UNREACHABLE:
+            raise TelegramNetworkError(method, "connection reset")
+        # Напоминание помечается отправленным только после успешной отправки
+        async with db.async_session() as session:
+            sent_at = await session.scalar(select(Appointment.reminder_sent_at).join(User)
+                                           .where(User.telegram_id == chat_id))
+        self.unsent_at_send.append(sent_at is None)
+
+
+def test_scheduler_delivers_retries_and_marks_only_final_results(clean_db, monkeypatch):
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay: float) -> None:
+        sleeps.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(reminder.asyncio, "sleep", fake_sleep)
+
+    async def scenario():
+        async with db.async_session() as session, session.begin():
+            doctor = Doctor(name="Врач")
+            session.add(doctor)
+            await session.flush()
+            slots = [Timeslot(weekday=MONDAY.weekday(), start_time=time(13 + n), end_time=time(13 + n, 30),
+                              doctor_pk=doctor.id) for n in range(4)]
+            session.add_all(slots)
+            await session.flush()
+        for telegram_id, slot in zip((DELIVERED, RETRY_AFTER, BLOCKED, UNREACHABLE), slots):
+            await db.book_appointment(await db.upsert_user(telegram_id), MONDAY, slot.id, "user")
+
+        bot = StubBot()
+        scheduler = ReminderScheduler(bot, ReminderSettings(enabled=True, lead_hours=24, scan_interval=60,
+                                                            batch_size=100, rate_limit=1000, max_retries=3))
+        first_scan = await scheduler.scan_once(NOW)
+        first_calls = list(bot.calls)
+        second_scan = await scheduler.scan_once(NOW)
+
+        async with db.async_session() as session:
+            marked = dict((await session.execute(
+                select(User.telegram_id, Appointment.reminder_sent_at.is_not(None)).join(User))).all())
+        return first_scan, first_calls, second_scan, bot, marked
+
+    first_scan, first_calls, second_scan, bot, marked = clean_db(scenario())
+
+    # Заблокировавший бота помечается, как и доставленные: повторять ему бесполезно
+    assert first_scan == 3
+    assert sorted(first_calls) == [DELIVERED, RETRY_AFTER, RETRY_AFTER, BLOCKED] + [UNREACHABLE] * 3
+    assert marked == {DELIVERED: True, RETRY_AFTER: True, BLOCKED: True, UNREACHABLE: False}
+    assert bot.unsent_at_send == [True, True]
+    # RetryAfter выдерживает паузу, которую назвал Telegram, прочие ошибки — экспоненциальную
+    assert sorted(sleeps) == sorted([7, 1, 2, 4] + [1, 2, 4])
+    # Второй проход повторяет только недоставленное
+    assert second_scan == 0
+    assert bot.calls[len(first_calls):] == [UNREACHABLE] * 3
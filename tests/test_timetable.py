@@ -0,0 +1,152 @@
+import asyncio
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import select
+
+from db import db
+from db.models.models import Doctor, Timeslot
+from timetable.timetable import ScheduleTemplate, add_days_off, apply_template
+
+MONDAY = date(2030, 1, 7)
+PAST_MONDAY = date(2018, 7, 9)
+
+
+async def _available(doctor_pk: int, day: date) -> list[Timeslot]:
+    return await db.get_available_timeslots(doctor_pk, datetime.combine(day, time()))
+
+
+async def _slots(doctor_pk: int) -> dict[time, bool]:
+    async with db.async_session() as session:
+        result = await session.execute(select(Timeslot.start_time, Timeslot.is_active)
+                                       .where(Timeslot.doctor_pk == doctor_pk, Timeslot.weekday == 0))
+        return dict(result.all())
+
+
+def test_apply_template_removes_slots_missing_from_it(clean_db):
+    async def scenario():
+        async with db.async_session() as session, session.begin():
+            doctor = Doctor(name="Врач")
+            session.add(doctor)
+            await session.flush()
+            doctor_pk = doctor.id
+
+        await apply_template(ScheduleTemplate(doctor_pk, [0, 1], time(9), time(13), slot_minutes=60))
+        by_start = {slot.start_time: slot.id for slot in await _available(doctor_pk, PAST_MONDAY)}
+        user_pk = await db.upsert_user(1000)
+        # 10:00 — запись в прошлом, 11:00 — предстоящая, 12:00 — без записей
+        await db.book_appointment(user_pk, PAST_MONDAY, by_start[time(10)], "past")
+        await db.book_appointment(user_pk, MONDAY, by_start[time(11)], "ahead")
+
+        result = await apply_template(ScheduleTemplate(doctor_pk, [0], time(9), time(10), slot_minutes=60))
+        db.clear_schedule_caches()
+        available = await _available(doctor_pk, MONDAY + timedelta(days=7))
+        tuesday = await _available(doctor_pk, MONDAY + timedelta(days=1))
+        return result, await _slots(doctor_pk), [slot.start_time for slot in available], len(tuesday)
+
+    result, slots, available, tuesday = clean_db(scenario())
+
+    assert (result.written, result.deleted, result.deactivated, result.booked_ahead) == (1, 1, 2, 1)
+    assert slots == {time(9): True, time(10): False, time(11): False}
+    assert available == [time(9)]
+    assert tuesday == 4
+
+
+
+def test_empty_template_removes_all_slots_of_its_weekdays(clean_db):
+    async def scenario():
+        async with db.async_session() as session, session.begin():
+            doctor = Doctor(name="Врач")
+            session.add(doctor)
+            await session.flush()
+            doctor_pk = doctor.id
+
+        await apply_template(ScheduleTemplate(doctor_pk, [0, 1], time(9), time(12), slot_minutes=60))
+        by_start = {slot.start_time: slot.id for slot in await _available(doctor_pk, MONDAY)}
+        await db.book_appointment(await db.upsert_user(1000), MONDAY, by_start[time(10)], "ahead")
+
+        # Прием не помещается в рабочее время: по понедельникам врач больше не принимает
+        result = await apply_template(ScheduleTemplate(doctor_pk, [0], time(9), time(9), slot_minutes=60))
+        db.clear_schedule_caches()
+        tuesday = await _available(doctor_pk, MONDAY + timedelta(days=1))
+        return result, await _slots(doctor_pk), len(tuesday)
+
+    result, slots, tuesday = clean_db(scenario())
+
+    assert (result.written, result.deleted, result.deactivated, result.booked_ahead) == (0, 2, 1, 1)
+    assert slots == {time(10): False}
+    assert tuesday == 3
+
+def test_schedule_change_notification_clears_caches(clean_db):
+    async def scenario():
+        listener = asyncio.create_task(db.listen_schedule_changes())
+        try:
+            await asyncio.sleep(0.5)
+            db.timeslots_cache.set((1, 0), [])
+            async with db.async_session() as session, session.begin():
+                await db.notify_schedule_changed(session)
+            for _ in range(50):
+                if db.timeslots_cache.get((1, 0)) is None:
+                    return True
+                await asyncio.sleep(0.1)
+            return False
+        finally:
+            listener.cancel()
+
+    assert clean_db(scenario())
+
+
+def test_days_off_of_one_doctor_and_whole_clinic(clean_db):
+    async def scenario():
+        doctor_pks = []
+        for name in ("Врач 1", "Врач 2"):
+            async with db.async_session() as session, session.begin():
+                doctor = Doctor(name=name)
+                session.add(doctor)
+                await session.flush()
+                doctor_pks.append(doctor.id)
+            await apply_template(ScheduleTemplate(doctor.id, [0, 1], time(9), time(11), slot_minutes=60))
+
+        await add_days_off(MONDAY, MONDAY, "Отпуск", doctor_pk=doctor_pks[0])
+        await add_days_off(MONDAY + timedelta(days=1), MONDAY + timedelta(days=1), "Праздник")
+        db.clear_schedule_caches()
+
+        slots = [[len(await _available(doctor_pk, day)) for day in (MONDAY, MONDAY + timedelta(days=1))]
+                 for doctor_pk in doctor_pks]
+        month = [await db.get_month_availability(doctor_pk, MONDAY, MONDAY + timedelta(days=1))
+                 for doctor_pk in doctor_pks]
+        return slots, month
+
+    slots, month = clean_db(scenario())
+
+    assert slots == [[0, 0], [2, 0]]
+    assert month == [{}, {MONDAY: 2}]
+
+
+def test_month_availability_matches_day_view_filters(clean_db):
+    today = date.today()
+    next_week = today + timedelta(days=7)
+
+    async def scenario():
+        async with db.async_session() as session, session.begin():
+            doctor = Doctor(name="Врач")
+            session.add(doctor)
+            await session.flush()
+            session.add_all(Timeslot(weekday=today.weekday(), start_time=time(hour), end_time=time(hour, 30),
+                                     doctor_pk=doctor.id) for hour in range(24))
+        # Слот через неделю закреплен за подписчиком листа ожидания
+        await db.add_to_waitlist(await db.upsert_user(1000), doctor.id, next_week)
+        held = await db.offer_waitlist_slot(doctor.id, next_week, (await _available(doctor.id, next_week))[0].id,
+                                            timedelta(minutes=15))
+
+        started = datetime.now()
+        month = await db.get_month_availability(doctor.id, today, next_week)
+        finished = datetime.now()
+        bookable_today = {sum(datetime.combine(today, time(hour)) > now + db.BOOKING_LEAD for hour in range(24))
+                          for now in (started, finished)}
+        return month, bookable_today, held
+
+    month, bookable_today, held = clean_db(scenario())
+
+    assert held is not None
+    assert month[today] in bookable_today
+    assert month[next_week] == 23
@@ -0,0 +1,100 @@
+from datetime import date, time, timedelta
+
+from sqlalchemy import func, select, update
+
+from config.config import WaitlistSettings
+from db import db
+from db.models.models import Doctor, Timeslot, WaitlistEntry
+from waitlist.waitlist import WaitlistNotifier
+
+HOLD = timedelta(minutes=15)
+
+
+async def _seed_slot(day: date) -> tuple[int, int]:
+    async with db.async_session() as session, session.begin():
+        doctor = Doctor(name="Врач")
+        session.add(doctor)
+        await session.flush()
+        timeslot = Timeslot(weekday=day.weekday(), start_time=time(9), end_time=time(9, 30), doctor_pk=doctor.id)
+        session.add(timeslot)
+        await session.flush()
+        return doctor.id, timeslot.id
+
+
+async def _pass_hold(waitlist_pk: int) -> None:
+    async with db.async_session() as session, session.begin():
+        await session.execute(update(WaitlistEntry).where(WaitlistEntry.id == waitlist_pk)
+                              .values(offer_expires_at=func.now() - timedelta(seconds=1)))
+
+
+def test_expired_offer_goes_to_next_subscriber_and_then_frees_slot(clean_db):
+    day = date.today() + timedelta(days=7)
+
+    async def scenario():
+        doctor_pk, timeslot_pk = await _seed_slot(day)
+        first, second, other = [await db.upsert_user(1000 + n) for n in range(3)]
+        await db.add_to_waitlist(first, doctor_pk, day)
+        await db.add_to_waitlist(second, doctor_pk, day)
+
+        offers = []
+        offer = await db.offer_waitlist_slot(doctor_pk, day, timeslot_pk, HOLD)
+        while offer is not None:
+            offers.append(offer.user_pk)
+            assert await db.book_appointment(other, day, timeslot_pk, "other") is None
+            await _pass_hold(offer.id)
+            await db.expire_waitlist_offer(offer.id)
+            offer = await db.offer_waitlist_slot(doctor_pk, day, timeslot_pk, HOLD)
+
+        booked = await db.book_appointment(other, day, timeslot_pk, "other")
+        return offers, [first, second], booked
+
+    offers, subscribers, booked = clean_db(scenario())
+
+    assert offers == subscribers
+    assert booked is not None
+
+
+def test_no_offer_for_past_date(clean_db):
+    day = date.today() - timedelta(days=7)
+
+    async def scenario():
+        doctor_pk, timeslot_pk = await _seed_slot(day)
+        await db.add_to_waitlist(await db.upsert_user(1000), doctor_pk, day)
+        return await db.offer_waitlist_slot(doctor_pk, day, timeslot_pk, HOLD)
+
+    assert clean_db(scenario()) is None
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent: list[int] = []
+
+    async def send_message(self, chat_id: int, **kwargs) -> None:
+        self.sent.append(chat_id)
+
+
+def test_sweep_expires_stale_offer_and_offers_slot_to_next(clean_db):
+    day = date.today() + timedelta(days=7)
+
+    async def scenario():
+        doctor_pk, timeslot_pk = await _seed_slot(day)
+        first, second = [await db.upsert_user(1000 + n) for n in range(2)]
+        await db.add_to_waitlist(first, doctor_pk, day)
+        await db.add_to_waitlist(second, doctor_pk, day)
+        # Предложение сделал процесс, который уже перезапустился: о нем знает только БД
+        offer = await db.offer_waitlist_slot(doctor_pk, day, timeslot_pk, HOLD)
+        await _pass_hold(offer.id)
+
+        bot = RecordingBot()
+        expired = await WaitlistNotifier(bot, WaitlistSettings(hold_minutes=15, sweep_interval=30)).sweep_once()
+        async with db.async_session() as session:
+            entries = (await session.execute(
+                select(WaitlistEntry.user_pk, WaitlistEntry.offer_timeslot_pk, WaitlistEntry.offer_expires_at > func.now())
+            )).all()
+        return expired, bot.sent, entries, second, timeslot_pk
+
+    expired, sent, entries, second, timeslot_pk = clean_db(scenario())
+
+    assert expired == 1
+    assert sent == [1001]
+    assert [tuple(entry) for entry in entries] == [(second, timeslot_pk, True)]
@@ -0,0 +1,187 @@
+"""Шаблоны расписания: массовая генерация слотов и нерабочих дней.
+
+Пример:
+    python -m timetable.timetable doctor "Петров П.П." --specialty "Невролог"
+    python -m timetable.timetable slots --doctor 2 --weekdays 0-4 --start 10:00 --end 18:00 --slot 60 --break 13:00-14:00
+    python -m timetable.timetable dayoff 2026-12-31 --to 2027-01-08 --reason "Новогодние праздники"
+    python -m timetable.timetable dayoff 2027-07-01 --to 2027-07-14 --doctor 2 --reason "Отпуск"
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import List
+
+from sqlalchemy import delete, exists, func, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+
+from db.db import async_session, notify_schedule_changed
+from db.models.models import Appointment, Timeslot, DayOff, Doctor
+
+
+@dataclass
+class ScheduleTemplate:
+    doctor_pk: int
+    weekdays: List[int]
+    work_start: time
+    work_end: time
+    slot_minutes: int
+    breaks: List[tuple[time, time]] = field(default_factory=list)
+
+
+def generate_timeslots(template: ScheduleTemplate) -> List[dict]:
+    """Слоты для каждого дня недели шаблона; слоты, пересекающиеся с перерывами, пропускаются."""
+    slot_length = timedelta(minutes=template.slot_minutes)
+    day = date.min
+    rows = []
+    slot_start = datetime.combine(day, template.work_start)
+    work_end = datetime.combine(day, template.work_end)
+    breaks = [(datetime.combine(day, start), datetime.combine(day, end)) for start, end in template.breaks]
+
+    day_slots = []
+    while slot_start + slot_length <= work_end:
+        slot_end = slot_start + slot_length
+        if not any(slot_start < break_end and break_start < slot_end for break_start, break_end in breaks):
+            day_slots.append((slot_start.time(), slot_end.time()))
+        slot_start = slot_end
+
+    for weekday in template.weekdays:
+        rows.extend({"doctor_pk": template.doctor_pk, "weekday": weekday, "start_time": start, "end_time": end}
+                    for start, end in day_slots)
+    return rows
+
+
+@dataclass
+class TemplateResult:
+    written: int
+    # Слоты дней недели шаблона, которых в нем больше нет
+    deleted: int = 0
+    deactivated: int = 0
+    # Из них с предстоящими записями: записи остаются в силе, новых на эти слоты не будет
+    booked_ahead: int = 0
+
+
+async def apply_template(template: ScheduleTemplate) -> TemplateResult:
+    """Приводит слоты врача в днях недели шаблона к шаблону.
+
+    Слоты шаблона добавляются одним INSERT, у существующих обновляется время окончания, и они снова
+    активны. Слоты этих дней недели, которых нет в шаблоне, удаляются, если на них никогда не записывались,
+    иначе выключаются: записи, в том числе предстоящие, остаются, но новых на эти слоты не будет.
+    Другие дни недели не затрагиваются. Пустой шаблон (прием не помещается в рабочее время) убирает
+    все слоты своих дней недели.
+    """
+    rows = generate_timeslots(template)
+    removed = [
+        Timeslot.doctor_pk == template.doctor_pk,
+        Timeslot.weekday.in_(template.weekdays),
+        Timeslot.is_active.is_(True),
+    ]
+    if rows:
+        removed.append(
+            tuple_(Timeslot.weekday, Timeslot.start_time).not_in([(row["weekday"], row["start_time"]) for row in rows]))
+    booked = exists().where(Appointment.timeslot_pk == Timeslot.id)
+    booked_ahead = exists().where(Appointment.timeslot_pk == Timeslot.id, Appointment.appointment_date >= func.current_date())
+
+    async with async_session() as session, session.begin():
+        if rows:
+            stmt = insert(Timeslot).values(rows)
+            await session.execute(
+                stmt.on_conflict_do_update(constraint="uq_timeslot_doctor_weekday_start",
+                                           set_={"end_time": stmt.excluded.end_time, "is_active": True})
+            )
+        deleted = await session.execute(delete(Timeslot).where(*removed, ~booked).returning(Timeslot.id))
+        deactivated = (await session.execute(
+            update(Timeslot).where(*removed).values(is_active=False).returning(booked_ahead)
+        )).scalars().all()
+        result = TemplateResult(written=len(rows), deleted=len(deleted.all()), deactivated=len(deactivated),
+                                booked_ahead=sum(deactivated))
+        await notify_schedule_changed(session)
+    return result
+
+
+async def add_doctor(name: str, specialty: str | None = None) -> int:
+    async with async_session() as session, session.begin():
+        result = await session.execute(
+            insert(Doctor).values(name=name, specialty=specialty, is_active=True).returning(Doctor.id)
+        )
+        doctor_pk = result.scalar_one()
+        await notify_schedule_changed(session)
+    return doctor_pk
+
+
+async def add_days_off(first_day: date, last_day: date, reason: str | None = None, doctor_pk: int | None = None) -> int:
+    """Нерабочие дни всей клиники или, с doctor_pk, одного врача; уже добавленные пропускаются."""
+    days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+    async with async_session() as session, session.begin():
+        # Без цели конфликта: дни клиники и дни врачей уникальны по разным частичным индексам
+        await session.execute(
+            insert(DayOff)
+            .values([{"day": day, "reason": reason, "doctor_pk": doctor_pk} for day in days])
+            .on_conflict_do_nothing()
+        )
+        await notify_schedule_changed(session)
+    return len(days)
+
+
+def _parse_time(value: str) -> time:
+    return datetime.strptime(value, "%H:%M").time()
+
+
+def _parse_weekdays(value: str) -> List[int]:
+    weekdays = []
+    for part in value.split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            weekdays.extend(range(int(start), int(end) + 1))
+        else:
+            weekdays.append(int(part))
+    return weekdays
+
+
+def _parse_break(value: str) -> tuple[time, time]:
+    start, end = value.split("-")
+    return _parse_time(start), _parse_time(end)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Управление расписанием приема")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    doctor = commands.add_parser("doctor", help="Добавить врача")
+    doctor.add_argument("name")
+    doctor.add_argument("--specialty")
+
+    slots = commands.add_parser("slots", help="Сгенерировать слоты по шаблону")
+    slots.add_argument("--doctor", type=int, required=True, help="id врача")
+    slots.add_argument("--weekdays", type=_parse_weekdays, required=True, help="Дни недели, 0 = Пн: 0-4 или 0,2,4")
+    slots.add_argument("--start", type=_parse_time, required=True, help="Начало приема, ЧЧ:ММ")
+    slots.add_argument("--end", type=_parse_time, required=True, help="Конец приема, ЧЧ:ММ")
+    slots.add_argument("--slot", type=int, required=True, help="Длительность слота в минутах")
+    slots.add_argument("--break", dest="breaks", type=_parse_break, action="append", default=[],
+                       help="Перерыв ЧЧ:ММ-ЧЧ:ММ, можно указать несколько раз")
+
+    day_off = commands.add_parser("dayoff", help="Добавить нерабочие дни")
+    day_off.add_argument("day", type=date.fromisoformat, help="Дата, ГГГГ-ММ-ДД")
+    day_off.add_argument("--to", type=date.fromisoformat, help="Последний нерабочий день периода")
+    day_off.add_argument("--reason")
+    day_off.add_argument("--doctor", type=int, help="id врача; без него день нерабочий для всей клиники")
+
+    args = parser.parse_args()
+
+    if args.command == "doctor":
+        doctor_pk = asyncio.run(add_doctor(args.name, args.specialty))
+        print(f"Врач добавлен, id: {doctor_pk}")
+    elif args.command == "slots":
+        template = ScheduleTemplate(doctor_pk=args.doctor, weekdays=args.weekdays, work_start=args.start,
+                                    work_end=args.end, slot_minutes=args.slot, breaks=args.breaks)
+        result = asyncio.run(apply_template(template))
+        print(f"Слотов записано: {result.written}, удалено: {result.deleted}, выключено: {result.deactivated}")
+        if result.booked_ahead:
+            print(f"На выключенные слоты есть предстоящие записи: {result.booked_ahead}, их стоит перенести")
+    else:
+        count = asyncio.run(add_days_off(args.day, args.to or args.day, args.reason, args.doctor))
+        print(f"Нерабочих дней добавлено: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from datetime import date, timedelta
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from callbacks.callbacks import Action, encode
+from config.config import WaitlistSettings
+from db.db import (expire_waitlist_offer, get_expired_waitlist_offers, get_timeslot_by_id, offer_waitlist_slot,
+                   remove_from_waitlist)
+from lexicon.lexicon import LEXICON
+
+
+logger = logging.getLogger(__name__)
+
+
+class WaitlistNotifier:
+    """Предлагает освободившиеся слоты подписчикам листа ожидания.
+
+    Вызывается из slot_freed_hooks при отмене или переносе записи; рассылка идет в фоне, чтобы
+    обработчик не ждал Telegram. Слот закрепляется за первым в очереди на hold_minutes. Истекшие
+    предложения раз в sweep_interval секунд ищутся в БД (run), поэтому переживают перезапуск и
+    снимаются любым процессом: подписка удаляется, слот предлагается следующему. Когда предлагать
+    некому или дата прошла, слот остается свободным для всех.
+    """
+
+    def __init__(self, bot: Bot, waitlist_settings: WaitlistSettings):
+        self.bot = bot
+        self.hold = timedelta(minutes=waitlist_settings.hold_minutes)
+        self.sweep_interval = waitlist_settings.sweep_interval
+        self._offer_tasks: set[asyncio.Task] = set()
+
+    async def run(self) -> None:
+        logger.info("Waitlist sweep started")
+        while True:
+            try:
+                expired = await self.sweep_once()
+                if expired:
+                    logger.info("Expired %d waitlist offers", expired)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Waitlist sweep failed")
+            await asyncio.sleep(self.sweep_interval)
+
+    async def sweep_once(self) -> int:
+        """Снимает истекшие предложения и предлагает их слоты следующим в очереди."""
+        expired = 0
+        for waitlist_pk in await get_expired_waitlist_offers():
+            offer = await expire_waitlist_offer(waitlist_pk)
+            if offer is None:
+                continue
+            expired += 1
+            await self.offer_slot(offer.doctor_pk, offer.wait_date, offer.offer_timeslot_pk)
+        return expired
+
+    async def on_slot_freed(self, doctor_pk: int, appointment_date: date, timeslot_pk: int) -> None:
+        task = asyncio.create_task(self._offer_in_background(doctor_pk, appointment_date, timeslot_pk))
+        self._offer_tasks.add(task)
+        task.add_done_callback(self._offer_tasks.discard)
+
+    async def _offer_in_background(self, doctor_pk: int, appointment_date: date, timeslot_pk: int) -> None:
+        try:
+            await self.offer_slot(doctor_pk, appointment_date, timeslot_pk)
+        except Exception:
+            logger.exception("Failed to offer slot %s on %s", timeslot_pk, appointment_date)
+
+    async def offer_slot(self, doctor_pk: int, appointment_date: date, timeslot_pk: int) -> None:
+        while True:
+            offer = await offer_waitlist_slot(doctor_pk, appointment_date, timeslot_pk, self.hold)
+            if offer is None:
+                return
+
+            if await self._send_offer(offer.telegram_id, appointment_date, timeslot_pk):
+                break
+            # Подписчик недоступен — убираем его из очереди и предлагаем слот следующему
+            await remove_from_waitlist(offer.id)
+
+        logger.info("Slot %s on %s offered to waitlist entry %s", timeslot_pk, appointment_date, offer.id)
+
+    async def _send_offer(self, telegram_id: int, appointment_date: date, timeslot_pk: int) -> bool:
+        timeslot = await get_timeslot_by_id(timeslot_pk)
+        date_str = appointment_date.strftime("%d-%m-%Y")
+        text = LEXICON["waitlist_offer"].format(appointment_date=date_str, timeslot=str(timeslot),
+                                                hold_minutes=int(self.hold.total_seconds() // 60))
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="Записаться", callback_data=encode(Action.WAITLIST_BOOK, timeslot_pk, appointment_date))]
+        ])
+        try:
+            await self.bot.send_message(chat_id=telegram_id, text=text, reply_markup=kb)
+            return True
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            logger.info("Waitlist offer to %s dropped: %s", telegram_id, e)
+            return False
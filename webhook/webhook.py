@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config.config import WebhookSettings
+
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """Сразу отвечает Telegram, а апдейты обрабатывает в фоне.
+
+    Одновременно выполняется не больше max_concurrency хендлеров, остальные ждут своей очереди.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrency: int, **kwargs: Any) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self._semaphore:
+            await super()._background_feed_update(bot, update)
+
+
+def create_webhook_app(bot: Bot, dp: Dispatcher, webhook_settings: WebhookSettings) -> web.Application:
+    app = web.Application()
+    BoundedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        max_concurrency=webhook_settings.max_concurrency,
+        secret_token=webhook_settings.secret or None,
+    ).register(app, path=webhook_settings.path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def set_webhook(bot: Bot, dp: Dispatcher, webhook_settings: WebhookSettings) -> None:
+    await bot.set_webhook(
+        url=webhook_settings.base_url + webhook_settings.path,
+        secret_token=webhook_settings.secret or None,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=True,
+    )
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, webhook_settings: WebhookSettings) -> None:
+    runner = web.AppRunner(create_webhook_app(bot, dp, webhook_settings))
+    await runner.setup()
+    site = web.TCPSite(runner, host=webhook_settings.host, port=webhook_settings.port)
+    await site.start()
+    logger.info("Webhook server started on %s:%s", webhook_settings.host, webhook_settings.port)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
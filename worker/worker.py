@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+from typing import Any, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from redis.asyncio import Redis
+
+from config.config import get_settings
+from db.db import close_db, init_db, slot_freed_hooks
+from degraded.degraded import DegradedMode
+from logs.logs import setup_logging
+from metrics.metrics import run_metrics
+from waitlist.waitlist import WaitlistNotifier
+
+
+logger = logging.getLogger(__name__)
+
+DispatcherFactory = Callable[[], Dispatcher]
+
+# Как часто проверяется, живы ли воркеры, секунд
+WORKER_CHECK_INTERVAL = 5
+
+
+def shard_for(update: Update, shards: int) -> int:
+    """Номер очереди для апдейта.
+
+    Апдейты одного пользователя всегда попадают в одну очередь, поэтому
+    переходы его FSM обрабатываются одним воркером в порядке поступления.
+    """
+    try:
+        user = getattr(update.event, "from_user", None)
+    except Exception:
+        user = None
+    key = user.id if user is not None else update.update_id
+    return key % shards
+
+
+def queue_key(shard: int) -> str:
+    return f"{get_settings().workers.queue_name}:{shard}"
+
+
+async def produce_updates(bot: Bot, dp: Dispatcher) -> None:
+    """Получает апдейты long polling'ом и раскладывает их по очередям воркеров."""
+    settings = get_settings()
+    redis = Redis.from_url(settings.storage.redis_url)
+    allowed_updates = dp.resolve_used_update_types()
+    offset = None
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+            except Exception as e:
+                logger.warning("Failed to fetch updates: %s", e)
+                await asyncio.sleep(1)
+                continue
+
+            if not updates:
+                continue
+
+            pipe = redis.pipeline(transaction=False)
+            for update in updates:
+                pipe.lpush(
+                    queue_key(shard_for(update, settings.workers.count)),
+                    update.model_dump_json(by_alias=True, exclude_none=True),
+                )
+            await pipe.execute()
+            offset = updates[-1].update_id + 1
+    finally:
+        await redis.aclose()
+
+
+async def consume_updates(shard: int, dp_factory: DispatcherFactory) -> None:
+    settings = get_settings()
+    # Свой движок в каждом процессе: соединения пула нельзя делить между процессами
+    init_db(settings.db, instrument=settings.metrics.enabled)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(settings.bot.api_url)) if settings.bot.api_url else None
+    bot = Bot(token=settings.bot.token, parse_mode="HTML", session=session)
+    dp = dp_factory()
+    # Отмены обрабатываются в воркерах, поэтому освободившиеся слоты предлагает тоже воркер
+    slot_freed_hooks.append(WaitlistNotifier(bot, settings.waitlist).on_slot_freed)
+    redis = Redis.from_url(settings.storage.redis_url)
+    # Не больше max_concurrency апдейтов в обработке: остальные ждут в очереди Redis, а не в памяти воркера
+    semaphore = asyncio.Semaphore(settings.workers.max_concurrency)
+    tasks: set[asyncio.Task] = set()
+
+    async def process(raw: dict[str, Any]) -> None:
+        # Апдейты одного пользователя упорядочивает UserLockMiddleware, разных — обрабатываются параллельно
+        try:
+            await dp.feed_raw_update(bot, raw)
+        finally:
+            semaphore.release()
+
+    background_tasks = []
+    if settings.degraded.enabled:
+        # Копия расписания и журнал записей у каждого воркера свои
+        degraded_mode = DegradedMode(bot, settings.degraded, f"{settings.degraded.journal_path}.{shard}")
+        background_tasks.append(asyncio.create_task(degraded_mode.run()))
+    if settings.metrics.enabled:
+        # У каждого воркера свои метрики: порт основного процесса + 1 + номер воркера
+        background_tasks.append(asyncio.create_task(
+            run_metrics(settings.metrics.host, settings.metrics.port + 1 + shard, settings.metrics.log_interval)))
+
+    # Как при start_polling: startup-хендлеры (например, загрузка списка админов) выполняются в каждом воркере
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+    logger.info("Worker %s started", shard)
+    try:
+        while True:
+            await semaphore.acquire()
+            try:
+                _, raw = await redis.brpop(queue_key(shard))
+            except BaseException:
+                semaphore.release()
+                raise
+            task = asyncio.create_task(process(json.loads(raw)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        await redis.aclose()
+        await bot.session.close()
+        await close_db()
+
+
+def run_worker(shard: int, dp_factory: DispatcherFactory) -> None:
+    log_listener = setup_logging(get_settings().log)
+    try:
+        asyncio.run(consume_updates(shard, dp_factory))
+    finally:
+        log_listener.stop()
+
+
+def start_worker(shard: int, dp_factory: DispatcherFactory) -> multiprocessing.Process:
+    # spawn, а не fork: воркер не наследует потоки, хуки и соединения родителя, в том числе при перезапуске
+    process = multiprocessing.get_context("spawn").Process(
+        target=run_worker, args=(shard, dp_factory), name=f"worker-{shard}", daemon=True)
+    process.start()
+    return process
+
+
+def start_workers(dp_factory: DispatcherFactory) -> list[multiprocessing.Process]:
+    return [start_worker(shard, dp_factory) for shard in range(get_settings().workers.count)]
+
+
+async def supervise_workers(processes: list[multiprocessing.Process], dp_factory: DispatcherFactory) -> None:
+    """Перезапускает упавшие воркеры: иначе апдейты их очереди копились бы в Redis без обработки."""
+    while True:
+        await asyncio.sleep(WORKER_CHECK_INTERVAL)
+        for shard, process in enumerate(processes):
+            if not process.is_alive():
+                logger.error("Worker %s exited with code %s, restarting", shard, process.exitcode)
+                process.close()
+                processes[shard] = start_worker(shard, dp_factory)